@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""Measure what AuthApiClient call logging costs a sign in.
+
+Times the logging done for a sign in payload three ways: the five eager
+str.format lines AuthApiClient used to run on every call, the lazy
+_log_call with DEBUG off (production) and with DEBUG on.
+
+    python benchmarks/call_logging.py [number_of_calls]
+"""
+import json
+import logging
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault(
+    'DJANGO_SETTINGS_MODULE',
+    'kagiso_auth.tests.settings.test'
+)
+
+import django  # noqa: E402
+
+django.setup()
+
+from kagiso_auth.auth_api_client import AuthApiClient  # noqa: E402
+
+
+logger = logging.getLogger('django')
+
+METHOD = 'POST'
+ENDPOINT = 'sessions'
+URL = 'https://auth.kagiso.io/sessions/.json'
+HEADERS = {'AUTHORIZATION': 'Token xyz'}
+PAYLOAD = {
+    'email': 'test@email.com',
+    'password': 'secret',
+    'strategy': 'email',
+    'last_sign_in_via': 'jacarandafm',
+}
+
+
+def eager_logging():
+    logger.debug('method={0}'.format(METHOD))
+    logger.debug('url={0}'.format(URL))
+    logger.debug('headers={0}'.format(HEADERS))
+    logger.debug('payload={0}'.format(PAYLOAD))
+    logger.debug('json={0}'.format(json.dumps(PAYLOAD)))
+
+
+def lazy_logging():
+    AuthApiClient._log_call(
+        METHOD, ENDPOINT, 200, time.monotonic(), PAYLOAD, attempts=1)
+
+
+def no_logging():
+    pass
+
+
+def report(name, func, number_of_calls):
+    best = min(timeit.repeat(func, number=number_of_calls, repeat=5))
+    print(  # noqa: T001
+        '{name:<14} {per_call:.3f}us per call'.format(
+            name=name,
+            per_call=best / number_of_calls * 1e6,
+        )
+    )
+
+
+def main():
+    number_of_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    # What production runs with
+    logger.setLevel(logging.INFO)
+    report('baseline', no_logging, number_of_calls)
+    report('eager (off)', eager_logging, number_of_calls)
+    report('lazy (off)', lazy_logging, number_of_calls)
+
+    # Keep the records but don't print them
+    logger.setLevel(logging.DEBUG)
+    logger.handlers = [logging.NullHandler()]
+    logger.propagate = False
+    report('eager (on)', eager_logging, number_of_calls)
+    report('lazy (on)', lazy_logging, number_of_calls)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""Compare dateutil and parse_datetime on Auth API user payloads.
+
+Times parsing `created` and `modified` for every payload, then the whole
+of KagisoUser.build_from_auth_api_data, which a bulk sync runs once per
+user.
+
+    python benchmarks/parse_datetime.py [number_of_payloads]
+"""
+import os
+import sys
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault(
+    'DJANGO_SETTINGS_MODULE',
+    'kagiso_auth.tests.settings.test'
+)
+
+from dateutil import parser  # noqa: E402
+import django  # noqa: E402
+
+django.setup()
+
+from kagiso_auth.models import KagisoUser  # noqa: E402
+from kagiso_auth.utils import parse_datetime  # noqa: E402
+
+
+def make_payloads(number_of_payloads):
+    return [
+        {
+            'id': i,
+            'email': '{0}@email.com'.format(i),
+            'first_name': 'Fred',
+            'last_name': 'Smith',
+            'profile': {'region': 'GAUTENG'},
+            'created': '2015-04-21T08:18:30.{0:06d}Z'.format(i % 1000000),
+            'modified': '2016-01-12T08:17:{0:02d}.374410Z'.format(i % 60),
+        }
+        for i in range(number_of_payloads)
+    ]
+
+
+def time_parse(parse, payloads):
+    start = time.perf_counter()
+    for payload in payloads:
+        parse(payload['created'])
+        parse(payload['modified'])
+    return time.perf_counter() - start
+
+
+def time_build(payloads):
+    start = time.perf_counter()
+    for payload in payloads:
+        KagisoUser().build_from_auth_api_data(payload)
+    return time.perf_counter() - start
+
+
+def report(name, seconds, number_of_payloads):
+    print(  # noqa: T001
+        '{name:<24} {seconds:.2f}s ({rate:,.0f} payloads/s)'.format(
+            name=name,
+            seconds=seconds,
+            rate=number_of_payloads / seconds,
+        )
+    )
+
+
+def main():
+    number_of_payloads = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    payloads = make_payloads(number_of_payloads)
+
+    report('dateutil', time_parse(parser.parse, payloads), len(payloads))
+    report(
+        'parse_datetime',
+        time_parse(parse_datetime, payloads),
+        len(payloads)
+    )
+
+    with patch('kagiso_auth.models.parse_datetime', parser.parse):
+        report('build (dateutil)', time_build(payloads), len(payloads))
+    report('build (parse_datetime)', time_build(payloads), len(payloads))
+
+
+if __name__ == '__main__':
+    main()
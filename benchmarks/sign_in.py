@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""Load test sign up and sign in end to end against the fake Auth API.
+
+Runs KagisoUser.objects.create_user and KagisoBackend.authenticate from a
+pool of threads, through the real AuthApiClient and a test database, and
+reports throughput and latency. The fake Auth API adds `latency` seconds
+to every call and fails `error_rate` of them.
+
+    python benchmarks/sign_in.py [users] [threads] [latency] [error_rate]
+"""
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault(
+    'DJANGO_SETTINGS_MODULE',
+    'kagiso_auth.tests.settings.test'
+)
+
+import django  # noqa: E402
+from django.db import connection, connections  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+django.setup()
+# The test settings log every call at DEBUG, which would swamp the timings
+logging.getLogger('django').setLevel(logging.WARNING)
+
+from kagiso_auth.auth_api_client import AuthApiClient  # noqa: E402
+from kagiso_auth.backends import KagisoBackend  # noqa: E402
+from kagiso_auth.models import KagisoUser  # noqa: E402
+from kagiso_auth.tests.fake_auth_api import FakeAuthApi  # noqa: E402
+
+
+def timed(func):
+    def run(i):
+        start = time.perf_counter()
+        try:
+            func(i)
+            failed = False
+        except Exception:
+            failed = True
+        finally:
+            # Each worker thread holds its own database connection
+            connections.close_all()
+        return (time.perf_counter() - start) * 1000, failed
+
+    return run
+
+
+def sign_up(i):
+    KagisoUser.objects.create_user(
+        'user{0}@email.com'.format(i), 'password')
+
+
+def sign_in(i):
+    user = KagisoBackend().authenticate(
+        email='user{0}@email.com'.format(i), password='password')
+    assert user
+
+
+def run(name, func, number_of_users, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(timed(func), range(number_of_users)))
+    elapsed = time.perf_counter() - start
+
+    timings = sorted(timing for timing, _ in results)
+    failures = sum(failed for _, failed in results)
+    p99 = timings[max(int(len(timings) * 0.99) - 1, 0)]
+    print(  # noqa: T001
+        '{name:<8} {rate:.0f}/s p50={p50:.1f}ms p99={p99:.1f}ms '
+        'failed={failures}'.format(
+            name=name,
+            rate=number_of_users / elapsed,
+            p50=statistics.median(timings),
+            p99=p99,
+            failures=failures,
+        )
+    )
+
+
+def main():
+    args = sys.argv[1:]
+    number_of_users = int(args[0]) if len(args) > 0 else 500
+    threads = int(args[1]) if len(args) > 1 else 10
+    latency = float(args[2]) if len(args) > 2 else 0.02
+    error_rate = float(args[3]) if len(args) > 3 else 0
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+
+    try:
+        with FakeAuthApi(latency=latency, error_rate=error_rate) as api:
+            AuthApiClient.BASE_URL = api.base_url
+
+            run('sign_up', sign_up, number_of_users, threads)
+            # New users have to confirm their email before signing in
+            api.confirm_emails()
+            run('sign_in', sign_in, number_of_users, threads)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""Compare cold and pooled AuthApiClient.call latency.
+
+Starts the fake Auth API on localhost and times sequential calls, first
+opening a new connection per call (the old module-level requests.request
+behaviour) and then through the pooled SessionTransport.
+
+    python benchmarks/transport.py [number_of_calls]
+"""
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault(
+    'DJANGO_SETTINGS_MODULE',
+    'kagiso_auth.tests.settings.test'
+)
+
+import django  # noqa: E402
+import requests  # noqa: E402
+
+django.setup()
+# The test settings log every call at DEBUG, which would swamp the timings
+logging.getLogger('django').setLevel(logging.WARNING)
+
+from kagiso_auth.auth_api_client import AuthApiClient  # noqa: E402
+from kagiso_auth.tests.fake_auth_api import FakeAuthApi  # noqa: E402
+from kagiso_auth.transport import SessionTransport  # noqa: E402
+
+
+class ColdTransport:
+
+    def request(self, method, url, **kwargs):
+        return requests.request(method, url, **kwargs)
+
+
+def time_calls(transport, number_of_calls):
+    AuthApiClient.TRANSPORT = transport
+    timings = []
+
+    for _ in range(number_of_calls):
+        start = time.perf_counter()
+        AuthApiClient.call('users/test@email.com')
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(  # noqa: T001
+        '{name:<8} mean={mean:.3f}ms p50={p50:.3f}ms p99={p99:.3f}ms'.format(
+            name=name,
+            mean=statistics.mean(timings),
+            p50=statistics.median(timings),
+            p99=p99,
+        )
+    )
+
+
+def main():
+    number_of_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    with FakeAuthApi() as api:
+        api.add_user('test@email.com')
+        AuthApiClient.BASE_URL = api.base_url
+
+        report('cold', time_calls(ColdTransport(), number_of_calls))
+        report('pooled', time_calls(SessionTransport(), number_of_calls))
+
+
+if __name__ == '__main__':
+    main()
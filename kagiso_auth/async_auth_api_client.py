@@ -0,0 +1,32 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+
+from . import settings
+from .auth_api_client import AuthApiClient
+
+
+# requests cannot be awaited, so HTTP calls are handed to a bounded pool
+# sized to match the Auth API connection pool. Only the HTTP call runs
+# there: ORM work stays on the caller's thread, inside its transaction and
+# its connection lifecycle.
+EXECUTOR = ThreadPoolExecutor(max_workers=settings.AUTH_API_POOL_MAXSIZE)
+
+
+class AsyncAuthApiClient:
+
+    @classmethod
+    async def call(cls, endpoint, method='GET', payload=None, params=None):
+        # Goes through AuthApiClient so that the pooled transport and the
+        # mapping to AuthAPINetworkError/AuthAPITimeout are shared
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            EXECUTOR,
+            functools.partial(
+                AuthApiClient.call,
+                endpoint,
+                method,
+                payload,
+                params
+            )
+        )
@@ -1,49 +1,183 @@
-import json
 import logging
+import re
+import time
+import uuid
 
 import requests
 
-from . import settings
-from .exceptions import AuthAPINetworkError, AuthAPITimeout
+from . import metrics, settings
+from .circuit_breaker import CircuitBreaker
+from .exceptions import (
+    AuthAPICircuitOpen,
+    AuthAPINetworkError,
+    AuthAPITimeout,
+)
+from .retry import RetryPolicy
+from .single_flight import SingleFlight
+from .transport import SessionTransport
 
 
 logger = logging.getLogger('django')
 
+REDACTED = '********'
+SECRET_KEY_PATTERN = re.compile(r'password|token|secret', re.IGNORECASE)
+
+
+def endpoint_template(endpoint):
+    """Replace the emails and ids in an endpoint with placeholders.
+
+    e.g. users/test@email.com/confirmation_token becomes
+    users/{email}/confirmation_token, so calls can be grouped in logs.
+    """
+    segments = []
+    for segment in endpoint.strip('/').split('/'):
+        if '@' in segment:
+            segment = '{email}'
+        elif segment.isdigit():
+            segment = '{id}'
+        segments.append(segment)
+
+    return '/'.join(segments)
+
+
+def redact(payload):
+    """Return a copy of payload with passwords and tokens masked."""
+    if isinstance(payload, dict):
+        return {
+            key: REDACTED if SECRET_KEY_PATTERN.search(str(key))
+            else redact(value)
+            for key, value in payload.items()
+        }
+    if isinstance(payload, (list, tuple)):
+        return [redact(value) for value in payload]
+    return payload
+
 
 class AuthApiClient:
 
     BASE_URL = settings.AUTH_API_BASE_URL
     TIMEOUT_IN_SECONDS = 6
     AUTH_API_TOKEN = settings.AUTH_API_TOKEN
+    # Swap this out for any object with a requests-style
+    # request(method, url, **kwargs) method to change how calls are sent
+    TRANSPORT = SessionTransport()
+    SINGLE_FLIGHT_ENABLED = settings.AUTH_API_SINGLE_FLIGHT
+    SINGLE_FLIGHT = SingleFlight()
 
     @classmethod
-    def call(cls, endpoint, method='GET', payload=None):
-        auth_headers = {
-            'AUTHORIZATION': 'Token {0}'.format(cls.AUTH_API_TOKEN),
-        }
+    def call(
+            cls,
+            endpoint,
+            method='GET',
+            payload=None,
+            params=None,
+            idempotency_key=None):
         url = '{base_url}/{endpoint}/.json'.format(
             base_url=cls.BASE_URL,
             endpoint=endpoint
         )
 
+        if idempotency_key is None and settings.AUTH_API_IDEMPOTENCY_KEYS:
+            if method in RetryPolicy.KEYED_METHODS:
+                idempotency_key = str(uuid.uuid4())
+
+        if method == 'GET' and cls.SINGLE_FLIGHT_ENABLED:
+            # GETs are idempotent, so a burst of identical lookups can
+            # share a single call
+            key = '{0} {1}'.format(url, sorted((params or {}).items()))
+            return cls.SINGLE_FLIGHT.do(
+                key,
+                lambda: cls._send(
+                    endpoint, url, method, payload, params, idempotency_key)
+            )
+
+        return cls._send(
+            endpoint, url, method, payload, params, idempotency_key)
+
+    @classmethod
+    def _send(cls, endpoint, url, method, payload, params, idempotency_key):
+        auth_headers = {
+            'AUTHORIZATION': 'Token {0}'.format(cls.AUTH_API_TOKEN),
+        }
+        if idempotency_key:
+            # The same key is sent on every attempt
+            auth_headers['Idempotency-Key'] = idempotency_key
+
+        retry_policy = RetryPolicy(method, idempotency_key)
+        start = time.monotonic()
+        attempts = 0
+        outcome = 'error'
+
+        # Logged once for the whole call, however many attempts it took
+        try:
+            while True:
+                attempts += 1
+                try:
+                    status_code, json_data = cls._attempt(
+                        endpoint,
+                        url,
+                        method,
+                        auth_headers,
+                        payload,
+                        params,
+                        retry_policy.timeout(cls.TIMEOUT_IN_SECONDS)
+                    )
+                except AuthAPICircuitOpen:
+                    outcome = 'circuit_open'
+                    raise
+                except (AuthAPINetworkError, AuthAPITimeout) as e:
+                    outcome = (
+                        'timeout' if isinstance(e, AuthAPITimeout)
+                        else 'network_error'
+                    )
+                    if retry_policy.backoff():
+                        continue
+                    raise
+
+                outcome = status_code
+                if not retry_policy.should_retry_status(status_code):
+                    return status_code, json_data
+        finally:
+            cls._log_call(method, endpoint, outcome, start, payload, attempts)
+
+    @classmethod
+    def _attempt(
+            cls, endpoint, url, method, auth_headers, payload, params,
+            timeout):
+        circuit_breaker = CircuitBreaker.for_endpoint(endpoint)
+        circuit_breaker.before_call()
+
+        labels = {'endpoint': endpoint_template(endpoint), 'method': method}
+        metrics.SINK.add_to_gauge('auth_api_in_flight', labels, 1)
+        start = time.monotonic()
         try:
-            response = requests.request(
+            response = cls.TRANSPORT.request(
                 method,
                 url,
                 headers=auth_headers,
                 json=payload,
-                timeout=cls.TIMEOUT_IN_SECONDS
+                params=params,
+                timeout=timeout
             )
         except requests.exceptions.ConnectionError as e:
+            circuit_breaker.record_failure()
+            cls._record_error(labels, e)
             raise AuthAPINetworkError from e
         except requests.exceptions.Timeout as e:
+            circuit_breaker.record_failure()
+            cls._record_error(labels, e)
             raise AuthAPITimeout from e
+        finally:
+            elapsed = time.monotonic() - start
+            metrics.SINK.add_to_gauge('auth_api_in_flight', labels, -1)
+            metrics.SINK.observe(
+                'auth_api_request_duration_seconds', labels, elapsed)
 
-        logger.debug('method={0}'.format(method))
-        logger.debug('url={0}'.format(url))
-        logger.debug('headers={0}'.format(auth_headers))
-        logger.debug('payload={0}'.format(payload))
-        logger.debug('json={0}'.format(json.dumps(payload)))
+        circuit_breaker.record(elapsed, response.status_code)
+        metrics.SINK.increment(
+            'auth_api_responses_total',
+            dict(labels, status=response.status_code)
+        )
 
         json_data = {}
         try:
@@ -53,3 +187,32 @@ class AuthApiClient:
             pass
 
         return response.status_code, json_data
+
+    @staticmethod
+    def _record_error(labels, error):
+        metrics.SINK.increment(
+            'auth_api_errors_total',
+            dict(labels, exception=type(error).__name__)
+        )
+
+    @staticmethod
+    def _log_call(method, endpoint, status, start, payload, attempts):
+        # This runs on every call, so do nothing at all unless someone
+        # is listening. The auth token is never logged.
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+
+        call = {
+            'method': method,
+            'endpoint': endpoint_template(endpoint),
+            'status': status,
+            'elapsed_ms': round((time.monotonic() - start) * 1000, 1),
+            'attempts': attempts,
+            'payload': redact(payload),
+        }
+        logger.debug(
+            'Auth API call: %(method)s %(endpoint)s %(status)s '
+            '%(elapsed_ms)sms attempts=%(attempts)s payload=%(payload)s',
+            call,
+            extra={'auth_api_call': call}
+        )
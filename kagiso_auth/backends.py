@@ -1,9 +1,12 @@
 from django.contrib.auth.backends import ModelBackend
 
 from . import http
+from .async_auth_api_client import AsyncAuthApiClient
 from .auth_api_client import AuthApiClient
+from .cache import AuthenticatedUserCache, PermissionCache
 from .exceptions import AuthAPIUnexpectedStatusCode, EmailNotConfirmedError
 from .models import KagisoUser
+from .throttle import SignInThrottle
 
 
 class KagisoBackend(ModelBackend):
@@ -15,7 +18,76 @@ class KagisoBackend(ModelBackend):
     #
     # Django AllAuth does this:
     #  credentials = {'email': 'test@kagiso.io, 'password': 'open'}
-    def authenticate(self, email=None, username=None, password=None, **kwargs):
+    #
+    # Pass request=request so failed sign ins can be throttled per IP.
+    def authenticate(
+            self,
+            email=None,
+            username=None,
+            password=None,
+            request=None,
+            **kwargs):
+        payload = self._session_payload(email, username, password, **kwargs)
+        ip = self._client_ip(request)
+
+        if self._is_throttled(payload['email'], password, ip):
+            return None
+
+        auth_api_client = AuthApiClient()
+        status, data = auth_api_client.call('sessions', 'POST', payload)
+
+        self._record_sign_in(status, payload['email'], password, ip)
+        return self._user_from_session_response(status, data)
+
+    async def aauthenticate(
+            self,
+            email=None,
+            username=None,
+            password=None,
+            request=None,
+            **kwargs):
+        payload = self._session_payload(email, username, password, **kwargs)
+        ip = self._client_ip(request)
+
+        if self._is_throttled(payload['email'], password, ip):
+            return None
+
+        status, data = await AsyncAuthApiClient.call(
+            'sessions',
+            'POST',
+            payload
+        )
+
+        self._record_sign_in(status, payload['email'], password, ip)
+        return self._user_from_session_response(status, data)
+
+    def get_user(self, user_id):
+        # Runs on every authenticated request to populate request.user
+        user = AuthenticatedUserCache.get(KagisoUser, user_id)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                AuthenticatedUserCache.set(user)
+            return user
+
+        return user if self.user_can_authenticate(user) else None
+
+    def get_all_permissions(self, user_obj, obj=None):
+        # ModelBackend keeps permissions on the user for one request,
+        # PermissionCache keeps them across requests
+        if obj is None and not hasattr(user_obj, '_perm_cache'):
+            if user_obj.is_active and not user_obj.is_anonymous:
+                permissions = PermissionCache.get(user_obj)
+                if permissions is None:
+                    # Read first, so a bump while working them out wins
+                    version = PermissionCache.version()
+                    permissions = super().get_all_permissions(user_obj)
+                    PermissionCache.set(user_obj, permissions, version)
+                user_obj._perm_cache = set(permissions)
+
+        return super().get_all_permissions(user_obj, obj)
+
+    def _session_payload(self, email, username, password, **kwargs):
         email = username if not email else email
 
         payload = {
@@ -31,9 +103,36 @@ class KagisoBackend(ModelBackend):
         if strategy:
             payload['strategy'] = strategy
 
-        auth_api_client = AuthApiClient()
-        status, data = auth_api_client.call('sessions', 'POST', payload)
+        # Record the sign in against the app in the same round-trip
+        app_name = kwargs.get('app_name')
+        if app_name:
+            payload['last_sign_in_via'] = app_name
+
+        return payload
+
+    def _client_ip(self, request):
+        # REMOTE_ADDR can't be spoofed, unlike X-Forwarded-For. Behind a
+        # proxy, have it (or middleware) set REMOTE_ADDR to the client's IP.
+        if request is None:
+            return None
+        return request.META.get('REMOTE_ADDR')
+
+    def _is_throttled(self, email, password, ip):
+        # Social sign ins have no password to get wrong
+        if not email or not password:
+            return False
+        return bool(SignInThrottle.blocked_reason(email, password, ip))
+
+    def _record_sign_in(self, status, email, password, ip):
+        if not email or not password:
+            return
+
+        if status == http.HTTP_200_OK:
+            SignInThrottle.record_success(email)
+        elif status == http.HTTP_404_NOT_FOUND:
+            SignInThrottle.record_failure(email, password, ip)
 
+    def _user_from_session_response(self, status, data):
         if status == http.HTTP_200_OK:
             user = KagisoUser.sync_user_data_locally(data)
         elif status == http.HTTP_404_NOT_FOUND:
@@ -0,0 +1,312 @@
+import hashlib
+import logging
+import threading
+import time
+
+from django.core.cache import caches
+from django.db import router, transaction
+
+from . import http, settings
+
+
+logger = logging.getLogger('django')
+
+KEY_PREFIX = 'kagiso_auth'
+
+
+def get_cache():
+    return caches[settings.AUTH_API_CACHE_ALIAS]
+
+
+def make_key(*parts):
+    return ':'.join((KEY_PREFIX,) + tuple(str(part) for part in parts))
+
+
+def incr_or_set(key, ttl, initial=0):
+    """Atomically increment a counter, starting it at `initial` if missing.
+
+    Returns the new value. `ttl` only applies when the counter is created.
+    """
+    cache = get_cache()
+    cache.add(key, initial, ttl)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Evicted between add and incr
+        cache.set(key, initial + 1, ttl)
+        return initial + 1
+
+
+def hash_key_part(value):
+    # Emails may contain characters memcached does not allow in keys
+    return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+
+def delete_on_commit(keys, using=None):
+    """Delete keys now, and again once the current transaction commits.
+
+    Until the commit other connections still read the old rows, and may
+    cache them again. The second delete drops whatever they cached.
+    """
+    if not keys:
+        return
+
+    get_cache().delete_many(keys)
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(
+            lambda: get_cache().delete_many(keys),
+            using=using
+        )
+
+
+class UserLookupCache:
+    """Read-through cache of Auth API `users/{email}` lookups.
+
+    Found users are kept for TTL seconds and missing ones (404s) for
+    NEGATIVE_TTL seconds. For a further STALE_TTL seconds an expired entry
+    is still returned while a single background thread refreshes it.
+    Other status codes are never cached.
+    """
+
+    TTL = settings.AUTH_API_USER_CACHE_TTL
+    NEGATIVE_TTL = settings.AUTH_API_USER_CACHE_NEGATIVE_TTL
+    STALE_TTL = settings.AUTH_API_USER_CACHE_STALE_TTL
+
+    @classmethod
+    def get(cls, email, fetch):
+        """Return (status, data) for email, calling fetch() on a miss."""
+        cached = cls.get_cached(email, fetch)
+        if cached is not None:
+            return cached
+
+        status, data = fetch()
+        cls.set(email, status, data)
+        return status, data
+
+    @classmethod
+    def get_cached(cls, email, fetch):
+        """Return cached (status, data) for email, or None on a miss.
+
+        fetch() is only called to refresh a stale entry in the background.
+        """
+        if not cls.TTL:
+            return None
+
+        cache = get_cache()
+        entry = cache.get(cls._key(email))
+        if entry is None:
+            return None
+
+        fresh_until, status, data = entry
+        if time.time() >= fresh_until and cache.add(
+                cls._key(email, 'refreshing'), True, max(cls.STALE_TTL, 1)):
+            cls._refresh_in_background(email, fetch)
+
+        return status, data
+
+    @classmethod
+    def set(cls, email, status, data):
+        if not cls.TTL:
+            return
+
+        if status == http.HTTP_200_OK:
+            ttl = cls.TTL
+        elif status == http.HTTP_404_NOT_FOUND:
+            ttl = cls.NEGATIVE_TTL
+        else:
+            return
+
+        if ttl:
+            get_cache().set(
+                cls._key(email),
+                (time.time() + ttl, status, data),
+                ttl + cls.STALE_TTL
+            )
+
+    @classmethod
+    def invalidate(cls, *emails):
+        if not cls.TTL:
+            return
+
+        delete_on_commit([cls._key(email) for email in emails if email])
+
+    @classmethod
+    def _refresh_in_background(cls, email, fetch):
+        thread = threading.Thread(
+            target=cls._refresh,
+            args=(email, fetch),
+            daemon=True
+        )
+        thread.start()
+
+    @classmethod
+    def _refresh(cls, email, fetch):
+        try:
+            status, data = fetch()
+            cls.set(email, status, data)
+        except Exception:
+            # Keep serving the stale entry, the next caller will retry
+            logger.exception('Refreshing cached user failed')
+        finally:
+            get_cache().delete(cls._key(email, 'refreshing'))
+
+    @staticmethod
+    def _key(email, *parts):
+        return make_key('user', hash_key_part(email), *parts)
+
+
+class AuthenticatedUserCache:
+    """Caches the users that ModelBackend.get_user loads on every request.
+
+    Entries hold the user's column values, keyed by id, and are dropped
+    whenever the user is saved, synced or deleted, and again when that
+    transaction commits, so a cached user is never older than the
+    committed row. An entry written before a column
+    was added or removed is treated as a miss.
+    """
+
+    TTL = settings.AUTH_USER_CACHE_TTL
+
+    @classmethod
+    def get(cls, model, user_id):
+        if not cls.TTL:
+            return None
+
+        values = get_cache().get(cls._key(user_id))
+        if values is None:
+            return None
+
+        fields = model._meta.concrete_fields
+        if set(values) != {field.attname for field in fields}:
+            return None
+
+        return model.from_db(
+            router.db_for_read(model),
+            [field.attname for field in fields],
+            [values[field.attname] for field in fields]
+        )
+
+    @classmethod
+    def set(cls, user):
+        if not cls.TTL:
+            return
+
+        values = {
+            field.attname: getattr(user, field.attname)
+            for field in user._meta.concrete_fields
+        }
+        get_cache().set(cls._key(user.pk), values, cls.TTL)
+
+    @classmethod
+    def invalidate(cls, *user_ids):
+        if not cls.TTL:
+            return
+
+        delete_on_commit(
+            [cls._key(user_id) for user_id in user_ids if user_id]
+        )
+
+    @staticmethod
+    def _key(user_id):
+        return make_key('authenticated_user', user_id)
+
+
+class PermissionCache:
+    """Caches each user's permission set between requests.
+
+    ModelBackend works out a user's permissions with joins across groups
+    and user_permissions once per request. The result is stored here as a
+    frozenset of 'app_label.codename' strings, so has_perm becomes a set
+    lookup.
+
+    Superusers have every permission, so each entry also records the
+    is_superuser and is_active it was worked out for, and is a miss for a
+    user whose flags have changed since. A user's entry is dropped when
+    their groups or permissions change. Changes that can affect many users
+    (a group's permissions, deleted groups or permissions) bump a global
+    version instead, which makes every entry stale at once.
+    """
+
+    TTL = settings.AUTH_PERMISSION_CACHE_TTL
+
+    @classmethod
+    def get(cls, user):
+        if not cls.TTL:
+            return None
+
+        version_key = cls._version_key()
+        user_key = cls._key(user.id)
+        entries = get_cache().get_many([version_key, user_key])
+
+        entry = entries.get(user_key)
+        if entry is None:
+            return None
+
+        version, flags, permissions = entry
+        if version != entries.get(version_key, 0):
+            return None
+        if flags != cls._flags(user):
+            return None
+
+        return permissions
+
+    @classmethod
+    def version(cls):
+        """The current version, to be read before working permissions out.
+
+        Pass it to set(), so a bump while they were worked out leaves the
+        entry stale.
+        """
+        if not cls.TTL:
+            return None
+
+        return get_cache().get(cls._version_key(), 0)
+
+    @classmethod
+    def set(cls, user, permissions, version):
+        if not cls.TTL:
+            return
+
+        get_cache().set(
+            cls._key(user.id),
+            (version, cls._flags(user), frozenset(permissions)),
+            cls.TTL
+        )
+
+    @classmethod
+    def invalidate(cls, *user_ids):
+        if not cls.TTL:
+            return
+
+        delete_on_commit(
+            [cls._key(user_id) for user_id in user_ids if user_id]
+        )
+
+    @classmethod
+    def invalidate_all(cls, using=None):
+        if not cls.TTL:
+            return
+
+        cls._bump_version()
+        # Entries cached from the old rows before the commit go stale too
+        if transaction.get_connection(using).in_atomic_block:
+            transaction.on_commit(cls._bump_version, using=using)
+
+    @classmethod
+    def _bump_version(cls):
+        # Start from the time rather than 0, so a version that was evicted
+        # doesn't restart at a value older entries were cached with
+        incr_or_set(
+            cls._version_key(), None, initial=int(time.time() * 1000))
+
+    @staticmethod
+    def _flags(user):
+        return (bool(user.is_superuser), bool(user.is_active))
+
+    @staticmethod
+    def _key(user_id):
+        return make_key('permissions', user_id)
+
+    @staticmethod
+    def _version_key():
+        return make_key('permissions', 'version')
@@ -0,0 +1,91 @@
+import time
+
+from . import settings
+from .cache import get_cache, incr_or_set, make_key
+from .exceptions import AuthAPICircuitOpen
+
+
+class CircuitBreaker:
+    """Fails fast when an Auth API endpoint family keeps failing.
+
+    Calls are grouped by the first segment of their endpoint (sessions,
+    users, reset_password, confirm_email), so a slow sessions endpoint
+    does not stop users from being looked up.
+
+    After FAILURE_THRESHOLD consecutive failures (errors, 5xx responses or
+    calls slower than LATENCY_THRESHOLD seconds) the circuit opens and
+    calls raise AuthAPICircuitOpen without touching the network. Once
+    RESET_TIMEOUT seconds have passed a single call is let through as a
+    probe: if it succeeds the circuit closes, otherwise it opens again.
+
+    State lives in the Django cache so it is shared by all workers.
+    """
+
+    ENABLED = settings.AUTH_API_CIRCUIT_BREAKER_ENABLED
+    FAILURE_THRESHOLD = settings.AUTH_API_CIRCUIT_BREAKER_FAILURE_THRESHOLD
+    LATENCY_THRESHOLD = settings.AUTH_API_CIRCUIT_BREAKER_LATENCY_THRESHOLD
+    RESET_TIMEOUT = settings.AUTH_API_CIRCUIT_BREAKER_RESET_TIMEOUT
+
+    def __init__(self, family):
+        self.family = family
+        self._dirty = False
+
+    @classmethod
+    def for_endpoint(cls, endpoint):
+        return cls(endpoint.strip('/').split('/')[0])
+
+    def before_call(self):
+        if not self.ENABLED:
+            return
+
+        cache = get_cache()
+        state = cache.get_many([
+            self._key('failures'),
+            self._key('opened_at'),
+        ])
+        # Only touch the cache again on success if there is state to clear
+        self._dirty = bool(state)
+
+        opened_at = state.get(self._key('opened_at'))
+        if opened_at is None:
+            return
+
+        if time.time() - opened_at < self.RESET_TIMEOUT:
+            raise AuthAPICircuitOpen(self.family)
+
+        # Half open: only one caller across all workers gets to probe
+        if not cache.add(self._key('probe'), True, self.RESET_TIMEOUT):
+            raise AuthAPICircuitOpen(self.family)
+
+    def record(self, elapsed, status_code):
+        threshold = self.LATENCY_THRESHOLD
+        too_slow = threshold is not None and elapsed >= threshold
+
+        if status_code >= 500 or too_slow:
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def record_success(self):
+        if not self.ENABLED or not self._dirty:
+            return
+
+        get_cache().delete_many([
+            self._key('failures'),
+            self._key('opened_at'),
+            self._key('probe'),
+        ])
+
+    def record_failure(self):
+        if not self.ENABLED:
+            return
+
+        failures = incr_or_set(self._key('failures'), None)
+
+        if failures >= self.FAILURE_THRESHOLD:
+            cache = get_cache()
+            cache.set(self._key('opened_at'), time.time(), None)
+            cache.delete(self._key('probe'))
+
+    def _key(self, name):
+        return make_key('circuit_breaker', self.family, name)
@@ -21,3 +21,11 @@ class AuthAPIUnexpectedStatusCode(AuthAPIError):
 
 class EmailNotConfirmedError(AuthAPIError):
     pass
+
+
+class AuthAPICircuitOpen(AuthAPINetworkError):
+
+    def __init__(self, family):
+        message = 'Circuit open for Auth API endpoint: {0}'.format(family)
+        self.family = family
+        super().__init__(message)
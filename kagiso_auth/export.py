@@ -0,0 +1,134 @@
+"""Streaming export of the local KagisoUser table.
+
+Rows flow through a generator pipeline, so only one chunk of users is
+ever held in memory, however many are exported:
+
+    iter_users -> to_csv_lines / to_json_lines -> file
+"""
+import csv
+from datetime import date, datetime
+import io
+import json
+
+from .models import KagisoUser
+
+
+FIELDS = (
+    'id',
+    'email',
+    'first_name',
+    'last_name',
+    'is_staff',
+    'is_superuser',
+    'is_active',
+    'email_confirmed',
+    'created',
+    'created_via',
+    'modified',
+    'last_sign_in_via',
+    'birth_date',
+    'profile',
+)
+
+FORMATS = ('csv', 'jsonl')
+
+
+def filter_users(created_via=None, modified_since=None, modified_until=None,
+                 profile=None):
+    """Return the KagisoUser queryset to export.
+
+    `profile` is a dict of top level profile keys to values, e.g.
+    {'region': 'GAUTENG'}.
+    """
+    users = KagisoUser.objects.all()
+
+    if created_via:
+        users = users.filter(created_via=created_via)
+    if modified_since:
+        users = users.filter(modified__gte=modified_since)
+    if modified_until:
+        users = users.filter(modified__lt=modified_until)
+    for key, value in sorted((profile or {}).items()):
+        users = users.filter(**{'profile__{0}'.format(key): value})
+
+    return users
+
+
+def iter_users(users, chunk_size=2000):
+    """Yield each user in `users` as a dict of FIELDS, in id order.
+
+    Chunks are fetched by id range rather than OFFSET, so every query is
+    an index scan however deep into the table it is. Django 1.10's
+    iterator() still buffers the whole result in the database driver.
+    """
+    last_id = None
+
+    while True:
+        chunk = users.order_by('id')
+        if last_id is not None:
+            chunk = chunk.filter(id__gt=last_id)
+        rows = list(chunk.values(*FIELDS)[:chunk_size])
+        if not rows:
+            return
+
+        for row in rows:
+            # jsonfield leaves values() undecoded on a text column
+            if isinstance(row['profile'], str):
+                row['profile'] = json.loads(row['profile'])
+            yield row
+
+        last_id = rows[-1]['id']
+
+
+def to_json_lines(rows):
+    for row in rows:
+        yield json.dumps(row, default=_json_default, sort_keys=True) + '\n'
+
+
+def to_csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        writer.writerow(values)
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    yield line(FIELDS)
+    for row in rows:
+        yield line([_csv_value(row[field]) for field in FIELDS])
+
+
+def export_users(users, output, format='jsonl', chunk_size=2000):
+    """Write `users` to the text file `output`, returning how many."""
+    exported = 0
+
+    def counted(rows):
+        nonlocal exported
+        for row in rows:
+            exported += 1
+            yield row
+
+    rows = counted(iter_users(users, chunk_size))
+    lines = to_csv_lines(rows) if format == 'csv' else to_json_lines(rows)
+    output.writelines(lines)
+
+    return exported
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True)
+    return value
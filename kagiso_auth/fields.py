@@ -0,0 +1,100 @@
+import json
+
+from django.db import models
+from django.db.models import Lookup, Transform
+from jsonfield import JSONField
+
+
+class ProfileField(JSONField):
+    """A JSONField stored as jsonb on Postgres, and as text elsewhere.
+
+    Values are still encoded by jsonfield, which Postgres casts to jsonb on
+    the way in. psycopg2 decodes jsonb on the way out.
+
+    Top level keys can be filtered on, `profile__region='GAUTENG'`, and
+    `profile__json_contains={'alerts': ['SMS']}` matches profiles that
+    contain the given keys and list items.
+    """
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return 'jsonb'
+        return super().db_type(connection)
+
+    def get_transform(self, name):
+        transform = super().get_transform(name)
+        if transform:
+            return transform
+        return KeyTextTransformFactory(name)
+
+
+class KeyTextTransform(Transform):
+    """The value of a top level key, as text."""
+
+    output_field = models.TextField()
+
+    def __init__(self, key_name, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.key_name = key_name
+
+    def as_sql(self, compiler, connection):
+        # SQLite's JSON1 extension, and MySQL 5.7+ once unquoted
+        lhs, params = compiler.compile(self.lhs)
+        return 'json_extract({0}, %s)'.format(lhs), params + [
+            '$.{0}'.format(self.key_name)
+        ]
+
+    def as_mysql(self, compiler, connection):
+        sql, params = self.as_sql(compiler, connection)
+        return 'JSON_UNQUOTE({0})'.format(sql), params
+
+    def as_postgresql(self, compiler, connection):
+        # Matches the expression indexes created in migration 0015
+        lhs, params = compiler.compile(self.lhs)
+        return '({0} ->> %s)'.format(lhs), params + [self.key_name]
+
+
+class KeyTextTransformFactory:
+
+    def __init__(self, key_name):
+        self.key_name = key_name
+
+    def __call__(self, *args, **kwargs):
+        return KeyTextTransform(self.key_name, *args, **kwargs)
+
+
+@ProfileField.register_lookup
+class JSONContains(Lookup):
+    """Profiles containing every key and list item of a dict.
+
+    Uses the GIN index on Postgres. SQLite only looks one level deep, and
+    other databases are not supported.
+    """
+
+    lookup_name = 'json_contains'
+
+    def as_postgresql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        return '{0} @> %s::jsonb'.format(lhs), lhs_params + [
+            json.dumps(self.rhs)
+        ]
+
+    def as_sqlite(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        conditions = []
+        params = []
+
+        for key, value in sorted(self.rhs.items()):
+            path = '$.{0}'.format(key)
+            if isinstance(value, list):
+                for item in value:
+                    conditions.append(
+                        'EXISTS (SELECT 1 FROM json_each({0}, %s) '
+                        'WHERE json_each.value = %s)'.format(lhs)
+                    )
+                    params += lhs_params + [path, item]
+            else:
+                conditions.append('json_extract({0}, %s) = %s'.format(lhs))
+                params += lhs_params + [path, value]
+
+        return ' AND '.join(conditions) or '1 = 1', params
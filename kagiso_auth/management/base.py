@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class OutboxCommand(BaseCommand):
+    """Sends an outbox's due rows in batches until stopped.
+
+    Subclasses implement `send_batch(batch_size)`, which sends one batch,
+    reports on it and returns a (sent, failed) tuple.
+    """
+    noun = 'rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Number of {0} to claim per batch'.format(self.noun)
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5,
+            help=(
+                'Seconds to sleep when there is nothing to send, or '
+                'nothing could be sent'
+            )
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Send everything that is due, then exit (e.g. from cron)'
+        )
+
+    def send_batch(self, batch_size):
+        raise NotImplementedError
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = self.send_batch(options['batch_size'])
+
+            if options['once']:
+                # Failed rows are no longer due, so this always finishes
+                if not (sent or failed):
+                    return
+                continue
+
+            # Keep going while sends succeed, but don't hammer a service
+            # that is failing every one of them
+            if not sent:
+                time.sleep(options['poll_interval'])
@@ -0,0 +1,130 @@
+from contextlib import contextmanager, ExitStack
+import gzip
+import io
+
+from dateutil import parser as date_parser
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import export
+
+
+class Command(BaseCommand):
+    help = (
+        'Streams the local KagisoUser table to CSV or JSON lines, '
+        'optionally gzipped, in constant memory'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            default='-',
+            help='File to write to, or - (the default) for stdout'
+        )
+        parser.add_argument(
+            '--format',
+            choices=export.FORMATS,
+            default='jsonl',
+            help='csv, or jsonl (the default) for one JSON object per line'
+        )
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='Compress the output with gzip as it is written'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Number of users to fetch per query'
+        )
+        parser.add_argument(
+            '--created-via',
+            help='Only export users created via this app'
+        )
+        parser.add_argument(
+            '--modified-since',
+            help='Only export users modified at or after this ISO 8601 time'
+        )
+        parser.add_argument(
+            '--modified-until',
+            help='Only export users modified before this ISO 8601 time'
+        )
+        parser.add_argument(
+            '--profile',
+            action='append',
+            default=[],
+            metavar='KEY=VALUE',
+            help='Only export users whose profile has KEY=VALUE. Repeatable.'
+        )
+
+    def handle(self, *args, **options):
+        users = export.filter_users(
+            created_via=options['created_via'],
+            modified_since=self._parse_time(options['modified_since']),
+            modified_until=self._parse_time(options['modified_until']),
+            profile=self._parse_profile(options['profile']),
+        )
+
+        with self._open(options['output'], options['gzip']) as output:
+            exported = export.export_users(
+                users,
+                output,
+                options['format'],
+                options['chunk_size']
+            )
+
+        self.stderr.write('Done, exported {0} users'.format(exported))
+
+    @contextmanager
+    def _open(self, path, compress):
+        if path == '-' and not compress:
+            # Through self.stdout, so call_command(stdout=...) is honoured
+            yield self.stdout
+            return
+
+        with ExitStack() as stack:
+            if path == '-':
+                stream = self._binary_stdout()
+            else:
+                stream = stack.enter_context(open(path, 'wb'))
+
+            if compress:
+                stream = stack.enter_context(
+                    gzip.GzipFile(fileobj=stream, mode='wb'))
+
+            output = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+            try:
+                yield output
+            finally:
+                output.flush()
+                # Leave closing to the stack, which never closes stdout
+                output.detach()
+
+    def _binary_stdout(self):
+        # OutputWrapper hands attribute lookups on to the stream it wraps
+        try:
+            stream = self.stdout.buffer
+        except AttributeError:
+            raise CommandError(
+                'stdout is not binary, so --gzip needs --output')
+
+        self.stdout.flush()
+        return stream
+
+    def _parse_time(self, value):
+        if not value:
+            return None
+        try:
+            return date_parser.parse(value)
+        except ValueError:
+            raise CommandError('Invalid time: {0}'.format(value))
+
+    def _parse_profile(self, pairs):
+        profile = {}
+        for pair in pairs:
+            key, separator, value = pair.partition('=')
+            if not separator or not key:
+                raise CommandError(
+                    '--profile must be KEY=VALUE, not {0}'.format(pair))
+            profile[key] = value
+        return profile
@@ -0,0 +1,18 @@
+from ..base import OutboxCommand
+from ...write_behind import flush_pending
+
+
+class Command(OutboxCommand):
+    help = 'Sends queued user profile changes to the Auth API'
+    noun = 'user updates'
+
+    def send_batch(self, batch_size):
+        sent, conflicts, failed = flush_pending(batch_size)
+
+        if sent or failed:
+            self.stdout.write(
+                'Sent {0} ({1} with conflicts), failed {2}'.format(
+                    sent, conflicts, failed)
+            )
+
+        return sent, failed
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from ...models import DemographicCount, KagisoUser
+
+
+class Command(BaseCommand):
+    help = (
+        'Recounts users by region, gender, age band and sign up/in method. '
+        'Run daily, as users move between age bands on their birthdays.'
+    )
+
+    def handle(self, *args, **options):
+        DemographicCount.objects.rebuild(KagisoUser.objects.all())
+        self.stdout.write(
+            'Done, counted {0} values'.format(DemographicCount.objects.count())
+        )
@@ -0,0 +1,15 @@
+from ..base import OutboxCommand
+from ...outbox import send_pending
+
+
+class Command(OutboxCommand):
+    help = 'Sends queued confirmation and password reset emails'
+    noun = 'emails'
+
+    def send_batch(self, batch_size):
+        sent, failed = send_pending(batch_size)
+
+        if sent or failed:
+            self.stdout.write('Sent {0}, failed {1}'.format(sent, failed))
+
+        return sent, failed
@@ -0,0 +1,136 @@
+import itertools
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import sync
+
+
+class Command(BaseCommand):
+    help = (
+        'Mirrors Auth API users into the local KagisoUser table, either '
+        'from the Auth API or from a file of JSON lines'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            help='Read users from this JSON lines file instead of the Auth API'
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help=(
+                'Only sync Auth API users modified since the last '
+                'incremental sync. Cheap enough to run from cron.'
+            )
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of users to upsert per transaction'
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=500,
+            help='Number of users to request per Auth API page'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help=(
+                'File to record progress in. An interrupted sync resumes '
+                'from it, and it is removed once the sync completes.'
+            )
+        )
+
+    def handle(self, *args, **options):
+        if options['incremental']:
+            if options['file'] or options['checkpoint']:
+                raise CommandError(
+                    '--incremental tracks its own progress and only reads '
+                    'from the Auth API'
+                )
+            return self._sync_incrementally(options)
+
+        checkpoint = options['checkpoint']
+        start = self._read_checkpoint(checkpoint)
+        started_at = time.monotonic()
+
+        if start:
+            self.stdout.write('Resuming after {0} users'.format(start))
+
+        def on_batch(read):
+            elapsed = time.monotonic() - started_at
+            self.stdout.write(
+                'Read {total} users ({rate:.0f} rows/s)'.format(
+                    total=start + read,
+                    rate=read / elapsed if elapsed else 0,
+                )
+            )
+            self._write_checkpoint(checkpoint, start + read)
+
+        if options['file']:
+            with open(options['file']) as lines:
+                records = itertools.islice(
+                    sync.read_json_lines(lines), start, None)
+                synced, skipped = sync.sync_users(
+                    records, options['batch_size'], on_batch)
+        else:
+            records = sync.iter_auth_api_users(options['page_size'], start)
+            synced, skipped = sync.sync_users(
+                records, options['batch_size'], on_batch)
+
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        self.stdout.write('Done, synced {0} users'.format(synced))
+        self._report_skipped(skipped)
+
+    def _sync_incrementally(self, options):
+        started_at = time.monotonic()
+
+        def on_batch(read):
+            elapsed = time.monotonic() - started_at
+            self.stdout.write(
+                'Read {total} users ({rate:.0f} rows/s)'.format(
+                    total=read,
+                    rate=read / elapsed if elapsed else 0,
+                )
+            )
+
+        synced, skipped = sync.sync_modified_users(
+            options['page_size'],
+            options['batch_size'],
+            on_batch
+        )
+        self.stdout.write('Done, synced {0} modified users'.format(synced))
+        self._report_skipped(skipped)
+
+    def _report_skipped(self, skipped):
+        if skipped:
+            self.stdout.write(
+                'Skipped {0} users whose email is taken by another local '
+                'user: {1}'.format(
+                    len(skipped), ', '.join(user.email for user in skipped))
+            )
+
+    def _read_checkpoint(self, checkpoint):
+        if not checkpoint or not os.path.exists(checkpoint):
+            return 0
+
+        with open(checkpoint) as f:
+            return json.load(f)['synced']
+
+    def _write_checkpoint(self, checkpoint, synced):
+        if not checkpoint:
+            return
+
+        # Write then rename, so a crash never leaves a truncated checkpoint
+        temp_path = checkpoint + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'synced': synced}, f)
+        os.replace(temp_path, checkpoint)
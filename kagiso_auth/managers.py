@@ -1,7 +1,148 @@
+from collections import Counter
+from datetime import date, timedelta
+
+from dateutil.relativedelta import relativedelta
 from django.contrib.auth.models import BaseUserManager
+from django.db import connections, IntegrityError, models, transaction
+from django.db.models import Case, Count, F, Func, Value, When
+from django.db.models.functions import Coalesce, Substr
+from django.utils import timezone
+
+from .fields import KeyTextTransform
+
+
+# Dashboard age bands as (youngest, oldest, label). Users without a
+# birth_date are counted under ''.
+AGE_BANDS = (
+    (0, 17, 'under 18'),
+    (18, 24, '18-24'),
+    (25, 34, '25-34'),
+    (35, 44, '35-44'),
+    (45, 54, '45-54'),
+    (55, 64, '55-64'),
+    (65, None, '65+'),
+)
+
+
+def age_band(age):
+    if age is None:
+        return ''
+
+    for youngest, oldest, label in AGE_BANDS:
+        if age >= youngest and (oldest is None or age <= oldest):
+            return label
+
+    return ''
+
+
+class Age(Func):
+    """Whole years between a date column and today, worked out in SQL.
+
+    Today is passed in from Python, so ages match KagisoUser.age whatever
+    time zone the database runs in.
+    """
+
+    def __init__(self, expression, today=None):
+        super().__init__(expression, output_field=models.IntegerField())
+        self.today = today or date.today()
+
+    def as_sql(self, compiler, connection):
+        # Standard SQL for other databases: the difference in years, less
+        # one if the birthday is still to come this year
+        column, params = compiler.compile(self.source_expressions[0])
+        sql = (
+            '(EXTRACT(YEAR FROM %s) - EXTRACT(YEAR FROM {0}) - '
+            'CASE WHEN EXTRACT(MONTH FROM %s) * 100 + EXTRACT(DAY FROM %s) '
+            '< EXTRACT(MONTH FROM {0}) * 100 + EXTRACT(DAY FROM {0}) '
+            'THEN 1 ELSE 0 END)'
+        ).format(column)
+        today = [self.today]
+        return sql, today + params + today + today + params + params
+
+    def as_postgresql(self, compiler, connection):
+        column, params = compiler.compile(self.source_expressions[0])
+        sql = 'CAST(EXTRACT(YEAR FROM AGE(%s, {0})) AS integer)'.format(column)
+        return sql, [self.today] + params
+
+    def as_sqlite(self, compiler, connection):
+        # SQLite has no EXTRACT
+        column, params = compiler.compile(self.source_expressions[0])
+        sql = (
+            "(CAST(strftime('%%Y', %s) AS integer) - "
+            "CAST(strftime('%%Y', {0}) AS integer) - "
+            "(strftime('%%m-%%d', %s) < strftime('%%m-%%d', {0})))"
+        ).format(column)
+        return sql, [self.today] + params + [self.today] + params
+
 
+class KagisoUserQuerySet(models.QuerySet):
 
-class AuthManager(BaseUserManager):
+    def with_age(self):
+        """Annotate each user with their age, or None without a birth_date."""
+        return self.annotate(age=Age('birth_date'))
+
+    def age_between(self, youngest, oldest):
+        """Filter to users aged youngest to oldest years, inclusive.
+
+        Filters on a birth_date range, so the birth_date index is used.
+        """
+        today = date.today()
+        return self.filter(
+            birth_date__gt=today - relativedelta(years=oldest + 1),
+            birth_date__lte=today - relativedelta(years=youngest),
+        )
+
+    def in_region(self, region):
+        return self.filter(profile__region=region)
+
+    def with_gender(self, gender):
+        return self.filter(profile__gender=gender)
+
+    def with_alert(self, alert):
+        """Filter to users who receive alerts by `alert`, e.g. 'SMS'."""
+        return self.filter(profile__json_contains={'alerts': [alert]})
+
+    def demographic_counts(self):
+        """Count users by each DemographicCount dimension, in SQL.
+
+        Returns a dict of {(dimension, value): count}.
+        """
+        today = date.today()
+        age_bands = []
+        for youngest, oldest, label in AGE_BANDS:
+            born = {'birth_date__lte': today - relativedelta(years=youngest)}
+            if oldest is not None:
+                born['birth_date__gt'] = today - relativedelta(
+                    years=oldest + 1)
+            age_bands.append(When(then=Value(label), **born))
+
+        expressions = {
+            'region': KeyTextTransform('region', 'profile'),
+            'gender': KeyTextTransform('gender', 'profile'),
+            'age_band': Case(
+                *age_bands,
+                default=Value(''),
+                output_field=models.CharField()
+            ),
+            'created_via': F('created_via'),
+            'last_sign_in_via': F('last_sign_in_via'),
+        }
+
+        counts = {}
+        for dimension, expression in sorted(expressions.items()):
+            value = Coalesce(
+                expression, Value(''), output_field=models.CharField())
+            rows = self.annotate(
+                value=Substr(value, 1, 100)
+            ).values('value').annotate(count=Count('id')).order_by()
+
+            for row in rows:
+                counts[(dimension, row['value'])] = row['count']
+
+        return counts
+
+
+class AuthManager(BaseUserManager.from_queryset(KagisoUserQuerySet)):
 
     def create_user(self, email, password=None, **other_fields):
         user = self.model(email=self.normalize_email(email), **other_fields)
@@ -13,3 +154,190 @@ class AuthManager(BaseUserManager):
         other_fields = other_fields or {}
         other_fields['is_superuser'] = True
         return self.create_user(email, password, **other_fields)
+
+
+class OutboxManager(models.Manager):
+    # For models with PENDING rows picked up by status and next_attempt
+
+    def claim(self, batch_size):
+        # Must be called inside a transaction. Rows stay locked until it
+        # ends, and concurrent workers skip them rather than wait.
+        now = timezone.now()
+        connection = connections[self.db]
+
+        if connection.vendor != 'postgresql':
+            return list(
+                self.select_for_update().filter(
+                    status=self.model.PENDING,
+                    next_attempt__lte=now
+                ).order_by('id')[:batch_size]
+            )
+
+        # Django 1.10 has no select_for_update(skip_locked=True)
+        sql = (
+            'SELECT id FROM {table} '
+            'WHERE status = %s AND next_attempt <= %s '
+            'ORDER BY id LIMIT %s '
+            'FOR UPDATE SKIP LOCKED'
+        ).format(table=connection.ops.quote_name(self.model._meta.db_table))
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.model.PENDING, now, batch_size])
+            ids = [row[0] for row in cursor.fetchall()]
+
+        return list(self.filter(id__in=ids).order_by('id'))
+
+    def lease(self, batch_size, seconds):
+        """Claim due rows for `seconds`, committing before returning them.
+
+        Leased rows are not due again until the lease runs out, so other
+        workers skip them without the caller holding a transaction open
+        while it works through them. Rows a crashed worker leased are
+        picked up again once their lease runs out.
+        """
+        with transaction.atomic(using=self.db):
+            rows = self.claim(batch_size)
+            leased_until = timezone.now() + timedelta(seconds=seconds)
+            self.filter(id__in=[row.id for row in rows]).update(
+                next_attempt=leased_until)
+
+        for row in rows:
+            row.next_attempt = leased_until
+        return rows
+
+
+class OutboxEmailManager(OutboxManager):
+
+    def enqueue(self, message):
+        return self.create(
+            to=list(message.to),
+            from_email=message.from_email,
+            subject=message.subject,
+            template=getattr(message, 'template', None),
+            substitution_data=getattr(message, 'substitution_data', None),
+        )
+
+
+class OutboxUserUpdateManager(OutboxManager):
+
+    def enqueue(self, user, changes):
+        """Queue changes to user's Auth API fields, merged with any queued.
+
+        Only one row is kept per user, so the worker sends a single PUT
+        with the latest value of every changed field.
+        """
+        now = timezone.now()
+        snapshot = user._auth_api_snapshot or {}
+        original = {field: snapshot.get(field) for field in changes}
+
+        with transaction.atomic(using=self.db):
+            update, created = self.select_for_update().get_or_create(
+                user_id=user.id,
+                defaults={
+                    'changes': changes,
+                    'original': original,
+                    'changed_at': now,
+                }
+            )
+            if not created:
+                update.changes = dict(update.changes, **changes)
+                # Keep the value from before the first queued change
+                update.original = dict(original, **update.original)
+                update.changed_at = now
+                update.status = self.model.PENDING
+                update.attempts = 0
+                # Not while a worker holds a lease on it, or a second
+                # worker could send these changes alongside the first
+                update.next_attempt = max(update.next_attempt, now)
+                update.last_error = None
+                update.save()
+
+        return update
+
+    def pending_changes(self, user_id):
+        update = self.filter(
+            user_id=user_id,
+            status=self.model.PENDING
+        ).first()
+        return update.changes if update else {}
+
+
+class DemographicCountManager(models.Manager):
+
+    def breakdown(self, dimension):
+        """Return {value: count} for one dimension, e.g. 'region'."""
+        return dict(
+            self.filter(dimension=dimension, count__gt=0).values_list(
+                'value', 'count')
+        )
+
+    def breakdowns(self):
+        """Return {dimension: {value: count}} for every dimension."""
+        breakdowns = {}
+        rows = self.filter(count__gt=0).values_list(
+            'dimension', 'value', 'count')
+
+        for dimension, value, count in rows:
+            breakdowns.setdefault(dimension, {})[value] = count
+
+        return breakdowns
+
+    def apply(self, before, after):
+        """Move users' counts from their `before` to their `after` values.
+
+        Both are lists of KagisoUser.demographics() dicts. Use an empty
+        list for users being created (before) or deleted (after).
+        """
+        deltas = Counter()
+        for demographics in before:
+            for item in demographics.items():
+                deltas[item] -= 1
+        for demographics in after:
+            for item in demographics.items():
+                deltas[item] += 1
+
+        with transaction.atomic(using=self.db):
+            # Always in the same order, so concurrent writers cannot
+            # deadlock on each other's rows
+            for (dimension, value), delta in sorted(deltas.items()):
+                if delta:
+                    self._add(dimension, value, delta)
+
+    def rebuild(self, users):
+        """Recount `users`, a KagisoUser queryset, replacing every count."""
+        connection = connections[self.db]
+
+        # The lock is only held until this transaction ends, so the
+        # recount and the swap of counts must share it, whatever the
+        # caller's transaction state
+        with transaction.atomic(using=self.db):
+            if connection.vendor == 'postgresql':
+                # Writers of counts wait for the rebuild, then apply their
+                # change on top. That is only exact when a user's row and
+                # its count change commit together (syncs, deletes, saves
+                # under ATOMIC_REQUESTS). A save in autocommit commits the
+                # row first, so a rebuild in between counts it twice until
+                # the next rebuild.
+                with connection.cursor() as cursor:
+                    cursor.execute('LOCK TABLE {0} IN EXCLUSIVE MODE'.format(
+                        connection.ops.quote_name(self.model._meta.db_table)
+                    ))
+
+            counts = users.demographic_counts()
+            self.all().delete()
+            self.bulk_create([
+                self.model(dimension=dimension, value=value, count=count)
+                for (dimension, value), count in sorted(counts.items())
+            ])
+
+    def _add(self, dimension, value, delta):
+        rows = self.filter(dimension=dimension, value=value)
+        if rows.update(count=F('count') + delta):
+            return
+
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(dimension=dimension, value=value, count=delta)
+        except IntegrityError:
+            # Created by a concurrent writer since the update
+            rows.update(count=F('count') + delta)
@@ -0,0 +1,194 @@
+"""Metrics for Auth API calls, sent to a pluggable sink.
+
+AuthApiClient reports:
+
+    auth_api_request_duration_seconds{endpoint,method}  histogram
+    auth_api_responses_total{endpoint,method,status}     counter
+    auth_api_errors_total{endpoint,method,exception}     counter
+    auth_api_in_flight{endpoint,method}                  gauge
+    auth_api_retries_total{method}                       counter
+    auth_api_retries_exhausted_total{method}             counter
+
+Endpoints are templated (e.g. `users/{email}`) so each label has a small
+number of values.
+
+A sink is any object with increment, add_to_gauge and observe methods.
+Set AUTH_API_METRICS_SINK to the dotted path of its class, or replace
+metrics.SINK at runtime.
+"""
+import bisect
+import logging
+import re
+import socket
+import threading
+
+from django.utils.module_loading import import_string
+
+from . import settings
+
+
+logger = logging.getLogger('django')
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class NullSink:
+    """Discards everything. Used when no sink is configured."""
+
+    def increment(self, name, labels, value=1):
+        pass
+
+    def add_to_gauge(self, name, labels, delta):
+        pass
+
+    def observe(self, name, labels, value):
+        pass
+
+
+class PrometheusSink:
+    """Aggregates metrics in memory and renders the Prometheus text format.
+
+    Values are per process, so with several workers each one has to be
+    scraped (or use the StatsD sink and aggregate there).
+    """
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._types = {}
+        self._values = {}
+        self._histograms = {}
+
+    def increment(self, name, labels, value=1):
+        key = (name, self._label_items(labels))
+        with self._lock:
+            self._types[name] = 'counter'
+            self._values[key] = self._values.get(key, 0) + value
+
+    def add_to_gauge(self, name, labels, delta):
+        key = (name, self._label_items(labels))
+        with self._lock:
+            self._types[name] = 'gauge'
+            self._values[key] = self._values.get(key, 0) + delta
+
+    def observe(self, name, labels, value):
+        key = (name, self._label_items(labels))
+        bucket = bisect.bisect_left(self.BUCKETS, value)
+        with self._lock:
+            self._types[name] = 'histogram'
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    # One extra bucket for +Inf
+                    'buckets': [0] * (len(self.BUCKETS) + 1),
+                    'sum': 0,
+                    'count': 0,
+                }
+            histogram['buckets'][bucket] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def render(self):
+        with self._lock:
+            types = dict(self._types)
+            values = dict(self._values)
+            histograms = {
+                key: dict(histogram, buckets=list(histogram['buckets']))
+                for key, histogram in self._histograms.items()
+            }
+
+        lines = []
+        for name in sorted(types):
+            lines.append('# TYPE {0} {1}'.format(name, types[name]))
+
+            for (key_name, labels), value in sorted(values.items()):
+                if key_name == name:
+                    lines.append(self._sample(name, labels, value))
+
+            for (key_name, labels), histogram in sorted(histograms.items()):
+                if key_name == name:
+                    lines.extend(self._histogram(name, labels, histogram))
+
+        return '\n'.join(lines) + '\n'
+
+    def _histogram(self, name, labels, histogram):
+        cumulative = 0
+        bounds = [str(bound) for bound in self.BUCKETS] + ['+Inf']
+        for bound, count in zip(bounds, histogram['buckets']):
+            cumulative += count
+            yield self._sample(
+                name + '_bucket', labels + (('le', bound),), cumulative)
+        yield self._sample(name + '_sum', labels, histogram['sum'])
+        yield self._sample(name + '_count', labels, histogram['count'])
+
+    def _sample(self, name, labels, value):
+        if not labels:
+            return '{0} {1}'.format(name, value)
+
+        label_text = ','.join(
+            '{0}="{1}"'.format(label, self._escape(label_value))
+            for label, label_value in labels
+        )
+        return '{0}{{{1}}} {2}'.format(name, label_text, value)
+
+    def _escape(self, value):
+        return (
+            str(value)
+            .replace('\\', '\\\\')
+            .replace('"', '\\"')
+            .replace('\n', '\\n')
+        )
+
+    def _label_items(self, labels):
+        return tuple(sorted((labels or {}).items()))
+
+
+class StatsdSink:
+    """Sends metrics to a StatsD server over UDP, without waiting.
+
+    Label values are appended to the metric name in label order, e.g.
+    kagiso_auth.auth_api_responses_total.sessions.POST.200
+    """
+
+    NAME_UNSAFE = re.compile(r'[^A-Za-z0-9_\-]')
+
+    def __init__(self, host=None, port=None, prefix=None):
+        self.address = (
+            host or settings.AUTH_API_STATSD_HOST,
+            port or settings.AUTH_API_STATSD_PORT,
+        )
+        self.prefix = prefix or settings.AUTH_API_STATSD_PREFIX
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def increment(self, name, labels, value=1):
+        self._send(name, labels, '{0}|c'.format(value))
+
+    def add_to_gauge(self, name, labels, delta):
+        # Signed values adjust a StatsD gauge instead of setting it
+        self._send(name, labels, '{0:+d}|g'.format(delta))
+
+    def observe(self, name, labels, value):
+        self._send(name, labels, '{0:.3f}|ms'.format(value * 1000))
+
+    def _send(self, name, labels, value):
+        parts = [self.prefix, name] + [
+            self.NAME_UNSAFE.sub('_', str(label_value))
+            for _, label_value in sorted((labels or {}).items())
+        ]
+        packet = '{0}:{1}'.format('.'.join(parts), value)
+        try:
+            self._socket.sendto(packet.encode('utf-8'), self.address)
+        except OSError:
+            # Metrics must never break a call
+            logger.debug('Could not send metric to StatsD', exc_info=True)
+
+
+def load_sink(path):
+    if not path:
+        return NullSink()
+
+    return import_string(path)()
+
+
+SINK = load_sink(settings.AUTH_API_METRICS_SINK)
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-17 02:32
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kagiso_auth', '0011_outboxuserupdate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='kagisouser',
+            name='birth_date',
+            field=models.DateField(db_index=True, null=True),
+        ),
+    ]
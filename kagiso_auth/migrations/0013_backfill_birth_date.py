@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import defaultdict
+
+from django.db import migrations, transaction
+
+from kagiso_auth.utils import parse_birth_date
+
+
+BATCH_SIZE = 1000
+
+
+def backfill_birth_date(apps, schema_editor):
+    KagisoUser = apps.get_model('kagiso_auth', 'KagisoUser')
+    users = KagisoUser.objects.using(schema_editor.connection.alias)
+    last_id = None
+
+    # Batches are walked by id and committed one at a time, so large
+    # tables are never locked for long
+    while True:
+        batch = users.filter(profile__isnull=False).order_by('id')
+        if last_id is not None:
+            batch = batch.filter(id__gt=last_id)
+        # Instances rather than values_list, which skips JSON decoding
+        rows = list(batch.only('id', 'profile')[:BATCH_SIZE])
+        if not rows:
+            return
+
+        ids_by_birth_date = defaultdict(list)
+        for user in rows:
+            birth_date = parse_birth_date(user.profile)
+            if birth_date:
+                ids_by_birth_date[birth_date].append(user.id)
+
+        with transaction.atomic(using=schema_editor.connection.alias):
+            # One UPDATE per distinct date rather than one per user
+            for birth_date, ids in ids_by_birth_date.items():
+                users.filter(id__in=ids).update(birth_date=birth_date)
+
+        last_id = rows[-1].id
+
+
+class Migration(migrations.Migration):
+
+    # Each batch commits on its own
+    atomic = False
+
+    dependencies = [
+        ('kagiso_auth', '0012_kagisouser_birth_date'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_birth_date,
+            migrations.RunPython.noop
+        ),
+    ]
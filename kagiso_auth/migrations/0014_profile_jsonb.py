@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, transaction
+
+import kagiso_auth.fields
+
+
+BATCH_SIZE = 1000
+
+# A plain ALTER COLUMN ... TYPE jsonb rewrites the table while holding an
+# exclusive lock. Instead the jsonb copy is built alongside the text column,
+# kept current by a trigger, and swapped in with a short lock at the end.
+#
+# The migration is not atomic, so every step can be run again if a later
+# one fails, e.g. when the swap times out waiting for its lock.
+ADD_COLUMN = '''
+ALTER TABLE kagiso_auth_kagisouser
+ADD COLUMN IF NOT EXISTS profile_jsonb jsonb;
+
+CREATE OR REPLACE FUNCTION kagiso_auth_copy_profile_jsonb()
+RETURNS trigger AS $$
+BEGIN
+    NEW.profile_jsonb := NEW.profile::jsonb;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS kagiso_auth_copy_profile_jsonb
+ON kagiso_auth_kagisouser;
+
+CREATE TRIGGER kagiso_auth_copy_profile_jsonb
+BEFORE INSERT OR UPDATE OF profile ON kagiso_auth_kagisouser
+FOR EACH ROW EXECUTE PROCEDURE kagiso_auth_copy_profile_jsonb();
+'''
+
+BACKFILL_BATCH = '''
+UPDATE kagiso_auth_kagisouser SET profile_jsonb = profile::jsonb
+WHERE id IN (
+    SELECT id FROM kagiso_auth_kagisouser
+    WHERE id > %s AND profile IS NOT NULL
+    ORDER BY id LIMIT %s
+)
+RETURNING id
+'''
+
+SWAP_COLUMNS = '''
+SET LOCAL lock_timeout = '5s';
+DROP TRIGGER IF EXISTS kagiso_auth_copy_profile_jsonb
+ON kagiso_auth_kagisouser;
+DROP FUNCTION IF EXISTS kagiso_auth_copy_profile_jsonb();
+ALTER TABLE kagiso_auth_kagisouser DROP COLUMN profile;
+ALTER TABLE kagiso_auth_kagisouser RENAME COLUMN profile_jsonb TO profile;
+'''
+
+REVERSE = '''
+ALTER TABLE kagiso_auth_kagisouser
+ALTER COLUMN profile TYPE text USING profile::text;
+'''
+
+
+def convert_to_jsonb(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute(ADD_COLUMN)
+
+    # Each batch commits on its own, so rows are only locked briefly
+    last_id = -1
+    while True:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(BACKFILL_BATCH, [last_id, BATCH_SIZE])
+                ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            break
+        last_id = max(ids)
+
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute(SWAP_COLUMNS)
+
+
+def convert_to_text(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(REVERSE)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('kagiso_auth', '0013_backfill_birth_date'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(convert_to_jsonb, convert_to_text),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='kagisouser',
+                    name='profile',
+                    field=kagiso_auth.fields.ProfileField(null=True),
+                ),
+            ],
+        ),
+    ]
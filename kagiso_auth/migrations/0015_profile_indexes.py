@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+# CONCURRENTLY builds each index without blocking writes, but cannot run
+# inside a transaction
+INDEXES = (
+    # Serves profile__json_contains, e.g. KagisoUser.objects.with_alert()
+    ('kagiso_auth_kagisouser_profile_gin',
+     'USING gin (profile jsonb_path_ops)'),
+    ('kagiso_auth_kagisouser_profile_region',
+     "((profile ->> 'region'))"),
+    ('kagiso_auth_kagisouser_profile_gender',
+     "((profile ->> 'gender'))"),
+)
+
+
+def create_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        for name, definition in INDEXES:
+            cursor.execute(
+                'CREATE INDEX CONCURRENTLY IF NOT EXISTS {0} '
+                'ON kagiso_auth_kagisouser {1}'.format(name, definition)
+            )
+
+
+def drop_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        for name, _ in INDEXES:
+            cursor.execute(
+                'DROP INDEX CONCURRENTLY IF EXISTS {0}'.format(name))
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('kagiso_auth', '0014_profile_jsonb'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
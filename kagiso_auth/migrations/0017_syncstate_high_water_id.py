@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-17 02:53
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kagiso_auth', '0016_demographiccount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncstate',
+            name='high_water_id',
+            field=models.IntegerField(null=True),
+        ),
+    ]
@@ -1,19 +1,69 @@
-from datetime import datetime
+from contextlib import contextmanager
+import copy
+from datetime import date, timedelta
+import threading
 
-from dateutil import parser
 from dateutil.relativedelta import relativedelta
-from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
+from django.contrib.auth.models import (
+    AbstractBaseUser,
+    Group,
+    Permission,
+    PermissionsMixin,
+)
+from django.contrib.auth.signals import user_logged_in
+from django.core.mail import EmailMessage
 from django.db import models
-from django.db.models.signals import pre_delete, pre_save
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
 from django.db.utils import IntegrityError
 from django.dispatch import receiver
 from django.utils import timezone
 from jsonfield import JSONField
 
-from . import http
+from . import http, settings
+from .async_auth_api_client import AsyncAuthApiClient
 from .auth_api_client import AuthApiClient
+from .cache import AuthenticatedUserCache, PermissionCache, UserLookupCache
 from .exceptions import AuthAPIUnexpectedStatusCode
-from .managers import AuthManager
+from .fields import ProfileField
+from .managers import (
+    age_band,
+    AuthManager,
+    DemographicCountManager,
+    OutboxEmailManager,
+    OutboxUserUpdateManager,
+)
+from .utils import parse_birth_date, parse_datetime
+
+
+_sync_state = threading.local()
+
+
+@contextmanager
+def syncing_from_auth_api():
+    """Save KagisoUsers locally only, without writing back to the Auth API.
+
+    The flag is thread-local, so other threads' saves still reach the Auth
+    API. It is not task-local: the async methods do their ORM work on the
+    caller's thread, which the event loop shares between coroutines. That
+    is only safe because nothing awaits inside a `with` block, so no other
+    coroutine can run while the flag is set. Keep it that way.
+    """
+    previous = is_syncing_from_auth_api()
+    _sync_state.active = True
+    try:
+        yield
+    finally:
+        _sync_state.active = previous
+
+
+def is_syncing_from_auth_api():
+    return getattr(_sync_state, 'active', False)
 
 
 class KagisoUser(AbstractBaseUser, PermissionsMixin):
@@ -25,18 +75,52 @@ class KagisoUser(AbstractBaseUser, PermissionsMixin):
     last_name = models.CharField(blank=True, null=True, max_length=100)
     is_staff = models.BooleanField(default=False)
     email_confirmed = models.DateTimeField(null=True)
-    profile = JSONField(null=True)
+    profile = ProfileField(null=True)
     is_active = models.BooleanField(default=True)
     created = models.DateTimeField()
     created_via = models.CharField(blank=True, null=True, max_length=100)
     modified = models.DateTimeField()
     last_sign_in_via = models.CharField(blank=True, null=True, max_length=100)
+    # Copied from profile['birth_date'] on save so ages can be queried
+    birth_date = models.DateField(null=True, db_index=True)
+
+    # Fields the Auth API stores and we PUT when they change locally
+    AUTH_API_FIELDS = (
+        'email',
+        'first_name',
+        'last_name',
+        'is_staff',
+        'is_superuser',
+        'profile',
+        'last_sign_in_via',
+    )
 
     confirmation_token = None
     raw_password = None
+    # AUTH_API_FIELDS values as last seen on the Auth API
+    _auth_api_snapshot = None
+
+    # Columns KagisoUser.demographics() is worked out from
+    DEMOGRAPHIC_FIELDS = (
+        'profile',
+        'birth_date',
+        'created_via',
+        'last_sign_in_via',
+    )
+    # demographics() as last saved, while DemographicCount is enabled
+    _demographics_snapshot = None
 
     objects = AuthManager()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_auth_api_fields()
+        if DemographicCount.ENABLED and not (
+                set(cls.DEMOGRAPHIC_FIELDS) & instance.get_deferred_fields()):
+            instance._demographics_snapshot = instance.demographics()
+        return instance
+
     def get_full_name(self):
         return self.email
 
@@ -53,13 +137,38 @@ class KagisoUser(AbstractBaseUser, PermissionsMixin):
 
     @property
     def age(self):
-        if self.profile and 'birth_date' in self.profile:
-            birth_date = parser.parse(self.profile['birth_date'])
-            today = datetime.now()
+        # The birth_date column is only refreshed on save, so it lags behind
+        # profile['birth_date'] until then. It is only used when profile
+        # wasn't loaded, to save a query.
+        if 'profile' in self.get_deferred_fields():
+            birth_date = self.birth_date
+        else:
+            birth_date = parse_birth_date(self.profile)
+        return self._years_since(birth_date)
 
-            passed_delta = relativedelta(today, birth_date)
+    @staticmethod
+    def _years_since(birth_date):
+        if birth_date:
+            passed_delta = relativedelta(date.today(), birth_date)
             return passed_delta.years
 
+    def demographics(self):
+        """The values this user is counted under in DemographicCount."""
+        profile = self.profile or {}
+        demographics = {
+            'region': profile.get('region'),
+            'gender': profile.get('gender'),
+            # The column only, as KagisoUser.objects.demographic_counts()
+            'age_band': age_band(self._years_since(self.birth_date)),
+            'created_via': self.created_via,
+            'last_sign_in_via': self.last_sign_in_via,
+        }
+        return {
+            # Truncated to fit DemographicCount.value
+            dimension: '' if value is None else str(value)[:100]
+            for dimension, value in demographics.items()
+        }
+
     def set_password(self, raw_password):
         # We don't want to save passwords locally
         self.set_unusable_password()
@@ -69,8 +178,29 @@ class KagisoUser(AbstractBaseUser, PermissionsMixin):
     @staticmethod
     def get_user_from_auth_db(email):
         endpoint = 'users/{email}'.format(email=email)
-        status, data = AuthApiClient.call(endpoint, 'GET')
+        status, data = UserLookupCache.get(
+            email,
+            lambda: AuthApiClient.call(endpoint, 'GET')
+        )
+        return KagisoUser._user_from_auth_db_response(email, status, data)
 
+    @staticmethod
+    async def aget_user_from_auth_db(email):
+        endpoint = 'users/{email}'.format(email=email)
+        cached = UserLookupCache.get_cached(
+            email,
+            lambda: AuthApiClient.call(endpoint, 'GET')
+        )
+        if cached is None:
+            status, data = await AsyncAuthApiClient.call(endpoint, 'GET')
+            UserLookupCache.set(email, status, data)
+        else:
+            status, data = cached
+
+        return KagisoUser._user_from_auth_db_response(email, status, data)
+
+    @staticmethod
+    def _user_from_auth_db_response(email, status, data):
         if status == http.HTTP_200_OK:
             user = KagisoUser.objects.filter(email=email).first()
             if not user:
@@ -83,25 +213,40 @@ class KagisoUser(AbstractBaseUser, PermissionsMixin):
 
     @staticmethod
     def sync_user_data_locally(data):
-        try:
-            pre_save.disconnect(
-                save_user_to_auth_api,
-                sender=KagisoUser
-            )
-            user = KagisoUser.objects.filter(
-                id=data['id']
-            ).first() or KagisoUser()
-            user.build_from_auth_api_data(data)
+        if settings.AUTH_API_WRITE_BEHIND:
+            # Don't undo local changes the Auth API hasn't received yet
+            pending_changes = OutboxUserUpdate.objects.pending_changes(
+                data['id'])
+            data = dict(data, **pending_changes)
+
+        user = KagisoUser.objects.filter(
+            id=data['id']
+        ).first() or KagisoUser()
+        previous_email = user.email
+        user.build_from_auth_api_data(data)
+
+        with syncing_from_auth_api():
             user.save()
-            return user
-        finally:
-            pre_save.connect(save_user_to_auth_api, sender=KagisoUser)
+
+        # We already hold fresh data, so prime the lookup cache with it
+        if previous_email != user.email:
+            UserLookupCache.invalidate(previous_email)
+        UserLookupCache.set(user.email, http.HTTP_200_OK, data)
+        return user
 
     def confirm_email(self, confirmation_token):
         payload = {'confirmation_token': confirmation_token}
         endpoint = 'confirm_email'
         status, data = AuthApiClient.call(endpoint, 'POST', payload)
+        self._email_confirmed(status, data)
 
+    async def aconfirm_email(self, confirmation_token):
+        payload = {'confirmation_token': confirmation_token}
+        endpoint = 'confirm_email'
+        status, data = await AsyncAuthApiClient.call(endpoint, 'POST', payload)
+        self._email_confirmed(status, data)
+
+    def _email_confirmed(self, status, data):
         if not status == http.HTTP_200_OK:
             raise AuthAPIUnexpectedStatusCode(status, data)
 
@@ -112,7 +257,14 @@ class KagisoUser(AbstractBaseUser, PermissionsMixin):
     def regenerate_confirmation_token(self):
         endpoint = 'users/{email}/confirmation_token'.format(email=self.email)
         status, data = AuthApiClient.call(endpoint, 'GET')
+        return self._confirmation_token_regenerated(status, data)
+
+    async def aregenerate_confirmation_token(self):
+        endpoint = 'users/{email}/confirmation_token'.format(email=self.email)
+        status, data = await AsyncAuthApiClient.call(endpoint, 'GET')
+        return self._confirmation_token_regenerated(status, data)
 
+    def _confirmation_token_regenerated(self, status, data):
         if not status == http.HTTP_200_OK:
             raise AuthAPIUnexpectedStatusCode(status, data)
 
@@ -122,7 +274,14 @@ class KagisoUser(AbstractBaseUser, PermissionsMixin):
     def generate_reset_password_token(self):
         endpoint = 'reset_password/{email}'.format(email=self.email)
         status, data = AuthApiClient.call(endpoint, 'GET')
+        return self._reset_password_token_generated(status, data)
 
+    async def agenerate_reset_password_token(self):
+        endpoint = 'reset_password/{email}'.format(email=self.email)
+        status, data = await AsyncAuthApiClient.call(endpoint, 'GET')
+        return self._reset_password_token_generated(status, data)
+
+    def _reset_password_token_generated(self, status, data):
         if not status == http.HTTP_200_OK:
             raise AuthAPIUnexpectedStatusCode(status, data)
 
@@ -135,7 +294,18 @@ class KagisoUser(AbstractBaseUser, PermissionsMixin):
         }
         endpoint = 'reset_password/{email}'.format(email=self.email)
         status, data = AuthApiClient.call(endpoint, 'POST', payload)
+        return self._password_reset(status, data)
+
+    async def areset_password(self, password, reset_password_token):
+        payload = {
+            'reset_password_token': reset_password_token,
+            'password': password,
+        }
+        endpoint = 'reset_password/{email}'.format(email=self.email)
+        status, data = await AsyncAuthApiClient.call(endpoint, 'POST', payload)
+        return self._password_reset(status, data)
 
+    def _password_reset(self, status, data):
         if not status == http.HTTP_200_OK:
             raise AuthAPIUnexpectedStatusCode(status, data)
 
@@ -144,12 +314,42 @@ class KagisoUser(AbstractBaseUser, PermissionsMixin):
     def record_sign_out(self):
         endpoint = 'sessions/{id}'.format(id=self.id)
         status, data = AuthApiClient.call(endpoint, 'DELETE')
+        return self._sign_out_recorded(status, data)
+
+    async def arecord_sign_out(self):
+        endpoint = 'sessions/{id}'.format(id=self.id)
+        status, data = await AsyncAuthApiClient.call(endpoint, 'DELETE')
+        return self._sign_out_recorded(status, data)
 
+    def _sign_out_recorded(self, status, data):
         if not status == http.HTTP_200_OK:
             raise AuthAPIUnexpectedStatusCode(status, data)
 
         return True
 
+    def _snapshot_auth_api_fields(self):
+        deferred_fields = self.get_deferred_fields()
+        self._auth_api_snapshot = {
+            field: copy.deepcopy(getattr(self, field))
+            for field in self.AUTH_API_FIELDS
+            if field not in deferred_fields
+        }
+
+    def _changed_auth_api_fields(self):
+        snapshot = self._auth_api_snapshot or {}
+        deferred_fields = self.get_deferred_fields()
+        changed = {}
+
+        for field in self.AUTH_API_FIELDS:
+            if field in deferred_fields:
+                continue
+
+            value = getattr(self, field)
+            if field not in snapshot or snapshot[field] != value:
+                changed[field] = value
+
+        return changed
+
     def build_from_auth_api_data(self, data):
         self.id = data['id']
         self.email = data['email']
@@ -159,10 +359,12 @@ class KagisoUser(AbstractBaseUser, PermissionsMixin):
         self.is_superuser = data.get('is_superuser', self.is_superuser)
         self.profile = data.get('profile', self.profile)
         self.confirmation_token = data.get('confirmation_token')
-        self.created = parser.parse(data['created'])
+        self.created = parse_datetime(data['created'])
         self.created_via = data.get('created_via')
-        self.modified = parser.parse(data['modified'])
+        self.modified = parse_datetime(data['modified'])
         self.last_sign_in_via = data.get('last_sign_in_via')
+        self.birth_date = parse_birth_date(self.profile)
+        self._snapshot_auth_api_fields()
 
     def _create_user_in_db_and_auth_api(self):
         payload = {
@@ -188,28 +390,42 @@ class KagisoUser(AbstractBaseUser, PermissionsMixin):
         self.build_from_auth_api_data(data)
 
     def _update_user_in_auth_api(self):
-        payload = {
-            'email': self.email,
-            'first_name': self.first_name,
-            'last_name': self.last_name,
-            'is_staff': self.is_staff,
-            'is_superuser': self.is_superuser,
-            'profile': self.profile,
-            'last_sign_in_via': self.last_sign_in_via
-        }
+        payload = self._changed_auth_api_fields()
+
+        # Nothing the Auth API stores has changed, e.g. only last_login
+        if not payload:
+            return
+
+        if settings.AUTH_API_WRITE_BEHIND:
+            write_behind_fields = settings.AUTH_API_WRITE_BEHIND_FIELDS
+            if set(payload) <= set(write_behind_fields):
+                # Saved locally now, PUT later by kagiso_flush_user_updates
+                OutboxUserUpdate.objects.enqueue(self, payload)
+                self._snapshot_auth_api_fields()
+                return
+
+            # Send queued changes along, or the response would undo them
+            payload = dict(
+                OutboxUserUpdate.objects.pending_changes(self.id),
+                **payload
+            )
 
         status, data = AuthApiClient.call(
             'users/{id}'.format(id=self.id), 'PUT', payload)
 
         if status == http.HTTP_200_OK:
+            if settings.AUTH_API_WRITE_BEHIND:
+                OutboxUserUpdate.objects.filter(user_id=self.id).delete()
+
             self.email = data['email']
             self.first_name = data.get('first_name')
             self.last_name = data.get('last_name')
             self.is_staff = data.get('is_staff')
             self.is_superuser = data.get('is_superuser')
             self.profile = data.get('profile')
-            self.modified = parser.parse(data['modified'])
+            self.modified = parse_datetime(data['modified'])
             self.last_sign_in_via = data.get('last_sign_in_via')
+            self._snapshot_auth_api_fields()
         elif status == http.HTTP_404_NOT_FOUND:
             # It is possible that a user exists locally but not on AuthAPI
             # eg. when converting an existing app to use AuthAPI
@@ -222,8 +438,165 @@ class KagisoUser(AbstractBaseUser, PermissionsMixin):
         return self.email  # pragma: no cover
 
 
+class OutboxModel(models.Model):
+    """A row sent by a worker, retried with exponential backoff.
+
+    Retry limits are read from the settings named SETTINGS_PREFIX +
+    `_MAX_ATTEMPTS`, `_RETRY_DELAY` and `_MAX_RETRY_DELAY`.
+    """
+
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, null=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        abstract = True
+        index_together = [
+            ('status', 'next_attempt'),
+        ]
+
+    def schedule_retry(self, error):
+        self.attempts += 1
+        self.last_error = str(error)
+
+        prefix = self.SETTINGS_PREFIX
+        if self.attempts >= getattr(settings, prefix + '_MAX_ATTEMPTS'):
+            self.status = self.FAILED
+        else:
+            backoff = 2 ** (self.attempts - 1)
+            delay = min(
+                getattr(settings, prefix + '_RETRY_DELAY') * backoff,
+                getattr(settings, prefix + '_MAX_RETRY_DELAY')
+            )
+            self.next_attempt = timezone.now() + timedelta(seconds=delay)
+
+        # Only the retry fields, so a concurrent change to the row is kept
+        self.save(update_fields=[
+            'status', 'attempts', 'next_attempt', 'last_error'])
+
+
+class OutboxEmail(OutboxModel):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    )
+    SETTINGS_PREFIX = 'AUTH_EMAIL_OUTBOX'
+
+    to = JSONField()
+    from_email = models.CharField(max_length=250)
+    subject = models.CharField(max_length=250)
+    template = models.CharField(blank=True, null=True, max_length=250)
+    substitution_data = JSONField(null=True)
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING
+    )
+    sent = models.DateTimeField(null=True)
+
+    objects = OutboxEmailManager()
+
+    def to_message(self, connection=None):
+        message = EmailMessage(connection=connection)
+        message.to = self.to
+        message.from_email = self.from_email
+        message.subject = self.subject
+        # Used by our SparkPost email backend
+        message.template = self.template
+        message.substitution_data = self.substitution_data
+        return message
+
+    def mark_sent(self):
+        self.status = self.SENT
+        self.sent = timezone.now()
+        self.attempts += 1
+        # Drop the confirmation and reset tokens once they are delivered
+        self.substitution_data = None
+        self.save()
+
+    def __str__(self):
+        return self.subject  # pragma: no cover
+
+
+class OutboxUserUpdate(OutboxModel):
+    """Local changes to a user waiting to be PUT to the Auth API."""
+
+    PENDING = 'pending'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (FAILED, 'Failed'),
+    )
+    SETTINGS_PREFIX = 'AUTH_API_WRITE_BEHIND'
+
+    user = models.OneToOneField(
+        KagisoUser,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    # Latest value of every Auth API field changed since the last flush
+    changes = JSONField()
+    # Their values before the first of those changes, for merging with
+    # edits made on the Auth API in the meantime
+    original = JSONField()
+    # When the latest change was made, to tell it from newer Auth API edits
+    changed_at = models.DateTimeField()
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING
+    )
+
+    objects = OutboxUserUpdateManager()
+
+    def __str__(self):
+        return str(self.user_id)  # pragma: no cover
+
+
+class DemographicCount(models.Model):
+    """Users counted by region, gender, age band and sign up/in method.
+
+    Kept up to date as users are saved, synced and deleted, so dashboards
+    read a handful of rows instead of scanning KagisoUser. Age bands drift
+    as users have birthdays, so run kagiso_rebuild_demographics daily.
+    """
+
+    ENABLED = settings.AUTH_DEMOGRAPHICS_ENABLED
+
+    dimension = models.CharField(max_length=50)
+    value = models.CharField(max_length=100)
+    count = models.IntegerField(default=0)
+
+    objects = DemographicCountManager()
+
+    class Meta:
+        unique_together = ('dimension', 'value')
+
+    def __str__(self):
+        return '{0}={1}'.format(self.dimension, self.value)  # pragma: no cover
+
+
+class SyncState(models.Model):
+    # (modified, id) of the last Auth API user applied by an incremental
+    # sync
+    name = models.CharField(max_length=100, unique=True)
+    high_water_mark = models.DateTimeField(null=True)
+    high_water_id = models.IntegerField(null=True)
+
+    def __str__(self):
+        return self.name  # pragma: no cover
+
+
 @receiver(pre_delete, sender=KagisoUser)
 def delete_user_from_auth_api(sender, instance, *args, **kwargs):
+    if is_syncing_from_auth_api():
+        return
+
     status, data = AuthApiClient.call(
         'users/{id}'.format(id=instance.id), 'DELETE')
 
@@ -233,10 +606,101 @@ def delete_user_from_auth_api(sender, instance, *args, **kwargs):
     if status not in (http.HTTP_204_NO_CONTENT, http.HTTP_404_NOT_FOUND):
         raise AuthAPIUnexpectedStatusCode(status, data)
 
+    UserLookupCache.invalidate(instance.email)
+
 
 @receiver(pre_save, sender=KagisoUser)
 def save_user_to_auth_api(sender, instance, *args, **kwargs):
+    if is_syncing_from_auth_api():
+        return
+
+    previous_email = (instance._auth_api_snapshot or {}).get('email')
+
     if not instance.id:
         instance._create_user_in_db_and_auth_api()
     else:
         instance._update_user_in_auth_api()
+
+    UserLookupCache.invalidate(previous_email, instance.email)
+
+
+@receiver(pre_save, sender=KagisoUser)
+def set_birth_date(sender, instance, *args, **kwargs):
+    # Connected after save_user_to_auth_api, which may update profile
+    instance.birth_date = parse_birth_date(instance.profile)
+
+
+@receiver(pre_save, sender=KagisoUser)
+def snapshot_demographics(sender, instance, *args, **kwargs):
+    if not DemographicCount.ENABLED or instance._demographics_snapshot:
+        return
+
+    # Not loaded from the database, or loaded with deferred fields
+    previous = KagisoUser.objects.filter(id=instance.id).only(
+        *KagisoUser.DEMOGRAPHIC_FIELDS).first()
+    if previous:
+        instance._demographics_snapshot = previous.demographics()
+
+
+@receiver(post_save, sender=KagisoUser)
+def update_demographics(sender, instance, *args, **kwargs):
+    if not DemographicCount.ENABLED:
+        return
+
+    before = instance._demographics_snapshot
+    after = instance.demographics()
+    if before != after:
+        DemographicCount.objects.apply([before] if before else [], [after])
+    instance._demographics_snapshot = after
+
+
+@receiver(post_delete, sender=KagisoUser)
+def remove_demographics(sender, instance, *args, **kwargs):
+    if not DemographicCount.ENABLED:
+        return
+
+    before = instance._demographics_snapshot or instance.demographics()
+    DemographicCount.objects.apply([before], [])
+    instance._demographics_snapshot = None
+
+
+@receiver(post_save, sender=KagisoUser)
+@receiver(post_delete, sender=KagisoUser)
+def invalidate_authenticated_user(sender, instance, *args, **kwargs):
+    # Runs for local-only saves too (e.g. syncing or updating last_login)
+    AuthenticatedUserCache.invalidate(instance.id)
+
+
+@receiver(user_logged_in)
+def warm_permission_cache(sender, user, *args, **kwargs):
+    # Work the permissions out once at sign in rather than on the first
+    # page that checks one
+    if PermissionCache.TTL and isinstance(user, KagisoUser):
+        user.get_all_permissions()
+
+
+@receiver(m2m_changed, sender=KagisoUser.groups.through)
+@receiver(m2m_changed, sender=KagisoUser.user_permissions.through)
+def invalidate_user_permissions(sender, instance, action, *args, **kwargs):
+    if not action.startswith('post_'):
+        return
+
+    if isinstance(instance, KagisoUser):
+        PermissionCache.invalidate(instance.id)
+    else:
+        # Changed from the group or permission side, e.g. group.user_set
+        PermissionCache.invalidate_all()
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_group_permissions(sender, action, *args, **kwargs):
+    if action.startswith('post_'):
+        PermissionCache.invalidate_all()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def invalidate_all_permissions(sender, *args, **kwargs):
+    PermissionCache.invalidate_all()
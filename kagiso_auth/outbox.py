@@ -0,0 +1,53 @@
+from django.core.mail import get_connection
+from django.db import transaction
+
+from . import settings
+from .models import OutboxEmail
+
+
+def send_email(message):
+    if settings.AUTH_EMAIL_OUTBOX:
+        OutboxEmail.objects.enqueue(message)
+    else:
+        message.send()
+
+
+def send_pending(batch_size=100):
+    """Send one batch of due outbox emails.
+
+    Returns a (sent, failed) tuple. Failed emails are retried with
+    exponential backoff until AUTH_EMAIL_OUTBOX_MAX_ATTEMPTS is reached,
+    including every email in the batch when the mail provider can't be
+    reached at all.
+    """
+    sent = failed = 0
+
+    with transaction.atomic():
+        emails = OutboxEmail.objects.claim(batch_size)
+        if not emails:
+            return sent, failed
+
+        # Share one connection to the mail provider across the batch
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as e:
+            # The provider is down, so nothing in the batch can be sent
+            for email in emails:
+                email.schedule_retry(e)
+            return sent, len(emails)
+
+        try:
+            for email in emails:
+                try:
+                    email.to_message(connection).send()
+                except Exception as e:
+                    email.schedule_retry(e)
+                    failed += 1
+                else:
+                    email.mark_sent()
+                    sent += 1
+        finally:
+            connection.close()
+
+    return sent, failed
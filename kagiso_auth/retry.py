@@ -0,0 +1,74 @@
+import random
+import time
+
+from . import metrics, settings
+
+
+class RetryPolicy:
+    """Decides whether, and after how long, a failed call is tried again.
+
+    METHODS (GET and DELETE) are idempotent, so are retried freely.
+    KEYED_METHODS (POST and PUT) are not, so are only retried when they
+    carry an idempotency key, letting the Auth API tell a retry from a new
+    request. Calls are retried after network errors, timeouts and
+    RETRY_STATUS_CODES responses, up to RETRIES times.
+
+    Delays are picked at random between 0 and BACKOFF * 2 ** retry seconds
+    (capped at MAX_BACKOFF), so a fleet of workers that failed together do
+    not retry together. Every attempt and delay must fit within DEADLINE
+    seconds of the first attempt starting.
+
+    One policy is made per call.
+    """
+
+    RETRIES = settings.AUTH_API_RETRIES
+    BACKOFF = settings.AUTH_API_RETRY_BACKOFF
+    MAX_BACKOFF = settings.AUTH_API_RETRY_MAX_BACKOFF
+    DEADLINE = settings.AUTH_API_RETRY_DEADLINE
+    METHODS = settings.AUTH_API_RETRY_METHODS
+    # Not idempotent, so only retried with an idempotency key
+    KEYED_METHODS = settings.AUTH_API_RETRY_KEYED_METHODS
+    RETRY_STATUS_CODES = (502, 503, 504)
+
+    def __init__(self, method, idempotency_key=None):
+        self.method = method
+        self.retries = 0
+        if idempotency_key:
+            methods = self.METHODS + self.KEYED_METHODS
+        else:
+            methods = self.METHODS
+        self.retryable = self.RETRIES > 0 and method in methods
+        self.deadline = time.monotonic() + self.DEADLINE
+
+    def timeout(self, timeout):
+        """Return the timeout for the next attempt, within the deadline."""
+        if not self.retryable:
+            return timeout
+
+        return max(min(timeout, self.deadline - time.monotonic()), 0.001)
+
+    def should_retry_status(self, status_code):
+        return status_code in self.RETRY_STATUS_CODES and self.backoff()
+
+    def backoff(self):
+        """Wait before the next attempt, or return False if there is none."""
+        if not self.retryable:
+            return False
+
+        if self.retries >= self.RETRIES:
+            self._count('auth_api_retries_exhausted_total')
+            return False
+
+        cap = min(self.MAX_BACKOFF, self.BACKOFF * 2 ** self.retries)
+        delay = random.uniform(0, cap)
+        if time.monotonic() + delay >= self.deadline:
+            self._count('auth_api_retries_exhausted_total')
+            return False
+
+        time.sleep(delay)
+        self.retries += 1
+        self._count('auth_api_retries_total')
+        return True
+
+    def _count(self, name):
+        metrics.SINK.increment(name, {'method': self.method})
@@ -13,3 +13,316 @@ AUTH_API_BASE_URL = os.getenv('AUTH_API_BASE_URL') or getattr(
     'AUTH_API_BASE_URL',
     'https://auth.kagiso.io/api/v1'
 )
+
+# Connection pooling for AuthApiClient, see transport.SessionTransport
+AUTH_API_POOL_CONNECTIONS = getattr(
+    settings,
+    'AUTH_API_POOL_CONNECTIONS',
+    10
+)
+
+AUTH_API_POOL_MAXSIZE = getattr(
+    settings,
+    'AUTH_API_POOL_MAXSIZE',
+    10
+)
+
+AUTH_API_POOL_BLOCK = getattr(
+    settings,
+    'AUTH_API_POOL_BLOCK',
+    False
+)
+
+AUTH_API_KEEP_ALIVE = getattr(
+    settings,
+    'AUTH_API_KEEP_ALIVE',
+    True
+)
+
+# Cache used to share state (e.g. circuit breakers) between workers
+AUTH_API_CACHE_ALIAS = getattr(
+    settings,
+    'AUTH_API_CACHE_ALIAS',
+    'default'
+)
+
+# Circuit breaker around AuthApiClient, see circuit_breaker.CircuitBreaker
+AUTH_API_CIRCUIT_BREAKER_ENABLED = getattr(
+    settings,
+    'AUTH_API_CIRCUIT_BREAKER_ENABLED',
+    False
+)
+
+AUTH_API_CIRCUIT_BREAKER_FAILURE_THRESHOLD = getattr(
+    settings,
+    'AUTH_API_CIRCUIT_BREAKER_FAILURE_THRESHOLD',
+    5
+)
+
+AUTH_API_CIRCUIT_BREAKER_LATENCY_THRESHOLD = getattr(
+    settings,
+    'AUTH_API_CIRCUIT_BREAKER_LATENCY_THRESHOLD',
+    3
+)
+
+AUTH_API_CIRCUIT_BREAKER_RESET_TIMEOUT = getattr(
+    settings,
+    'AUTH_API_CIRCUIT_BREAKER_RESET_TIMEOUT',
+    30
+)
+
+# Concurrent identical GETs share one Auth API call, see
+# single_flight.SingleFlight
+AUTH_API_SINGLE_FLIGHT = getattr(
+    settings,
+    'AUTH_API_SINGLE_FLIGHT',
+    True
+)
+
+# Seconds to hold a cache lock so identical GETs are also shared between
+# processes. 0 only coalesces calls within a process.
+AUTH_API_SINGLE_FLIGHT_LOCK_TIMEOUT = getattr(
+    settings,
+    'AUTH_API_SINGLE_FLIGHT_LOCK_TIMEOUT',
+    0
+)
+
+# Retries of failed AuthApiClient calls, see retry.RetryPolicy.
+# 0 makes a single attempt.
+AUTH_API_RETRIES = getattr(
+    settings,
+    'AUTH_API_RETRIES',
+    0
+)
+
+# Seconds, the cap on the random delay doubles on every retry
+AUTH_API_RETRY_BACKOFF = getattr(
+    settings,
+    'AUTH_API_RETRY_BACKOFF',
+    0.1
+)
+
+AUTH_API_RETRY_MAX_BACKOFF = getattr(
+    settings,
+    'AUTH_API_RETRY_MAX_BACKOFF',
+    2
+)
+
+# Seconds that all attempts of a call, and the delays between them, must
+# fit in
+AUTH_API_RETRY_DEADLINE = getattr(
+    settings,
+    'AUTH_API_RETRY_DEADLINE',
+    10
+)
+
+# Methods that are always safe to retry
+AUTH_API_RETRY_METHODS = getattr(
+    settings,
+    'AUTH_API_RETRY_METHODS',
+    ('GET', 'DELETE')
+)
+
+# Methods that are not idempotent, so are only retried when the call has
+# an Idempotency-Key header
+AUTH_API_RETRY_KEYED_METHODS = getattr(
+    settings,
+    'AUTH_API_RETRY_KEYED_METHODS',
+    ('POST', 'PUT')
+)
+
+# Send an Idempotency-Key header with every POST and PUT, so they can be
+# retried. Only turn this on once the Auth API honours the header.
+AUTH_API_IDEMPOTENCY_KEYS = getattr(
+    settings,
+    'AUTH_API_IDEMPOTENCY_KEYS',
+    False
+)
+
+# Queue saves that only change AUTH_API_WRITE_BEHIND_FIELDS and PUT them
+# to the Auth API with `manage.py kagiso_flush_user_updates`, instead of
+# while the user waits
+AUTH_API_WRITE_BEHIND = getattr(
+    settings,
+    'AUTH_API_WRITE_BEHIND',
+    False
+)
+
+AUTH_API_WRITE_BEHIND_FIELDS = getattr(
+    settings,
+    'AUTH_API_WRITE_BEHIND_FIELDS',
+    ('first_name', 'last_name', 'profile')
+)
+
+AUTH_API_WRITE_BEHIND_MAX_ATTEMPTS = getattr(
+    settings,
+    'AUTH_API_WRITE_BEHIND_MAX_ATTEMPTS',
+    8
+)
+
+# Seconds before the first retry, doubled on every further attempt
+AUTH_API_WRITE_BEHIND_RETRY_DELAY = getattr(
+    settings,
+    'AUTH_API_WRITE_BEHIND_RETRY_DELAY',
+    30
+)
+
+AUTH_API_WRITE_BEHIND_MAX_RETRY_DELAY = getattr(
+    settings,
+    'AUTH_API_WRITE_BEHIND_MAX_RETRY_DELAY',
+    60 * 60
+)
+
+# Seconds a worker has to flush a batch before other workers may claim it
+AUTH_API_WRITE_BEHIND_LEASE = getattr(
+    settings,
+    'AUTH_API_WRITE_BEHIND_LEASE',
+    5 * 60
+)
+
+# Keep DemographicCount up to date as users are saved, synced and deleted.
+# Build it first with `manage.py kagiso_rebuild_demographics`.
+AUTH_DEMOGRAPHICS_ENABLED = getattr(
+    settings,
+    'AUTH_DEMOGRAPHICS_ENABLED',
+    False
+)
+
+# Dotted path to the class metrics are sent to, e.g.
+# 'kagiso_auth.metrics.PrometheusSink' or 'kagiso_auth.metrics.StatsdSink'.
+# None disables metrics.
+AUTH_API_METRICS_SINK = getattr(
+    settings,
+    'AUTH_API_METRICS_SINK',
+    None
+)
+
+AUTH_API_STATSD_HOST = getattr(
+    settings,
+    'AUTH_API_STATSD_HOST',
+    'localhost'
+)
+
+AUTH_API_STATSD_PORT = getattr(
+    settings,
+    'AUTH_API_STATSD_PORT',
+    8125
+)
+
+AUTH_API_STATSD_PREFIX = getattr(
+    settings,
+    'AUTH_API_STATSD_PREFIX',
+    'kagiso_auth'
+)
+
+# Read-through cache for KagisoUser.get_user_from_auth_db lookups, in seconds.
+# A TTL of 0 disables the cache.
+AUTH_API_USER_CACHE_TTL = getattr(
+    settings,
+    'AUTH_API_USER_CACHE_TTL',
+    0
+)
+
+AUTH_API_USER_CACHE_NEGATIVE_TTL = getattr(
+    settings,
+    'AUTH_API_USER_CACHE_NEGATIVE_TTL',
+    60
+)
+
+AUTH_API_USER_CACHE_STALE_TTL = getattr(
+    settings,
+    'AUTH_API_USER_CACHE_STALE_TTL',
+    60
+)
+
+# Seconds to cache the user KagisoBackend.get_user loads for every
+# authenticated request. 0 disables the cache.
+AUTH_USER_CACHE_TTL = getattr(
+    settings,
+    'AUTH_USER_CACHE_TTL',
+    0
+)
+
+# Seconds to cache each user's permission set between requests.
+# 0 disables the cache.
+AUTH_PERMISSION_CACHE_TTL = getattr(
+    settings,
+    'AUTH_PERMISSION_CACHE_TTL',
+    0
+)
+
+# Fail repeated wrong sign ins locally instead of calling the Auth API,
+# see throttle.SignInThrottle
+AUTH_SIGN_IN_THROTTLE_ENABLED = getattr(
+    settings,
+    'AUTH_SIGN_IN_THROTTLE_ENABLED',
+    False
+)
+
+# Failed sign ins allowed per email, and per client IP, every period
+AUTH_SIGN_IN_THROTTLE_EMAIL_LIMIT = getattr(
+    settings,
+    'AUTH_SIGN_IN_THROTTLE_EMAIL_LIMIT',
+    5
+)
+
+AUTH_SIGN_IN_THROTTLE_IP_LIMIT = getattr(
+    settings,
+    'AUTH_SIGN_IN_THROTTLE_IP_LIMIT',
+    50
+)
+
+AUTH_SIGN_IN_THROTTLE_PERIOD = getattr(
+    settings,
+    'AUTH_SIGN_IN_THROTTLE_PERIOD',
+    5 * 60
+)
+
+# Seconds to remember a wrong email and password pair. 0 disables.
+AUTH_SIGN_IN_NEGATIVE_TTL = getattr(
+    settings,
+    'AUTH_SIGN_IN_NEGATIVE_TTL',
+    60
+)
+
+# Queue confirmation and password reset emails in the database and send them
+# with `manage.py kagiso_send_emails` instead of sending them in the request
+AUTH_EMAIL_OUTBOX = getattr(
+    settings,
+    'AUTH_EMAIL_OUTBOX',
+    False
+)
+
+AUTH_EMAIL_OUTBOX_MAX_ATTEMPTS = getattr(
+    settings,
+    'AUTH_EMAIL_OUTBOX_MAX_ATTEMPTS',
+    8
+)
+
+# Seconds before the first retry, doubled on every further attempt
+AUTH_EMAIL_OUTBOX_RETRY_DELAY = getattr(
+    settings,
+    'AUTH_EMAIL_OUTBOX_RETRY_DELAY',
+    30
+)
+
+AUTH_EMAIL_OUTBOX_MAX_RETRY_DELAY = getattr(
+    settings,
+    'AUTH_EMAIL_OUTBOX_MAX_RETRY_DELAY',
+    60 * 60
+)
+
+# Shared secret the Auth API signs webhook requests with
+AUTH_API_WEBHOOK_SECRET = os.getenv('AUTH_API_WEBHOOK_SECRET') or getattr(
+    settings,
+    'AUTH_API_WEBHOOK_SECRET',
+    None
+)
+
+# Seconds a signed webhook request is accepted for, either side of its
+# timestamp. Older deliveries are rejected as possible replays.
+AUTH_API_WEBHOOK_TOLERANCE = getattr(
+    settings,
+    'AUTH_API_WEBHOOK_TOLERANCE',
+    5 * 60
+)
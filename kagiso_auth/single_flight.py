@@ -0,0 +1,112 @@
+import copy
+import os
+import threading
+import time
+
+from . import settings
+from .cache import get_cache, hash_key_part, make_key
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Shares one in-flight call between concurrent callers with the same key.
+
+    The first caller for a key (the leader) runs the function and every
+    caller that arrives while it is running waits for, and gets a copy of,
+    the leader's result or exception. The leader gets a copy too whenever
+    anyone waited, so no caller can mutate another's result. Nothing is
+    kept once the call ends, so this never serves a result that is older
+    than the call in progress.
+
+    With a LOCK_TIMEOUT the leader also takes a lock in the Django cache
+    and publishes its result there, so callers in other processes wait for
+    it instead of calling too. If the leader fails or takes longer than
+    LOCK_TIMEOUT they go ahead and make the call themselves.
+    """
+
+    LOCK_TIMEOUT = settings.AUTH_API_SINGLE_FLIGHT_LOCK_TIMEOUT
+    POLL_INTERVAL = 0.05
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._pid = os.getpid()
+
+    def do(self, key, func):
+        pid = os.getpid()
+        if self._pid != pid:
+            # Forked mid-call: the leader thread is not coming with us
+            self._lock = threading.Lock()
+            self._calls = {}
+            self._pid = pid
+
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            # Callers may mutate what they get back
+            return copy.deepcopy(call.result)
+
+        try:
+            result = self._do_across_processes(key, func)
+        except Exception as e:
+            call.error = e
+            raise
+        else:
+            call.result = result
+        finally:
+            with self._lock:
+                del self._calls[key]
+                # No one can join once the call is gone, so this is final
+                waiters = call.waiters
+            call.done.set()
+
+        # Followers copy call.result, so the leader's caller mustn't be
+        # able to mutate it under them
+        return copy.deepcopy(result) if waiters else result
+
+    def _do_across_processes(self, key, func):
+        if not self.LOCK_TIMEOUT:
+            return func()
+
+        cache = get_cache()
+        lock_key = make_key('single_flight', hash_key_part(key), 'lock')
+        result_key = make_key('single_flight', hash_key_part(key), 'result')
+
+        if not cache.add(lock_key, True, self.LOCK_TIMEOUT):
+            deadline = time.monotonic() + self.LOCK_TIMEOUT
+            while time.monotonic() < deadline:
+                result = cache.get(result_key)
+                if result is not None:
+                    return result
+                if cache.get(lock_key) is None:
+                    # The leader finished without a result for us
+                    break
+                time.sleep(self.POLL_INTERVAL)
+
+            return func()
+
+        try:
+            # Don't hand a previous leader's result to our followers
+            cache.delete(result_key)
+            result = func()
+            cache.set(result_key, result, self.LOCK_TIMEOUT)
+            return result
+        finally:
+            cache.delete(lock_key)
@@ -0,0 +1,349 @@
+"""Bulk mirroring of Auth API users into the local KagisoUser table.
+
+Records flow through a generator pipeline, so only one batch of users is
+ever held in memory:
+
+    source -> build_users -> batched -> upsert_users
+
+Upserts bypass KagisoUser.save, so no pre_save receiver fires and nothing is
+written back to the Auth API.
+"""
+import itertools
+import json
+import logging
+
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from . import http
+from .auth_api_client import AuthApiClient
+from .cache import AuthenticatedUserCache, UserLookupCache
+from .exceptions import AuthAPIUnexpectedStatusCode
+from .models import DemographicCount, KagisoUser, SyncState
+
+
+logger = logging.getLogger('django')
+
+# Columns overwritten with Auth API data when a user already exists locally
+SYNC_FIELDS = (
+    'email',
+    'first_name',
+    'last_name',
+    'is_staff',
+    'is_superuser',
+    'profile',
+    'created',
+    'created_via',
+    'modified',
+    'last_sign_in_via',
+    'birth_date',
+)
+
+# Columns only written for users new to the local table
+INSERT_ONLY_FIELDS = (
+    'password',
+    'is_active',
+)
+
+
+def read_json_lines(lines):
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_auth_api_users(page_size=500, start=0, params=None):
+    """Yield user records from the paginated `users` endpoint.
+
+    `start` is the number of records to skip, so an interrupted sync can
+    resume from the page it stopped on.
+    """
+    page = start // page_size + 1
+    skip = start % page_size
+
+    while True:
+        page_params = dict(params or {}, page=page, page_size=page_size)
+        status, data = AuthApiClient.call('users', 'GET', params=page_params)
+
+        if not status == http.HTTP_200_OK:
+            raise AuthAPIUnexpectedStatusCode(status, data)
+
+        results = data.get('results', [])
+        yield from results[skip:]
+
+        if not results or not data.get('next'):
+            return
+
+        page += 1
+        skip = 0
+
+
+def build_users(records):
+    for record in records:
+        user = KagisoUser()
+        user.build_from_auth_api_data(record)
+        user.set_unusable_password()
+        yield user
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def upsert_users(users):
+    """Insert or update users in one transaction, returning those skipped.
+
+    A user is skipped, with a warning logged, when its email belongs to a
+    different local user. Applying it would violate the unique constraint
+    on email and abort the whole batch.
+    """
+    connection = connections[router.db_for_write(KagisoUser)]
+    users, skipped = _without_email_conflicts(
+        _latest_by_id(users), connection)
+
+    for user in skipped:
+        logger.warning(
+            'Skipped syncing user {0}, email is taken by another local '
+            'user'.format(user.id)
+        )
+
+    if not users:
+        return skipped
+
+    with transaction.atomic(using=connection.alias):
+        if DemographicCount.ENABLED:
+            before = [
+                user.demographics()
+                for user in KagisoUser.objects.using(connection.alias).filter(
+                    id__in=[user.id for user in users]
+                ).only(*KagisoUser.DEMOGRAPHIC_FIELDS)
+            ]
+
+        if connection.vendor == 'postgresql':
+            _insert_on_conflict_update(users, connection)
+        else:
+            _bulk_create_and_update(users, connection)
+
+        if DemographicCount.ENABLED:
+            DemographicCount.objects.db_manager(connection.alias).apply(
+                before, [user.demographics() for user in users])
+
+    UserLookupCache.invalidate(*[user.email for user in users])
+    AuthenticatedUserCache.invalidate(*[user.id for user in users])
+
+    return skipped
+
+
+def sync_users(records, batch_size=1000, on_batch=None):
+    """Upsert records in batches.
+
+    Returns a (synced, skipped) tuple, where synced counts the users written
+    and skipped lists those left out by upsert_users. `on_batch` is called
+    with the number of records read so far after each batch commits.
+    """
+    read = 0
+    skipped = []
+
+    for batch in batched(build_users(records), batch_size):
+        skipped.extend(upsert_users(batch))
+        read += len(batch)
+
+        if on_batch:
+            on_batch(read)
+
+    return read - len(skipped), skipped
+
+
+def iter_modified_users(page_size=500, since=None, since_id=None):
+    """Yield user records modified after (`since`, `since_id`), oldest first.
+
+    Pages by keyset rather than page number: every request asks for users
+    modified since the last record yielded, ordered by (modified, id), and
+    drops the ones already seen. A user modified mid-run moves to the end
+    of the ordering instead of shifting a page boundary, so none are
+    skipped. The next page number is only requested while a whole page is
+    made up of ties already seen.
+    """
+    cursor = (since, since_id or 0) if since else None
+    page = 1
+
+    while True:
+        params = {
+            'ordering': 'modified,id',
+            'page': page,
+            'page_size': page_size,
+        }
+        if cursor:
+            params['modified_since'] = cursor[0].isoformat()
+
+        status, data = AuthApiClient.call('users', 'GET', params=params)
+
+        if not status == http.HTTP_200_OK:
+            raise AuthAPIUnexpectedStatusCode(status, data)
+
+        results = data.get('results', [])
+        unseen = False
+
+        for record in results:
+            key = (parse_datetime(record['modified']), record['id'])
+            if cursor and key <= cursor:
+                continue
+
+            cursor = key
+            unseen = True
+            yield record
+
+        if not results or not data.get('next'):
+            return
+
+        page = 1 if unseen else page + 1
+
+
+def sync_modified_users(page_size=500, batch_size=1000, on_batch=None):
+    """Upsert only the users modified since the last incremental sync.
+
+    The (modified, id) of the last user applied is stored as a high-water
+    mark in the same transaction as each batch, and the next run carries on
+    from there, so an interrupted run loses nothing.
+
+    Returns a (synced, skipped) tuple like sync_users. The mark stops just
+    before the first user skipped, so skipped users are tried again on every
+    run until their email conflict is resolved.
+    """
+    state, _ = SyncState.objects.get_or_create(name='users')
+    records = iter_modified_users(
+        page_size,
+        since=state.high_water_mark,
+        since_id=state.high_water_id,
+    )
+    read = 0
+    skipped = []
+
+    def key(user):
+        return (user.modified, user.id)
+
+    for batch in batched(build_users(records), batch_size):
+        with transaction.atomic():
+            batch_skipped = upsert_users(batch)
+
+            if not skipped:
+                applied = batch
+                if batch_skipped:
+                    first_skipped = min(map(key, batch_skipped))
+                    applied = [
+                        user for user in batch if key(user) < first_skipped
+                    ]
+                if applied:
+                    _advance_high_water_mark(state, max(applied, key=key))
+
+        read += len(batch)
+        skipped.extend(batch_skipped)
+        if on_batch:
+            on_batch(read)
+
+    return read - len(skipped), skipped
+
+
+def _advance_high_water_mark(state, last):
+    # Only ever move forwards, even if runs overlap
+    behind = Q(high_water_mark__isnull=True)
+    behind |= Q(high_water_mark__lt=last.modified)
+    behind |= Q(high_water_mark=last.modified, high_water_id__isnull=True)
+    behind |= Q(high_water_mark=last.modified, high_water_id__lt=last.id)
+    SyncState.objects.filter(behind, name=state.name).update(
+        high_water_mark=last.modified,
+        high_water_id=last.id,
+    )
+
+
+def _latest_by_id(users):
+    # A user modified mid-sync can appear twice in a batch, and ON CONFLICT
+    # DO UPDATE cannot affect the same row twice in one statement
+    latest = {}
+    for user in users:
+        if user.id not in latest or user.modified >= latest[user.id].modified:
+            latest[user.id] = user
+    return list(latest.values())
+
+
+def _without_email_conflicts(users, connection):
+    owners = dict(
+        KagisoUser.objects.using(connection.alias).filter(
+            email__in=[user.email for user in users]
+        ).values_list('email', 'id')
+    )
+
+    # Within the batch, the most recently modified user keeps an email
+    for user in sorted(users, key=lambda user: user.modified, reverse=True):
+        owners.setdefault(user.email, user.id)
+
+    applied, skipped = [], []
+    for user in users:
+        if owners[user.email] == user.id:
+            applied.append(user)
+        else:
+            skipped.append(user)
+
+    return applied, skipped
+
+
+def _insert_on_conflict_update(users, connection):
+    # One INSERT ... ON CONFLICT statement per batch. Django 1.10 has no
+    # bulk_update, and a per-row UPDATE would cost a round-trip each.
+    quote_name = connection.ops.quote_name
+    opts = KagisoUser._meta
+    fields = [
+        opts.get_field(name)
+        for name in ('id',) + SYNC_FIELDS + INSERT_ONLY_FIELDS
+    ]
+
+    row = '({0})'.format(', '.join(['%s'] * len(fields)))
+    sql = (
+        'INSERT INTO {table} ({columns}) VALUES {rows} '
+        'ON CONFLICT ({pk}) DO UPDATE SET {updates}'
+    ).format(
+        table=quote_name(opts.db_table),
+        columns=', '.join(quote_name(field.column) for field in fields),
+        rows=', '.join([row] * len(users)),
+        pk=quote_name(opts.pk.column),
+        updates=', '.join(
+            '{0} = EXCLUDED.{0}'.format(
+                quote_name(opts.get_field(name).column)
+            )
+            for name in SYNC_FIELDS
+        ),
+    )
+
+    params = [
+        field.get_db_prep_save(getattr(user, field.attname), connection)
+        for user in users
+        for field in fields
+    ]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def _bulk_create_and_update(users, connection):
+    existing_ids = set(
+        KagisoUser.objects.using(connection.alias).filter(
+            id__in=[user.id for user in users]
+        ).values_list('id', flat=True)
+    )
+
+    KagisoUser.objects.using(connection.alias).bulk_create(
+        [user for user in users if user.id not in existing_ids]
+    )
+
+    for user in users:
+        if user.id in existing_ids:
+            KagisoUser.objects.using(connection.alias).filter(
+                id=user.id
+            ).update(**{name: getattr(user, name) for name in SYNC_FIELDS})
@@ -0,0 +1,476 @@
+"""An in-memory stand-in for the Auth API, for load tests and benchmarks.
+
+Implements the endpoints AuthApiClient calls (users, sessions,
+confirm_email, reset_password and confirmation_token) over real HTTP, so
+the whole client stack is exercised: pooling, retries, the circuit
+breaker and metrics. Latency and errors can be injected.
+
+Run it on its own and point AUTH_API_BASE_URL at it:
+
+    python -m kagiso_auth.tests.fake_auth_api --port 8001 --latency 0.05
+    AUTH_API_BASE_URL=http://127.0.0.1:8001/api/v1 python manage.py runserver
+
+or start it in-process:
+
+    with FakeAuthApi(latency=0.01, error_rate=0.05) as api:
+        api.add_user('test@email.com', 'password')
+        AuthApiClient.BASE_URL = api.base_url
+
+Only the standard library is used, so it runs without Django.
+"""
+import argparse
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import itertools
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+import uuid
+
+
+API_PREFIX = '/api/v1/'
+
+# Returned with every user, but only changed by PUT
+USER_FIELDS = (
+    'email',
+    'first_name',
+    'last_name',
+    'is_staff',
+    'is_superuser',
+    'profile',
+    'created_via',
+    'last_sign_in_via',
+)
+
+
+class FakeAuthApi:
+
+    def __init__(
+            self,
+            host='127.0.0.1',
+            port=0,
+            token=None,
+            latency=0,
+            latency_jitter=0,
+            error_rate=0,
+            error_status=503,
+            seed=None):
+        self.host = host
+        self.port = port
+        # Calls without `Authorization: Token <token>` get a 401. None
+        # accepts any token.
+        self.token = token
+        # Every response is delayed by latency plus up to latency_jitter
+        # seconds
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        # The fraction of calls answered with error_status instead
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._users = {}
+        # Emails are looked up on every sign in, so avoid a scan
+        self._ids_by_email = {}
+        self._server = None
+
+        self._routes = [
+            ('POST', r'users', self._create_user),
+            ('GET', r'users', self._list_users),
+            ('GET', r'users/(?P<key>[^/]+)/confirmation_token',
+             self._confirmation_token),
+            ('GET', r'users/(?P<key>[^/]+)', self._get_user),
+            ('PUT', r'users/(?P<key>[^/]+)', self._update_user),
+            ('DELETE', r'users/(?P<key>[^/]+)', self._delete_user),
+            ('POST', r'confirm_email', self._confirm_email),
+            ('GET', r'reset_password/(?P<key>[^/]+)',
+             self._reset_password_token),
+            ('POST', r'reset_password/(?P<key>[^/]+)', self._reset_password),
+            ('POST', r'sessions', self._create_session),
+            ('DELETE', r'sessions/(?P<key>[^/]+)', self._delete_session),
+        ]
+
+    @property
+    def base_url(self):
+        return 'http://{0}:{1}{2}'.format(
+            self.host, self.port, API_PREFIX.rstrip('/'))
+
+    def start(self):
+        self._server = _Server((self.host, self.port), _Handler)
+        self._server.api = self
+        self.port = self._server.server_address[1]
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def add_user(self, email, password=None, email_confirmed=True, **fields):
+        """Seed a user, returning it as the Auth API would."""
+        now = _now()
+        user = {
+            'id': next(self._ids),
+            'email': email,
+            'first_name': '',
+            'last_name': '',
+            'is_staff': False,
+            'is_superuser': False,
+            'profile': None,
+            'created_via': None,
+            'last_sign_in_via': None,
+            'email_confirmed': now if email_confirmed else None,
+            'created': now,
+            'modified': now,
+            'password': password,
+            'confirmation_token': None if email_confirmed else _token(),
+            'reset_password_token': None,
+        }
+        user.update(
+            (field, value)
+            for field, value in fields.items() if field in USER_FIELDS
+        )
+
+        with self._lock:
+            self._save(user)
+
+        return _public(user)
+
+    def confirm_emails(self):
+        """Confirm every user's email, so they can all sign in."""
+        with self._lock:
+            for user in self._users.values():
+                if not user['email_confirmed']:
+                    user['email_confirmed'] = _now()
+                    user['confirmation_token'] = None
+
+    def handle(self, method, path, headers, payload, query):
+        """Answer one call, returning (status, body or None)."""
+        delay = self.latency + self._random.uniform(0, self.latency_jitter)
+        if delay:
+            time.sleep(delay)
+
+        if self.error_rate and self._random.random() < self.error_rate:
+            return self.error_status, {'detail': 'Injected error'}
+
+        if self.token is not None:
+            expected = 'Token {0}'.format(self.token)
+            if headers.get('Authorization') != expected:
+                return 401, {'detail': 'Invalid token'}
+
+        if not path.startswith(API_PREFIX):
+            return 404, {'detail': 'Not found'}
+        endpoint = unquote(path[len(API_PREFIX):])
+        endpoint = re.sub(r'/?(\.json)?$', '', endpoint)
+
+        for route_method, pattern, view in self._routes:
+            match = re.fullmatch(pattern, endpoint)
+            if match and route_method == method:
+                with self._lock:
+                    return view(payload or {}, query, **match.groupdict())
+
+        return 404, {'detail': 'Not found'}
+
+    def _find(self, key):
+        # Users are looked up by id or by email, depending on the endpoint
+        if key.isdigit():
+            return self._users.get(int(key))
+        return self._users.get(self._ids_by_email.get(key))
+
+    def _save(self, user, previous_email=None):
+        self._ids_by_email.pop(previous_email, None)
+        self._ids_by_email[user['email']] = user['id']
+        self._users[user['id']] = user
+
+    def _create_user(self, payload, query):
+        if self._find(payload.get('email', '')):
+            return 409, {'detail': 'User already exists'}
+
+        now = _now()
+        user = dict(
+            {field: payload.get(field) for field in USER_FIELDS},
+            id=next(self._ids),
+            email_confirmed=None,
+            created=now,
+            modified=now,
+            password=payload.get('password'),
+            confirmation_token=_token(),
+            reset_password_token=None,
+        )
+        self._save(user)
+
+        return 201, dict(
+            _public(user), confirmation_token=user['confirmation_token'])
+
+    def _list_users(self, payload, query):
+        page = int(query.get('page', 1))
+        page_size = int(query.get('page_size', 100))
+
+        ordering = query.get('ordering', 'id').split(',')
+        fields = [field.lstrip('-') for field in ordering]
+        if not set(fields) <= {'id', 'created', 'modified'}:
+            return 400, {'detail': 'Invalid ordering'}
+
+        users = list(self._users.values())
+        if 'modified_since' in query:
+            since = _parse_time(query['modified_since'])
+            users = [
+                user for user in users
+                if _parse_time(user['modified']) >= since
+            ]
+        users.sort(
+            key=lambda user: [user[field] for field in fields] + [user['id']],
+            reverse=ordering[0].startswith('-')
+        )
+
+        start = (page - 1) * page_size
+        results = users[start:start + page_size]
+        has_next = start + page_size < len(users)
+
+        page_url = '{0}/users/.json?page={{0}}&page_size={1}'.format(
+            self.base_url, page_size)
+
+        return 200, {
+            'count': len(users),
+            'next': page_url.format(page + 1) if has_next else None,
+            'previous': page_url.format(page - 1) if page > 1 else None,
+            'results': [_public(user) for user in results],
+        }
+
+    def _get_user(self, payload, query, key):
+        user = self._find(key)
+        if not user:
+            return 404, {'detail': 'Not found'}
+
+        return 200, dict(
+            _public(user), confirmation_token=user['confirmation_token'])
+
+    def _update_user(self, payload, query, key):
+        user = self._find(key)
+        if not user:
+            return 404, {'detail': 'Not found'}
+
+        other = self._find(payload.get('email', ''))
+        if other and other is not user:
+            return 409, {'detail': 'Email already in use'}
+
+        previous_email = user['email']
+        for field in USER_FIELDS:
+            if field in payload:
+                user[field] = payload[field]
+        if 'password' in payload:
+            user['password'] = payload['password']
+        user['modified'] = _now()
+        self._save(user, previous_email)
+
+        return 200, _public(user)
+
+    def _delete_user(self, payload, query, key):
+        user = self._find(key)
+        if not user:
+            return 404, {'detail': 'Not found'}
+
+        del self._users[user['id']]
+        del self._ids_by_email[user['email']]
+        return 204, None
+
+    def _confirmation_token(self, payload, query, key):
+        user = self._find(key)
+        if not user:
+            return 404, {'detail': 'Not found'}
+
+        user['confirmation_token'] = _token()
+        return 200, {'confirmation_token': user['confirmation_token']}
+
+    def _confirm_email(self, payload, query):
+        token = payload.get('confirmation_token')
+        for user in self._users.values():
+            if token and user['confirmation_token'] == token:
+                user['confirmation_token'] = None
+                user['email_confirmed'] = _now()
+                return 200, None
+
+        return 404, {'detail': 'Invalid confirmation token'}
+
+    def _reset_password_token(self, payload, query, key):
+        user = self._find(key)
+        if not user:
+            return 404, {'detail': 'Not found'}
+
+        user['reset_password_token'] = _token()
+        return 200, {'reset_password_token': user['reset_password_token']}
+
+    def _reset_password(self, payload, query, key):
+        user = self._find(key)
+        token = payload.get('reset_password_token')
+        if not user or not token or user['reset_password_token'] != token:
+            return 404, {'detail': 'Invalid reset password token'}
+
+        user['password'] = payload.get('password')
+        user['reset_password_token'] = None
+        return 200, None
+
+    def _create_session(self, payload, query):
+        user = self._find(payload.get('email', ''))
+        if not user:
+            return 404, {'detail': 'Not found'}
+
+        if 'strategy' not in payload:
+            password = payload.get('password')
+            if not password or password != user['password']:
+                return 404, {'detail': 'Invalid credentials'}
+
+        if not user['email_confirmed']:
+            return 422, {'detail': 'Email not confirmed'}
+
+        if 'last_sign_in_via' in payload:
+            user['last_sign_in_via'] = payload['last_sign_in_via']
+            user['modified'] = _now()
+
+        return 200, _public(user)
+
+    def _delete_session(self, payload, query, key):
+        if not self._find(key):
+            return 404, {'detail': 'Not found'}
+
+        return 200, None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes, so without this Nagle's
+    # algorithm and delayed ACKs add ~40ms to every keep-alive response
+    disable_nagle_algorithm = True
+
+    def _dispatch(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        try:
+            payload = json.loads(body.decode('utf-8')) if body else None
+        except ValueError:
+            self._respond(400, {'detail': 'Invalid JSON'})
+            return
+
+        url = urlsplit(self.path)
+        query = {
+            name: values[-1]
+            for name, values in parse_qs(url.query).items()
+        }
+        status, data = self.server.api.handle(
+            self.command, url.path, self.headers, payload, query)
+        self._respond(status, data)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _dispatch  # noqa: N815
+
+    def _respond(self, status, data):
+        body = json.dumps(data).encode('utf-8') if data is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _public(user):
+    user = dict(user)
+    for secret in ('password', 'confirmation_token', 'reset_password_token'):
+        del user[secret]
+    return user
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def _parse_time(value):
+    # Accepts our own timestamps and isoformat() with a +00:00 offset
+    value = re.sub(r'(Z|[+-]00:?00)$', '', value)
+    for format in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            return datetime.strptime(value, format)
+        except ValueError:
+            continue
+    raise ValueError('Invalid time: {0}'.format(value))
+
+
+def _token():
+    return uuid.uuid4().hex
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--token', help='Only accept this Auth API token')
+    parser.add_argument(
+        '--latency', type=float, default=0, help='Seconds per call')
+    parser.add_argument(
+        '--latency-jitter',
+        type=float,
+        default=0,
+        help='Up to this many more seconds per call, chosen at random'
+    )
+    parser.add_argument(
+        '--error-rate',
+        type=float,
+        default=0,
+        help='Fraction of calls to fail, e.g. 0.05'
+    )
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument(
+        '--users',
+        type=int,
+        default=0,
+        help=(
+            'Seed this many confirmed users, user<n>@email.com with '
+            'password "password"'
+        )
+    )
+    args = parser.parse_args()
+
+    api = FakeAuthApi(
+        host=args.host,
+        port=args.port,
+        token=args.token,
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    )
+    for i in range(args.users):
+        api.add_user('user{0}@email.com'.format(i), 'password')
+
+    api.start()
+    print('Serving a fake Auth API at {0}'.format(api.base_url))  # noqa: T001
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        api.stop()
+
+
+if __name__ == '__main__':
+    main()
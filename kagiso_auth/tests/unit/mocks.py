@@ -1,4 +1,7 @@
+import asyncio
+from concurrent.futures import Executor, Future
 import json
+from urllib.parse import urlencode
 
 from django.conf import settings
 import responses
@@ -33,6 +36,44 @@ def get_user_by_email(id, email, status=http.HTTP_200_OK, **kwargs):
     return url, data
 
 
+def user_data(id, email, **kwargs):
+    return {
+        'id': id,
+        'email': email,
+        'first_name': kwargs.get('first_name', ''),
+        'last_name': kwargs.get('last_name', ''),
+        'is_staff': kwargs.get('is_staff', False),
+        'is_superuser': kwargs.get('is_superuser', False),
+        'email_confirmed': None,
+        'profile': kwargs.get('profile'),
+        'created_via': settings.APP_NAME,
+        'created': '2015-04-21T08:18:30.368602Z',
+        'modified': kwargs.get('modified', '2015-04-21T08:18:30.374410Z'),
+        'last_sign_in_via': kwargs.get('last_sign_in_via'),
+    }
+
+
+def get_users(page, page_size, results, has_next=False, **params):
+    params.update(page=page, page_size=page_size)
+    url = 'https://auth.kagiso.io/api/v1/users/.json?{0}'.format(
+        urlencode(sorted(params.items())))
+    data = {
+        'count': len(results),
+        'next': url if has_next else None,
+        'results': results,
+    }
+
+    responses.add(
+        responses.GET,
+        url,
+        body=json.dumps(data),
+        status=http.HTTP_200_OK,
+        match_querystring=True
+    )
+
+    return url, data
+
+
 def post_users(id, email, status=http.HTTP_201_CREATED, **kwargs):
     url = 'https://auth.kagiso.io/api/v1/users/.json'
     data = {
@@ -191,3 +232,23 @@ def delete_sessions(id, status=http.HTTP_200_OK):
     )
 
     return url
+
+
+class InlineExecutor(Executor):
+    # Runs work on the calling thread so the test's DB transaction is visible
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def run_async(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
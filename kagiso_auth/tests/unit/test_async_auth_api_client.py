@@ -0,0 +1,42 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+import pytest
+import requests
+import responses
+
+from . import mocks
+from ... import http
+from ...async_auth_api_client import AsyncAuthApiClient
+from ...exceptions import AuthAPINetworkError, AuthAPITimeout
+
+
+class TestAsyncApiClient(TestCase):
+
+    @responses.activate
+    def test_call_returns_status_and_json(self):
+        url, data = mocks.get_user_by_email(1, 'test@email.com')
+
+        status, json_data = mocks.run_async(
+            AsyncAuthApiClient.call('users/test@email.com')
+        )
+
+        assert len(responses.calls) == 1
+        assert responses.calls[0].request.url == url
+
+        assert status == http.HTTP_200_OK
+        assert json_data == data
+
+    @patch('kagiso_auth.transport.requests.Session.request', autospec=True)
+    def test_call_raises_on_http_error(self, mock_request):
+        mock_request.side_effect = requests.exceptions.ConnectionError
+
+        with pytest.raises(AuthAPINetworkError):
+            mocks.run_async(AsyncAuthApiClient.call('/endpoint/'))
+
+    @patch('kagiso_auth.transport.requests.Session.request', autospec=True)
+    def test_call_raises_on_timeout(self, mock_request):
+        mock_request.side_effect = requests.exceptions.Timeout
+
+        with pytest.raises(AuthAPITimeout):
+            mocks.run_async(AsyncAuthApiClient.call('/endpoint/'))
@@ -1,16 +1,23 @@
+import logging
 from unittest.mock import patch
 
 from django.test import TestCase
 import pytest
 import requests
+import responses
 
-from ...auth_api_client import AuthApiClient
+from ...auth_api_client import (
+    AuthApiClient,
+    endpoint_template,
+    redact,
+    REDACTED,
+)
 from ...exceptions import AuthAPINetworkError, AuthAPITimeout
 
 
 class TestApiClient(TestCase):
 
-    @patch('kagiso_auth.auth_api_client.requests.request', autospec=True)
+    @patch('kagiso_auth.transport.requests.Session.request', autospec=True)
     def test_call_raises_on_http_error(self, mock_request):
         auth_api_client = AuthApiClient()
         mock_request.side_effect = requests.exceptions.ConnectionError
@@ -18,10 +25,63 @@ class TestApiClient(TestCase):
         with pytest.raises(AuthAPINetworkError):
             auth_api_client.call('/endpoint/')
 
-    @patch('kagiso_auth.auth_api_client.requests.request', autospec=True)
+    @patch('kagiso_auth.transport.requests.Session.request', autospec=True)
     def test_call_raises_on_timeout(self, mock_request):
         auth_api_client = AuthApiClient()
         mock_request.side_effect = requests.exceptions.Timeout
 
         with pytest.raises(AuthAPITimeout):
             auth_api_client.call('/endpoint/')
+
+
+class CallLoggingTest(TestCase):
+
+    def test_endpoint_template(self):
+        assert endpoint_template('users/a@b.com/confirmation_token') == (
+            'users/{email}/confirmation_token')
+        assert endpoint_template('/sessions/12/') == 'sessions/{id}'
+
+    def test_redact(self):
+        payload = {
+            'email': 'test@email.com',
+            'password': 'secret',
+            'profile': {'reset_password_token': 'abc', 'age': 1},
+        }
+
+        assert redact(payload) == {
+            'email': 'test@email.com',
+            'password': REDACTED,
+            'profile': {'reset_password_token': REDACTED, 'age': 1},
+        }
+
+    @responses.activate
+    def test_one_redacted_record_per_call(self):
+        url = '{0}/sessions/.json'.format(AuthApiClient.BASE_URL)
+        responses.add(responses.POST, url, status=200, json={})
+
+        with self.assertLogs('django', 'DEBUG') as logs:
+            AuthApiClient.call(
+                'sessions',
+                'POST',
+                {'email': 'test@email.com', 'password': 'secret'}
+            )
+
+        assert len(logs.records) == 1
+        record = logs.records[0]
+        assert record.auth_api_call['method'] == 'POST'
+        assert record.auth_api_call['endpoint'] == 'sessions'
+        assert record.auth_api_call['status'] == 200
+        assert 'secret' not in record.getMessage()
+        assert AuthApiClient.AUTH_API_TOKEN not in record.getMessage()
+
+    @responses.activate
+    @patch('kagiso_auth.auth_api_client.redact')
+    def test_nothing_is_built_when_debug_is_off(self, mock_redact):
+        url = '{0}/sessions/.json'.format(AuthApiClient.BASE_URL)
+        responses.add(responses.POST, url, status=200, json={})
+        logger = logging.getLogger('django')
+
+        with patch.object(logger, 'isEnabledFor', return_value=False):
+            AuthApiClient.call('sessions', 'POST', {'password': 'secret'})
+
+        assert not mock_redact.called
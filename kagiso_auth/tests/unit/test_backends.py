@@ -1,15 +1,23 @@
+import json
 from unittest.mock import patch
 
 from django.conf import settings
-from django.test import TestCase
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, Permission
+from django.contrib.auth.signals import user_logged_in
+from django.core.cache import cache
+from django.db import transaction
+from django.test import override_settings, TestCase, TransactionTestCase
+from model_mommy import mommy
 import pytest
 import responses
 
 from . import mocks
-from ... import http
+from ... import http, sync
 from ...backends import KagisoBackend
+from ...cache import AuthenticatedUserCache, PermissionCache
 from ...exceptions import AuthAPIUnexpectedStatusCode, EmailNotConfirmedError
-from ...models import KagisoUser
+from ...models import KagisoUser, syncing_from_auth_api
 
 
 class KagisoBackendTest(TestCase):
@@ -115,6 +123,32 @@ class KagisoBackendTest(TestCase):
         assert isinstance(result, KagisoUser)
         assert result.id == user.id
 
+    @responses.activate
+    def test_authenticate_with_app_name_records_sign_in_via(self):
+        email = 'test@email.com'
+        mocks.post_sessions(
+            http.HTTP_200_OK,
+            email=email,
+            last_sign_in_via=settings.APP_NAME
+        )
+
+        backend = KagisoBackend()
+        result = backend.authenticate(
+            email=email,
+            password='random',
+            app_name=settings.APP_NAME,
+        )
+
+        assert len(responses.calls) == 1
+        assert json.loads(responses.calls[0].request.body) == {
+            'email': email,
+            'password': 'random',
+            'last_sign_in_via': settings.APP_NAME,
+        }
+
+        result = KagisoUser.objects.get(id=result.id)
+        assert result.last_sign_in_via == settings.APP_NAME
+
     @responses.activate
     def test_authenticate_invalid_credentials_returns_none(self):
         email = 'test@email.com'
@@ -144,3 +178,230 @@ class KagisoBackendTest(TestCase):
 
         with pytest.raises(EmailNotConfirmedError):
             backend.authenticate(email=email, password=password)
+
+
+@patch('kagiso_auth.async_auth_api_client.EXECUTOR', mocks.InlineExecutor())
+class KagisoBackendAsyncTest(TestCase):
+
+    @responses.activate
+    def test_aauthenticate_valid_credentials_returns_user(self):
+        email = 'test@email.com'
+        session_url, data = mocks.post_sessions(
+            http.HTTP_200_OK,
+            id=55,
+            email=email
+        )
+
+        backend = KagisoBackend()
+        result = mocks.run_async(
+            backend.aauthenticate(email=email, password='random'))
+
+        assert len(responses.calls) == 1
+        assert responses.calls[0].request.url == session_url
+
+        assert result.email == data['email']
+
+    @responses.activate
+    def test_aauthenticate_invalid_credentials_returns_none(self):
+        mocks.post_sessions(http.HTTP_404_NOT_FOUND)
+
+        backend = KagisoBackend()
+        result = mocks.run_async(
+            backend.aauthenticate(email='test@email.com', password='wrong'))
+
+        assert not result
+
+    @responses.activate
+    def test_aauthenticate_unconfirmed_email_raises(self):
+        mocks.post_sessions(http.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        backend = KagisoBackend()
+
+        with pytest.raises(EmailNotConfirmedError):
+            mocks.run_async(
+                backend.aauthenticate(email='test@email.com', password='x'))
+
+
+@patch.object(AuthenticatedUserCache, 'TTL', 60)
+class KagisoBackendGetUserTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def _make_user(self, **kwargs):
+        with syncing_from_auth_api():
+            return mommy.make(KagisoUser, id=1, profile={'age': 40}, **kwargs)
+
+    def test_get_user_is_served_from_cache(self):
+        user = self._make_user()
+        backend = KagisoBackend()
+        backend.get_user(user.id)
+
+        with self.assertNumQueries(0):
+            cached = backend.get_user(user.id)
+
+        assert cached.email == user.email
+        assert cached.profile == {'age': 40}
+        assert cached.get_session_auth_hash() == user.get_session_auth_hash()
+
+    def test_get_user_without_cache_queries_every_time(self):
+        user = self._make_user()
+        backend = KagisoBackend()
+
+        with patch.object(AuthenticatedUserCache, 'TTL', 0):
+            backend.get_user(user.id)
+            with self.assertNumQueries(1):
+                backend.get_user(user.id)
+
+    def test_missing_user_is_not_cached(self):
+        assert KagisoBackend().get_user(404) is None
+        assert AuthenticatedUserCache.get(KagisoUser, 404) is None
+
+    def test_saving_user_invalidates_cache(self):
+        user = self._make_user()
+        backend = KagisoBackend()
+        backend.get_user(user.id)
+
+        with syncing_from_auth_api():
+            user.first_name = 'Fred'
+            user.save()
+
+        assert backend.get_user(user.id).first_name == 'Fred'
+
+    def test_deleting_user_invalidates_cache(self):
+        user = self._make_user()
+        backend = KagisoBackend()
+        backend.get_user(user.id)
+
+        with syncing_from_auth_api():
+            user.delete()
+
+        assert backend.get_user(user.id) is None
+
+    def test_bulk_sync_invalidates_cache(self):
+        user = self._make_user()
+        backend = KagisoBackend()
+        backend.get_user(user.id)
+
+        sync.sync_users([mocks.user_data(user.id, 'new@email.com')])
+
+        assert backend.get_user(user.id).email == 'new@email.com'
+
+    def test_inactive_cached_user_is_rejected(self):
+        user = self._make_user(is_active=False)
+        AuthenticatedUserCache.set(user)
+
+        assert KagisoBackend().get_user(user.id) is None
+
+
+@patch.object(AuthenticatedUserCache, 'TTL', 60)
+class KagisoBackendGetUserCommitTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_entry_cached_before_commit_is_dropped(self):
+        with syncing_from_auth_api():
+            user = mommy.make(KagisoUser, id=1, is_active=True)
+
+        with transaction.atomic():
+            user.is_active = False
+            with syncing_from_auth_api():
+                user.save()
+            # Another request reads the row before this one commits
+            AuthenticatedUserCache.set(KagisoUser(
+                id=1, email=user.email, is_active=True))
+            assert AuthenticatedUserCache.get(KagisoUser, 1) is not None
+
+        assert AuthenticatedUserCache.get(KagisoUser, 1) is None
+        assert KagisoBackend().get_user(1) is None
+
+
+@override_settings(
+    AUTHENTICATION_BACKENDS=['kagiso_auth.backends.KagisoBackend'])
+@patch.object(PermissionCache, 'TTL', 60)
+class KagisoBackendPermissionTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        with syncing_from_auth_api():
+            self.user = mommy.make(KagisoUser, id=1, is_superuser=False)
+        self.group = Group.objects.create(name='editors')
+        self.permission = Permission.objects.get(codename='add_group')
+        self.group.permissions.add(self.permission)
+        self.user.groups.add(self.group)
+
+    def _fresh_user(self):
+        # A new object per request, like request.user
+        return KagisoUser.objects.get(id=self.user.id)
+
+    def test_permissions_are_cached_across_requests(self):
+        assert self._fresh_user().has_perm('auth.add_group')
+        user = self._fresh_user()
+
+        with self.assertNumQueries(0):
+            assert user.has_perm('auth.add_group')
+            assert not user.has_perm('auth.delete_group')
+
+    def test_cache_is_warmed_on_sign_in(self):
+        user_logged_in.send(
+            sender=KagisoUser, request=None, user=self._fresh_user())
+        user = self._fresh_user()
+
+        with self.assertNumQueries(0):
+            assert user.has_perm('auth.add_group')
+
+    def test_changing_users_groups_invalidates(self):
+        assert self._fresh_user().has_perm('auth.add_group')
+
+        self.user.groups.remove(self.group)
+
+        assert not self._fresh_user().has_perm('auth.add_group')
+
+    def test_changing_group_permissions_invalidates(self):
+        assert not self._fresh_user().has_perm('auth.change_group')
+
+        self.group.permissions.add(
+            Permission.objects.get(codename='change_group'))
+
+        assert self._fresh_user().has_perm('auth.change_group')
+
+    def test_deleting_group_invalidates(self):
+        assert self._fresh_user().has_perm('auth.add_group')
+
+        self.group.delete()
+
+        assert not self._fresh_user().has_perm('auth.add_group')
+
+    def test_demoting_superuser_invalidates(self):
+        with syncing_from_auth_api():
+            self.user.is_superuser = True
+            self.user.save()
+        assert self._fresh_user().has_perm('auth.delete_group')
+
+        with syncing_from_auth_api():
+            self.user.is_superuser = False
+            self.user.save()
+
+        assert not self._fresh_user().has_perm('auth.delete_group')
+        assert self._fresh_user().has_perm('auth.add_group')
+
+    def test_version_bumped_while_computing_is_not_cached(self):
+        get_all_permissions = ModelBackend.get_all_permissions
+
+        def bump_midway(backend, user_obj, obj=None):
+            permissions = get_all_permissions(backend, user_obj, obj)
+            # e.g. a group's permissions change in another request
+            PermissionCache.invalidate_all()
+            return permissions
+
+        with patch.object(ModelBackend, 'get_all_permissions', bump_midway):
+            self._fresh_user().has_perm('auth.add_group')
+
+        assert PermissionCache.get(self._fresh_user()) is None
+
+    def test_inactive_users_have_no_permissions(self):
+        user = self._fresh_user()
+        user.is_active = False
+
+        assert not user.has_perm('auth.add_group')
@@ -0,0 +1,150 @@
+from unittest.mock import MagicMock, patch
+
+from django.core.cache import cache
+from django.test import TestCase
+from freezegun import freeze_time
+from model_mommy import mommy
+import responses
+
+from . import mocks
+from ... import http
+from ...cache import incr_or_set, make_key, UserLookupCache
+from ...models import KagisoUser
+
+
+def test_make_key_joins_parts_with_prefix():
+    assert make_key('user', 1, 'x') == 'kagiso_auth:user:1:x'
+
+
+def test_incr_or_set_counts_from_initial():
+    key = make_key('test', 'counter')
+    cache.delete(key)
+
+    assert incr_or_set(key, 60) == 1
+    assert incr_or_set(key, 60) == 2
+
+    cache.delete(key)
+    assert incr_or_set(key, 60, initial=10) == 11
+
+
+def test_incr_or_set_survives_eviction_between_add_and_incr():
+    key = make_key('test', 'counter')
+    cache.delete(key)
+
+    with patch.object(cache, 'incr', side_effect=ValueError):
+        assert incr_or_set(key, 60, initial=10) == 11
+
+    assert cache.get(key) == 11
+
+
+@patch.object(UserLookupCache, 'TTL', 60)
+@patch.object(UserLookupCache, 'NEGATIVE_TTL', 10)
+@patch.object(UserLookupCache, 'STALE_TTL', 30)
+class UserLookupCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_miss_fetches_and_stores(self):
+        fetch = MagicMock(return_value=(http.HTTP_200_OK, {'id': 1}))
+
+        first = UserLookupCache.get('test@email.com', fetch)
+        second = UserLookupCache.get('test@email.com', fetch)
+
+        assert first == second == (http.HTTP_200_OK, {'id': 1})
+        assert fetch.call_count == 1
+
+    def test_not_found_is_cached(self):
+        fetch = MagicMock(return_value=(http.HTTP_404_NOT_FOUND, {}))
+
+        UserLookupCache.get('test@email.com', fetch)
+        UserLookupCache.get('test@email.com', fetch)
+
+        assert fetch.call_count == 1
+
+    def test_unexpected_status_is_not_cached(self):
+        fetch = MagicMock(
+            return_value=(http.HTTP_500_INTERNAL_SERVER_ERROR, {}))
+
+        UserLookupCache.get('test@email.com', fetch)
+        UserLookupCache.get('test@email.com', fetch)
+
+        assert fetch.call_count == 2
+
+    def test_disabled_cache_always_fetches(self):
+        fetch = MagicMock(return_value=(http.HTTP_200_OK, {'id': 1}))
+
+        with patch.object(UserLookupCache, 'TTL', 0):
+            UserLookupCache.get('test@email.com', fetch)
+            UserLookupCache.get('test@email.com', fetch)
+
+        assert fetch.call_count == 2
+
+    @patch.object(UserLookupCache, '_refresh_in_background')
+    def test_stale_entry_is_served_while_refreshing(self, mock_refresh):
+        fetch = MagicMock(return_value=(http.HTTP_200_OK, {'id': 1}))
+
+        with freeze_time('2016-01-01 00:00:00'):
+            UserLookupCache.get('test@email.com', fetch)
+
+        with freeze_time('2016-01-01 00:01:10'):
+            result = UserLookupCache.get('test@email.com', fetch)
+            UserLookupCache.get('test@email.com', fetch)
+
+        assert result == (http.HTTP_200_OK, {'id': 1})
+        assert fetch.call_count == 1
+        mock_refresh.assert_called_once_with('test@email.com', fetch)
+
+    def test_refresh_stores_new_data(self):
+        fetch = MagicMock(return_value=(http.HTTP_200_OK, {'id': 2}))
+
+        UserLookupCache._refresh('test@email.com', fetch)
+
+        assert UserLookupCache.get('test@email.com', None) == \
+            (http.HTTP_200_OK, {'id': 2})
+
+    def test_invalidate_removes_entry(self):
+        fetch = MagicMock(return_value=(http.HTTP_200_OK, {'id': 1}))
+        UserLookupCache.get('test@email.com', fetch)
+
+        UserLookupCache.invalidate('test@email.com')
+        UserLookupCache.get('test@email.com', fetch)
+
+        assert fetch.call_count == 2
+
+    @responses.activate
+    def test_get_user_from_auth_db_uses_cache(self):
+        email = 'test@email.com'
+        mocks.get_user_by_email(1, email)
+
+        KagisoUser.get_user_from_auth_db(email)
+        result = KagisoUser.get_user_from_auth_db(email)
+
+        assert len(responses.calls) == 1
+        assert result.email == email
+
+    @responses.activate
+    def test_saving_user_invalidates_cached_lookup(self):
+        email = 'test@email.com'
+        mocks.get_user_by_email(1, email, http.HTTP_404_NOT_FOUND)
+        assert KagisoUser.get_user_from_auth_db(email) is None
+
+        mocks.post_users(1, email)
+        mommy.make(KagisoUser, id=None, email=email)
+        responses.reset()
+        mocks.get_user_by_email(1, email)
+
+        assert KagisoUser.get_user_from_auth_db(email).email == email
+
+    @responses.activate
+    def test_deleting_user_invalidates_cached_lookup(self):
+        email = 'test@email.com'
+        mocks.get_user_by_email(1, email)
+        user = KagisoUser.get_user_from_auth_db(email)
+
+        mocks.delete_users(user.id)
+        user.delete()
+        responses.reset()
+        mocks.get_user_by_email(1, email, http.HTTP_404_NOT_FOUND)
+
+        assert KagisoUser.get_user_from_auth_db(email) is None
@@ -0,0 +1,112 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+from freezegun import freeze_time
+import pytest
+import responses
+
+from . import mocks
+from ... import http
+from ...auth_api_client import AuthApiClient
+from ...circuit_breaker import CircuitBreaker
+from ...exceptions import AuthAPICircuitOpen, AuthAPINetworkError
+
+
+@patch.object(CircuitBreaker, 'ENABLED', True)
+@patch.object(CircuitBreaker, 'FAILURE_THRESHOLD', 2)
+@patch.object(CircuitBreaker, 'RESET_TIMEOUT', 30)
+class CircuitBreakerTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_for_endpoint_groups_by_first_segment(self):
+        breaker = CircuitBreaker.for_endpoint('users/test@email.com')
+
+        assert breaker.family == 'users'
+
+    def test_opens_after_failure_threshold(self):
+        breaker = CircuitBreaker('sessions')
+        breaker.before_call()
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_failure()
+
+        with pytest.raises(AuthAPICircuitOpen):
+            breaker.before_call()
+
+    def test_success_resets_failure_count(self):
+        breaker = CircuitBreaker('sessions')
+        breaker.before_call()
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_success()
+        breaker.before_call()
+        breaker.record_failure()
+
+        breaker.before_call()
+
+    def test_slow_calls_count_as_failures(self):
+        breaker = CircuitBreaker('sessions')
+
+        with patch.object(CircuitBreaker, 'LATENCY_THRESHOLD', 1):
+            breaker.record(elapsed=2, status_code=http.HTTP_200_OK)
+            breaker.record(elapsed=2, status_code=http.HTTP_200_OK)
+
+        with pytest.raises(AuthAPICircuitOpen):
+            breaker.before_call()
+
+    def test_families_are_independent(self):
+        CircuitBreaker('sessions').record_failure()
+        CircuitBreaker('sessions').record_failure()
+
+        CircuitBreaker('users').before_call()
+
+    def test_half_open_lets_a_single_probe_through(self):
+        with freeze_time('2016-01-01 00:00:00'):
+            CircuitBreaker('sessions').record_failure()
+            CircuitBreaker('sessions').record_failure()
+
+        with freeze_time('2016-01-01 00:01:00'):
+            probe = CircuitBreaker('sessions')
+            probe.before_call()
+
+            with pytest.raises(AuthAPICircuitOpen):
+                CircuitBreaker('sessions').before_call()
+
+            probe.record_success()
+            CircuitBreaker('sessions').before_call()
+
+    def test_failed_probe_reopens_circuit(self):
+        with freeze_time('2016-01-01 00:00:00'):
+            CircuitBreaker('sessions').record_failure()
+            CircuitBreaker('sessions').record_failure()
+
+        with freeze_time('2016-01-01 00:01:00'):
+            probe = CircuitBreaker('sessions')
+            probe.before_call()
+            probe.record_failure()
+
+        with freeze_time('2016-01-01 00:01:10'):
+            with pytest.raises(AuthAPICircuitOpen):
+                CircuitBreaker('sessions').before_call()
+
+    @responses.activate
+    def test_open_circuit_fails_fast_without_calling_auth_api(self):
+        mocks.post_sessions(http.HTTP_500_INTERNAL_SERVER_ERROR)
+        mocks.post_sessions(http.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        AuthApiClient.call('sessions', 'POST')
+        AuthApiClient.call('sessions', 'POST')
+
+        with pytest.raises(AuthAPINetworkError):
+            AuthApiClient.call('sessions', 'POST')
+
+        assert len(responses.calls) == 2
+
+    def test_disabled_breaker_never_opens(self):
+        with patch.object(CircuitBreaker, 'ENABLED', False):
+            CircuitBreaker('sessions').record_failure()
+            CircuitBreaker('sessions').record_failure()
+            CircuitBreaker('sessions').before_call()
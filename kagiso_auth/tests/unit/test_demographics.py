@@ -0,0 +1,137 @@
+import io
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase
+from freezegun import freeze_time
+from model_mommy import mommy
+
+from . import mocks
+from ... import sync
+from ...managers import age_band
+from ...models import DemographicCount, KagisoUser, syncing_from_auth_api
+
+
+@freeze_time('2016-02-01')
+@patch.object(DemographicCount, 'ENABLED', True)
+class DemographicCountTest(TestCase):
+
+    def _make_user(self, id, **profile):
+        with syncing_from_auth_api():
+            return mommy.make(
+                KagisoUser,
+                id=id,
+                profile=profile,
+                created_via='web',
+                last_sign_in_via=None,
+            )
+
+    def test_age_band(self):
+        assert age_band(None) == ''
+        assert age_band(17) == 'under 18'
+        assert age_band(18) == '18-24'
+        assert age_band(64) == '55-64'
+        assert age_band(90) == '65+'
+
+    def test_demographics(self):
+        user = self._make_user(
+            1, region='GAUTENG', birth_date='1990-02-02')
+
+        assert user.demographics() == {
+            'region': 'GAUTENG',
+            'gender': '',
+            'age_band': '25-34',
+            'created_via': 'web',
+            'last_sign_in_via': '',
+        }
+
+    def test_counts_new_users(self):
+        self._make_user(1, region='GAUTENG', gender='MALE')
+        self._make_user(2, region='GAUTENG', gender='FEMALE')
+
+        assert DemographicCount.objects.breakdown('region') == {'GAUTENG': 2}
+        assert DemographicCount.objects.breakdown('gender') == {
+            'MALE': 1,
+            'FEMALE': 1,
+        }
+        assert DemographicCount.objects.breakdown('created_via') == {'web': 2}
+
+    def test_moves_saved_users(self):
+        self._make_user(1, region='GAUTENG')
+        self._make_user(2, region='GAUTENG')
+        user = KagisoUser.objects.get(id=1)
+
+        user.profile = {'region': 'LIMPOPO'}
+        with syncing_from_auth_api():
+            user.save()
+
+        assert DemographicCount.objects.breakdown('region') == {
+            'GAUTENG': 1,
+            'LIMPOPO': 1,
+        }
+
+    def test_unchanged_saves_do_not_write(self):
+        self._make_user(1, region='GAUTENG')
+        user = KagisoUser.objects.get(id=1)
+
+        with patch.object(DemographicCount.objects, 'apply') as apply:
+            with syncing_from_auth_api():
+                user.save(update_fields=['last_login'])
+
+        assert not apply.called
+
+    def test_removes_deleted_users(self):
+        self._make_user(1, region='GAUTENG')
+        self._make_user(2, region='GAUTENG')
+
+        with syncing_from_auth_api():
+            KagisoUser.objects.filter(id=1).delete()
+
+        assert DemographicCount.objects.breakdown('region') == {'GAUTENG': 1}
+
+    def test_sync_users(self):
+        sync.sync_users([
+            mocks.user_data(1, 'one@email.com', profile={'region': 'GAUTENG'}),
+            mocks.user_data(2, 'two@email.com', profile={'region': 'GAUTENG'}),
+        ])
+        sync.sync_users([
+            mocks.user_data(1, 'one@email.com', profile={'region': 'LIMPOPO'}),
+        ])
+
+        assert DemographicCount.objects.breakdown('region') == {
+            'GAUTENG': 1,
+            'LIMPOPO': 1,
+        }
+
+    def test_rebuild_matches_incremental_counts(self):
+        self._make_user(1, region='GAUTENG', birth_date='2000-02-01')
+        self._make_user(2, gender='FEMALE', birth_date='2000-02-02')
+        self._make_user(3, birth_date='1940-01-01')
+        self._make_user(4)
+        incremental = DemographicCount.objects.breakdowns()
+
+        DemographicCount.objects.all().delete()
+        DemographicCount.objects.rebuild(KagisoUser.objects.all())
+
+        assert DemographicCount.objects.breakdowns() == incremental
+        assert incremental['age_band'] == {
+            'under 18': 2,
+            '65+': 1,
+            '': 1,
+        }
+
+    def test_rebuild_command(self):
+        self._make_user(1, region='GAUTENG')
+        DemographicCount.objects.all().delete()
+        stdout = io.StringIO()
+
+        call_command('kagiso_rebuild_demographics', stdout=stdout)
+
+        assert DemographicCount.objects.breakdown('region') == {'GAUTENG': 1}
+        assert 'Done, counted' in stdout.getvalue()
+
+    def test_disabled(self):
+        with patch.object(DemographicCount, 'ENABLED', False):
+            self._make_user(1, region='GAUTENG')
+
+        assert not DemographicCount.objects.exists()
@@ -0,0 +1,121 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from model_mommy import mommy
+
+from ... import export
+from ...models import KagisoUser, syncing_from_auth_api
+
+
+class ExportTest(TestCase):
+
+    def setUp(self):
+        users = [
+            (1, 'web', '2016-01-01T00:00:00Z', {'region': 'GAUTENG'}),
+            (2, 'web', '2016-02-01T00:00:00Z', {'region': 'LIMPOPO'}),
+            (3, 'mobile', '2016-03-01T00:00:00Z', None),
+        ]
+        with syncing_from_auth_api():
+            for id, created_via, modified, profile in users:
+                mommy.make(
+                    KagisoUser,
+                    id=id,
+                    email='{0}@email.com'.format(id),
+                    created_via=created_via,
+                    modified=modified,
+                    profile=profile,
+                )
+
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def _export(self, *args):
+        call_command('kagiso_export_users', '--output', self.path, *args)
+
+    def test_iter_users_fetches_in_chunks(self):
+        # One query per chunk, plus one to find there are no more
+        with self.assertNumQueries(3):
+            rows = list(
+                export.iter_users(KagisoUser.objects.all(), chunk_size=2))
+
+        assert [row['id'] for row in rows] == [1, 2, 3]
+        assert rows[0]['profile'] == {'region': 'GAUTENG'}
+
+    def test_json_lines(self):
+        self._export()
+
+        with open(self.path) as f:
+            rows = [json.loads(line) for line in f]
+
+        assert [row['id'] for row in rows] == [1, 2, 3]
+        assert rows[0]['email'] == '1@email.com'
+        assert rows[0]['modified'] == '2016-01-01T00:00:00+00:00'
+        assert rows[0]['profile'] == {'region': 'GAUTENG'}
+        assert set(rows[0]) == set(export.FIELDS)
+
+    def test_csv(self):
+        self._export('--format', 'csv')
+
+        with open(self.path, newline='') as f:
+            rows = list(csv.DictReader(f))
+
+        assert [row['id'] for row in rows] == ['1', '2', '3']
+        assert json.loads(rows[1]['profile']) == {'region': 'LIMPOPO'}
+        assert rows[2]['profile'] == ''
+
+    def test_gzip(self):
+        self._export('--gzip')
+
+        with gzip.open(self.path, 'rt') as f:
+            rows = [json.loads(line) for line in f]
+
+        assert [row['id'] for row in rows] == [1, 2, 3]
+
+    def test_stdout(self):
+        stdout = io.StringIO()
+
+        call_command('kagiso_export_users', '--format', 'csv', stdout=stdout)
+
+        rows = list(csv.DictReader(io.StringIO(stdout.getvalue())))
+        assert [row['id'] for row in rows] == ['1', '2', '3']
+
+    def test_gzip_to_stdout(self):
+        stdout = io.TextIOWrapper(io.BytesIO(), encoding='utf-8')
+
+        call_command('kagiso_export_users', '--gzip', stdout=stdout)
+
+        with gzip.open(io.BytesIO(stdout.buffer.getvalue()), 'rt') as f:
+            assert [json.loads(line)['id'] for line in f] == [1, 2, 3]
+
+    def test_gzip_to_text_only_stdout(self):
+        with self.assertRaises(CommandError):
+            call_command(
+                'kagiso_export_users', '--gzip', stdout=io.StringIO())
+
+    def test_filters(self):
+        self._export(
+            '--created-via', 'web',
+            '--modified-since', '2016-01-15T00:00:00Z',
+            '--modified-until', '2016-03-01T00:00:00Z',
+        )
+
+        with open(self.path) as f:
+            assert [json.loads(line)['id'] for line in f] == [2]
+
+    def test_profile_filter(self):
+        self._export('--profile', 'region=GAUTENG')
+
+        with open(self.path) as f:
+            assert [json.loads(line)['id'] for line in f] == [1]
+
+    def test_invalid_profile_filter(self):
+        with self.assertRaises(CommandError):
+            self._export('--profile', 'region')
@@ -0,0 +1,91 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+from model_mommy import mommy
+import pytest
+
+from ..fake_auth_api import FakeAuthApi
+from ... import http, sync
+from ...auth_api_client import AuthApiClient
+from ...backends import KagisoBackend
+from ...exceptions import AuthAPIUnexpectedStatusCode, EmailNotConfirmedError
+from ...models import KagisoUser
+
+
+class FakeAuthApiTest(TestCase):
+
+    def setUp(self):
+        self.api = FakeAuthApi(seed=1).start()
+        self.addCleanup(self.api.stop)
+        patcher = patch.object(AuthApiClient, 'BASE_URL', self.api.base_url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sign_up_confirm_and_sign_in(self):
+        user = mommy.prepare(KagisoUser, id=None, email='test@email.com')
+        user.set_password('password')
+        user.save()
+
+        with pytest.raises(EmailNotConfirmedError):
+            KagisoBackend().authenticate(
+                email='test@email.com', password='password')
+
+        user.confirm_email(user.confirmation_token)
+        signed_in_user = KagisoBackend().authenticate(
+            email='test@email.com',
+            password='password',
+            app_name='web'
+        )
+
+        assert signed_in_user == user
+        assert signed_in_user.last_sign_in_via == 'web'
+        assert KagisoBackend().authenticate(
+            email='test@email.com', password='wrong') is None
+
+    def test_update_and_delete(self):
+        self.api.add_user('test@email.com', 'password')
+        user = KagisoUser.get_user_from_auth_db('test@email.com')
+
+        user.profile = {'region': 'GAUTENG'}
+        user.save()
+        user.delete()
+
+        status, data = AuthApiClient.call('users/test@email.com')
+        assert status == http.HTTP_404_NOT_FOUND
+
+    def test_reset_password(self):
+        self.api.add_user('test@email.com', 'password')
+        user = KagisoUser.get_user_from_auth_db('test@email.com')
+
+        token = user.generate_reset_password_token()
+        assert user.reset_password('new_password', token)
+
+        assert KagisoBackend().authenticate(
+            email='test@email.com', password='new_password') == user
+
+    def test_list_users_is_paginated(self):
+        for i in range(5):
+            self.api.add_user('{0}@email.com'.format(i))
+
+        records = list(sync.iter_auth_api_users(page_size=2))
+
+        assert [record['email'] for record in records] == [
+            '{0}@email.com'.format(i) for i in range(5)
+        ]
+
+    def test_error_injection(self):
+        self.api.add_user('test@email.com')
+        self.api.error_rate = 1
+
+        with pytest.raises(AuthAPIUnexpectedStatusCode):
+            KagisoUser.get_user_from_auth_db('test@email.com')
+
+    def test_token_is_checked(self):
+        self.api.token = 'secret'
+
+        status, data = AuthApiClient.call('users/test@email.com')
+        assert status == 401
+
+        with patch.object(AuthApiClient, 'AUTH_API_TOKEN', 'secret'):
+            status, data = AuthApiClient.call('users/test@email.com')
+        assert status == http.HTTP_404_NOT_FOUND
@@ -1,9 +1,17 @@
+from datetime import date
+from importlib import import_module
+from unittest.mock import MagicMock, patch
+
 from dateutil import parser
+from django.apps import apps
+from django.db import connection
 from django.test import TestCase
+from freezegun import freeze_time
+from model_mommy import mommy
 import responses
 
 from . import mocks
-from ...models import KagisoUser
+from ...models import KagisoUser, syncing_from_auth_api
 
 
 class KagisoUserTest(TestCase):
@@ -60,3 +68,116 @@ class KagisoUserTest(TestCase):
 
         assert result.email == email
         assert result.is_superuser
+
+
+class KagisoUserQuerySetTest(TestCase):
+
+    def _make_user(self, id, birth_date):
+        profile = {'birth_date': birth_date} if birth_date else {}
+        with syncing_from_auth_api():
+            return mommy.make(KagisoUser, id=id, profile=profile)
+
+    def test_birth_date_is_copied_from_profile_on_save(self):
+        user = self._make_user(1, '2000-01-19')
+
+        assert KagisoUser.objects.get(id=1).birth_date == date(2000, 1, 19)
+
+        user.profile = {}
+        with syncing_from_auth_api():
+            user.save()
+
+        assert KagisoUser.objects.get(id=1).birth_date is None
+
+    @freeze_time('2016-02-01')
+    def test_with_age(self):
+        self._make_user(1, '2000-01-19')
+        self._make_user(2, '2000-02-02')
+        self._make_user(3, None)
+
+        ages = dict(
+            KagisoUser.objects.with_age().values_list('id', 'age'))
+
+        assert ages == {1: 16, 2: 15, 3: None}
+        for user in KagisoUser.objects.all():
+            assert user.age == ages[user.id]
+
+    @freeze_time('2016-02-01')
+    def test_age_follows_profile_before_save(self):
+        user = self._make_user(1, '2000-01-19')
+
+        user.profile['birth_date'] = '1990-01-19'
+
+        assert user.age == 26
+        # Without the profile loaded, the saved column is used
+        with self.assertNumQueries(1):
+            assert KagisoUser.objects.only('birth_date').get(id=1).age == 16
+
+    @freeze_time('2016-02-01')
+    def test_age_between(self):
+        self._make_user(1, '2000-02-01')  # Turns 16 today
+        self._make_user(2, '2000-02-02')  # Still 15
+        self._make_user(3, '1990-02-02')  # 25
+        self._make_user(4, '1990-02-01')  # Turns 26 today
+        self._make_user(5, None)
+
+        ids = set(
+            KagisoUser.objects.age_between(16, 25).values_list('id', flat=True)
+        )
+
+        assert ids == {1, 3}
+
+    def test_backfill_migration(self):
+        self._make_user(1, '2000-01-19')
+        self._make_user(2, None)
+        KagisoUser.objects.update(birth_date=None)
+        backfill = import_module(
+            'kagiso_auth.migrations.0013_backfill_birth_date')
+
+        with patch.object(backfill, 'BATCH_SIZE', 1):
+            backfill.backfill_birth_date(
+                apps, MagicMock(connection=connection))
+
+        birth_dates = dict(
+            KagisoUser.objects.values_list('id', 'birth_date'))
+        assert birth_dates == {1: date(2000, 1, 19), 2: None}
+
+
+class ProfileLookupTest(TestCase):
+
+    def setUp(self):
+        profiles = {
+            1: {'region': 'GAUTENG', 'gender': 'MALE', 'alerts': ['SMS']},
+            2: {'region': 'GAUTENG', 'gender': 'FEMALE',
+                'alerts': ['EMAIL', 'SMS']},
+            3: {'region': 'LIMPOPO', 'gender': 'FEMALE', 'alerts': []},
+            4: None,
+        }
+        with syncing_from_auth_api():
+            for id, profile in profiles.items():
+                mommy.make(KagisoUser, id=id, profile=profile)
+
+    def _ids(self, queryset):
+        return set(queryset.values_list('id', flat=True))
+
+    def test_in_region(self):
+        assert self._ids(KagisoUser.objects.in_region('GAUTENG')) == {1, 2}
+
+    def test_with_gender(self):
+        assert self._ids(KagisoUser.objects.with_gender('FEMALE')) == {2, 3}
+
+    def test_with_alert(self):
+        assert self._ids(KagisoUser.objects.with_alert('SMS')) == {1, 2}
+        assert self._ids(KagisoUser.objects.with_alert('EMAIL')) == {2}
+
+    def test_lookups_chain(self):
+        users = KagisoUser.objects.in_region('GAUTENG').with_alert('EMAIL')
+
+        assert self._ids(users) == {2}
+
+    def test_profile_round_trips(self):
+        profile = {'region': 'GAUTENG', 'alerts': ['SMS']}
+
+        assert KagisoUser.objects.get(id=1).profile['alerts'] == ['SMS']
+        assert KagisoUser.objects.get(id=4).profile is None
+        assert KagisoUser.objects.filter(
+            profile__json_contains=profile).count() == 2
@@ -0,0 +1,138 @@
+import socket
+from unittest.mock import patch
+
+from django.http import Http404
+from django.test import RequestFactory, TestCase
+import requests
+import responses
+
+from ... import metrics, views
+from ...auth_api_client import AuthApiClient
+from ...exceptions import AuthAPINetworkError
+from ...metrics import NullSink, PrometheusSink, StatsdSink
+
+
+class PrometheusSinkTest(TestCase):
+
+    def test_counters_and_gauges(self):
+        sink = PrometheusSink()
+        sink.increment('calls_total', {'endpoint': 'sessions'})
+        sink.increment('calls_total', {'endpoint': 'sessions'}, 2)
+        sink.add_to_gauge('in_flight', {'endpoint': 'sessions'}, 1)
+
+        rendered = sink.render()
+
+        assert '# TYPE calls_total counter' in rendered
+        assert 'calls_total{endpoint="sessions"} 3' in rendered
+        assert '# TYPE in_flight gauge' in rendered
+        assert 'in_flight{endpoint="sessions"} 1' in rendered
+
+    def test_histogram_buckets_are_cumulative(self):
+        sink = PrometheusSink()
+        sink.observe('duration_seconds', {}, 0.02)
+        sink.observe('duration_seconds', {}, 0.2)
+        sink.observe('duration_seconds', {}, 20)
+
+        lines = sink.render().splitlines()
+
+        assert '# TYPE duration_seconds histogram' in lines
+        assert 'duration_seconds_bucket{le="0.01"} 0' in lines
+        assert 'duration_seconds_bucket{le="0.025"} 1' in lines
+        assert 'duration_seconds_bucket{le="0.25"} 2' in lines
+        assert 'duration_seconds_bucket{le="+Inf"} 3' in lines
+        assert 'duration_seconds_count 3' in lines
+
+    def test_label_values_are_escaped(self):
+        sink = PrometheusSink()
+        sink.increment('calls_total', {'endpoint': 'a"b'})
+
+        assert 'calls_total{endpoint="a\\"b"} 1' in sink.render()
+
+
+class StatsdSinkTest(TestCase):
+
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.settimeout(1)
+        self.sink = StatsdSink(
+            '127.0.0.1', self.server.getsockname()[1], 'prefix')
+
+    def tearDown(self):
+        self.server.close()
+
+    def _receive(self):
+        return self.server.recv(1024).decode('utf-8')
+
+    def test_increment(self):
+        self.sink.increment(
+            'responses_total', {'endpoint': 'users/{email}', 'status': 200})
+
+        assert self._receive() == (
+            'prefix.responses_total.users__email_.200:1|c')
+
+    def test_gauge_is_adjusted(self):
+        self.sink.add_to_gauge('in_flight', {}, -1)
+
+        assert self._receive() == 'prefix.in_flight:-1|g'
+
+    def test_observe_sends_milliseconds(self):
+        self.sink.observe('duration_seconds', {}, 0.25)
+
+        assert self._receive() == 'prefix.duration_seconds:250.000|ms'
+
+
+class AuthApiClientMetricsTest(TestCase):
+
+    def setUp(self):
+        self.sink = PrometheusSink()
+        patcher = patch.object(metrics, 'SINK', self.sink)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @responses.activate
+    def test_responses_are_counted_and_timed(self):
+        url = '{0}/users/test@email.com/.json'.format(AuthApiClient.BASE_URL)
+        responses.add(responses.GET, url, status=404, json={})
+
+        AuthApiClient.call('users/test@email.com')
+
+        rendered = self.sink.render()
+        labels = 'endpoint="users/{email}",method="GET"'
+        assert 'auth_api_responses_total{{{0},status="404"}} 1'.format(
+            labels) in rendered
+        assert 'auth_api_request_duration_seconds_count{{{0}}} 1'.format(
+            labels) in rendered
+        assert 'auth_api_in_flight{{{0}}} 0'.format(labels) in rendered
+
+    @patch('kagiso_auth.transport.requests.Session.request', autospec=True)
+    def test_errors_are_counted_by_exception(self, mock_request):
+        mock_request.side_effect = requests.exceptions.ConnectionError
+
+        with self.assertRaises(AuthAPINetworkError):
+            AuthApiClient.call('sessions', 'POST', {})
+
+        assert (
+            'auth_api_errors_total{endpoint="sessions",'
+            'exception="ConnectionError",method="POST"} 1'
+        ) in self.sink.render()
+
+    def test_view_renders_prometheus_text(self):
+        self.sink.increment('calls_total', {})
+
+        response = views.auth_api_metrics(RequestFactory().get('/'))
+
+        assert response.status_code == 200
+        assert response['Content-Type'] == metrics.PROMETHEUS_CONTENT_TYPE
+        assert b'calls_total 1' in response.content
+
+    def test_view_is_not_found_without_prometheus_sink(self):
+        with patch.object(metrics, 'SINK', NullSink()):
+            with self.assertRaises(Http404):
+                views.auth_api_metrics(RequestFactory().get('/'))
+
+    def test_view_is_not_in_default_urls(self):
+        # Sites must wire it in themselves, somewhere not public
+        response = self.client.get('/auth_api_metrics/')
+
+        assert response.status_code == 404
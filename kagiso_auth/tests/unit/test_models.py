@@ -1,5 +1,11 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import threading
+from unittest.mock import patch
+
 from dateutil import parser
 from django.conf import settings
+from django.db.models.signals import pre_save
 from django.db.utils import IntegrityError
 from django.test import TestCase
 from django.utils import timezone
@@ -10,8 +16,13 @@ import responses
 
 from . import mocks
 from ... import http
+from ...auth_api_client import AuthApiClient
 from ...exceptions import AuthAPIUnexpectedStatusCode
-from ...models import KagisoUser
+from ...models import (
+    is_syncing_from_auth_api,
+    KagisoUser,
+    syncing_from_auth_api
+)
 
 
 class KagisoUserTest(TestCase):
@@ -244,7 +255,7 @@ class KagisoUserTest(TestCase):
     def test_update_invalid_status_code_raises(self):
         mocks.post_users(1, 'test@email.com')
         user = mommy.make(KagisoUser, id=None)
-        email = 'test@email.com'
+        email = 'changed@email.com'
         url, api_data = mocks.put_users(
             1, email, status=http.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -253,6 +264,48 @@ class KagisoUserTest(TestCase):
         with pytest.raises(AuthAPIUnexpectedStatusCode):
             user.save()
 
+    @responses.activate
+    def test_update_without_changes_skips_auth_api(self):
+        mocks.post_users(1, 'test@email.com')
+        user = mommy.make(KagisoUser, id=None)
+        mocks.put_users(1, 'test@email.com')
+
+        user.last_login = timezone.now()
+        user.save()
+        KagisoUser.objects.get(id=user.id).save()
+
+        assert len(responses.calls) == 1
+        assert responses.calls[0].request.method == 'POST'
+
+    @responses.activate
+    def test_update_sends_only_changed_fields(self):
+        mocks.post_users(1, 'test@email.com', profile={'region': 'GAUTENG'})
+        mommy.make(KagisoUser, id=None)
+        user = KagisoUser.objects.get(id=1)
+        mocks.put_users(1, 'test@email.com', first_name='Fred')
+
+        user.first_name = 'Fred'
+        user.profile['region'] = 'LIMPOPO'
+        user.save()
+
+        assert len(responses.calls) == 2
+        assert json.loads(responses.calls[1].request.body) == {
+            'first_name': 'Fred',
+            'profile': {'region': 'LIMPOPO'},
+        }
+
+    @responses.activate
+    def test_update_resyncs_snapshot_from_response(self):
+        mocks.post_users(1, 'test@email.com')
+        user = mommy.make(KagisoUser, id=None)
+        mocks.put_users(1, 'test@email.com', first_name='Fred')
+
+        user.first_name = 'Fred'
+        user.save()
+        user.save()
+
+        assert len(responses.calls) == 2
+
     @responses.activate
     def test_delete(self):
         mocks.post_users(1, 'test@email.com')
@@ -392,8 +445,9 @@ class KagisoUserTest(TestCase):
 
         user.confirm_email(post_data['confirmation_token'])
 
-        assert len(responses.calls) == 3
-        # Create user, confirm user, update user...
+        # Create user, confirm user. email_confirmed isn't stored on the
+        # Auth API so the save that follows doesn't need to update it.
+        assert len(responses.calls) == 2
         assert responses.calls[1].request.url == url
 
         result = KagisoUser.objects.get(id=user.id)
@@ -548,3 +602,166 @@ class KagisoUserTest(TestCase):
         with freeze_time('2016-02-01'):
             expected_age = 16
             assert user.age == expected_age
+
+
+@patch('kagiso_auth.async_auth_api_client.EXECUTOR', mocks.InlineExecutor())
+class KagisoUserAsyncTest(TestCase):
+
+    @responses.activate
+    def test_aget_user_from_auth_db_returns_user_if_exists(self):
+        email = 'test@email.com'
+        url, _ = mocks.get_user_by_email(1, email)
+
+        result = mocks.run_async(KagisoUser.aget_user_from_auth_db(email))
+
+        assert len(responses.calls) == 1
+        assert responses.calls[0].request.url == url
+
+        assert result.email == email
+
+    @responses.activate
+    def test_aget_user_from_auth_db_returns_none_if_not_exists(self):
+        email = 'test@email.com'
+        mocks.get_user_by_email(1, email, http.HTTP_404_NOT_FOUND)
+
+        result = mocks.run_async(KagisoUser.aget_user_from_auth_db(email))
+
+        assert not result
+
+    @responses.activate
+    def test_aget_user_from_auth_db_queries_on_calling_thread(self):
+        email = 'test@email.com'
+        mocks.get_user_by_email(1, email)
+        threads = {}
+        call = AuthApiClient.call
+        from_response = KagisoUser._user_from_auth_db_response
+
+        def record_call(*args, **kwargs):
+            threads['call'] = threading.get_ident()
+            return call(*args, **kwargs)
+
+        def record_query(*args, **kwargs):
+            threads['query'] = threading.get_ident()
+            return from_response(*args, **kwargs)
+
+        with patch('kagiso_auth.async_auth_api_client.EXECUTOR',
+                   ThreadPoolExecutor(max_workers=1)), \
+                patch.object(AuthApiClient, 'call', record_call), \
+                patch.object(KagisoUser, '_user_from_auth_db_response',
+                             record_query):
+            result = mocks.run_async(KagisoUser.aget_user_from_auth_db(email))
+
+        assert result.email == email
+        assert threads['call'] != threading.get_ident()
+        assert threads['query'] == threading.get_ident()
+
+    @responses.activate
+    def test_aconfirm_email(self):
+        _, post_data = mocks.post_users(1, 'test@email.com')
+        user = mommy.make(KagisoUser, id=None)
+        mocks.put_users(
+            user.id,
+            user.email,
+            profile=user.profile
+        )
+        url = mocks.post_confirm_email()
+
+        mocks.run_async(
+            user.aconfirm_email(post_data['confirmation_token']))
+
+        assert responses.calls[1].request.url == url
+
+        result = KagisoUser.objects.get(id=user.id)
+
+        assert result.email_confirmed
+
+    @responses.activate
+    def test_areset_password_invalid_status_code_raises(self):
+        mocks.post_users(1, 'test@email.com')
+        user = mommy.make(KagisoUser, id=None)
+        mocks.post_reset_password(
+            user.email, status=http.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        with pytest.raises(AuthAPIUnexpectedStatusCode):
+            mocks.run_async(
+                user.areset_password('new_password', 'test_token'))
+
+    @responses.activate
+    def test_arecord_sign_out(self):
+        id = 1
+        mocks.post_users(id, 'test@email.com')
+        user = mommy.make(KagisoUser, id=None)
+        url = mocks.delete_sessions(id)
+
+        did_sign_out = mocks.run_async(user.arecord_sign_out())
+
+        assert responses.calls[1].request.url == url
+
+        assert did_sign_out
+
+
+class SyncingFromAuthApiTest(TestCase):
+
+    def test_flag_is_restored_on_exit(self):
+        with syncing_from_auth_api():
+            with syncing_from_auth_api():
+                assert is_syncing_from_auth_api()
+            assert is_syncing_from_auth_api()
+
+        assert not is_syncing_from_auth_api()
+
+    def test_sync_does_not_disconnect_receiver(self):
+        data = {
+            'id': 55,
+            'email': 'test@email.com',
+            'created': str(timezone.now()),
+            'modified': str(timezone.now()),
+        }
+
+        receivers_before = list(pre_save.receivers)
+        KagisoUser.sync_user_data_locally(data)
+
+        assert pre_save.receivers == receivers_before
+
+    def test_concurrent_syncs_do_not_suppress_other_threads_saves(self):
+        number_of_threads = 8
+        iterations = 200
+        barrier = threading.Barrier(number_of_threads)
+        updates = []
+        lock = threading.Lock()
+
+        def record_update(user):
+            with lock:
+                updates.append(threading.current_thread().name)
+
+        def save(syncing):
+            user = KagisoUser(id=1, email='test@email.com')
+            barrier.wait()
+            for _ in range(iterations):
+                if syncing:
+                    with syncing_from_auth_api():
+                        pre_save.send(sender=KagisoUser, instance=user)
+                else:
+                    pre_save.send(sender=KagisoUser, instance=user)
+
+        threads = [
+            threading.Thread(
+                target=save,
+                args=(i % 2 == 0,),
+                name='syncing' if i % 2 == 0 else 'saving'
+            )
+            for i in range(number_of_threads)
+        ]
+
+        with patch.object(
+                KagisoUser,
+                '_update_user_in_auth_api',
+                autospec=True,
+                side_effect=record_update):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert len(updates) == (number_of_threads // 2) * iterations
+        assert set(updates) == {'saving'}
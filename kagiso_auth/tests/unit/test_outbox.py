@@ -0,0 +1,129 @@
+from datetime import timedelta
+import io
+from unittest.mock import patch
+
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from ... import settings
+from ...models import OutboxEmail
+from ...outbox import send_email, send_pending
+
+
+def make_message():
+    msg = EmailMessage()
+    msg.to = ['test@email.com']
+    msg.from_email = 'noreply@kagiso.io'
+    msg.subject = 'Confirm Your Account'
+    msg.template = 'xyz'
+    msg.substitution_data = {'token': 'abc', 'user_id': 1}
+    return msg
+
+
+class OutboxTest(TestCase):
+
+    def test_send_email_sends_immediately_when_outbox_disabled(self):
+        send_email(make_message())
+
+        assert len(mail.outbox) == 1
+        assert not OutboxEmail.objects.exists()
+
+    @patch.object(settings, 'AUTH_EMAIL_OUTBOX', True)
+    def test_send_email_enqueues_when_outbox_enabled(self):
+        send_email(make_message())
+
+        assert len(mail.outbox) == 0
+
+        email = OutboxEmail.objects.get()
+        assert email.to == ['test@email.com']
+        assert email.subject == 'Confirm Your Account'
+        assert email.template == 'xyz'
+        assert email.substitution_data == {'token': 'abc', 'user_id': 1}
+        assert email.status == OutboxEmail.PENDING
+
+    def test_send_pending_sends_due_emails(self):
+        OutboxEmail.objects.enqueue(make_message())
+        OutboxEmail.objects.enqueue(make_message())
+
+        sent, failed = send_pending()
+
+        assert (sent, failed) == (2, 0)
+        assert len(mail.outbox) == 2
+        assert mail.outbox[0].template == 'xyz'
+        assert not OutboxEmail.objects.exclude(status=OutboxEmail.SENT)
+        # Tokens are not kept once delivered
+        assert not OutboxEmail.objects.exclude(substitution_data=None)
+
+    def test_send_pending_skips_emails_not_yet_due(self):
+        email = OutboxEmail.objects.enqueue(make_message())
+        email.next_attempt = timezone.now() + timedelta(minutes=1)
+        email.save()
+
+        assert send_pending() == (0, 0)
+
+    def test_send_pending_respects_batch_size(self):
+        for _ in range(3):
+            OutboxEmail.objects.enqueue(make_message())
+
+        assert send_pending(batch_size=2) == (2, 0)
+        assert send_pending(batch_size=2) == (1, 0)
+
+    @patch('django.core.mail.EmailMessage.send', side_effect=IOError('down'))
+    def test_failed_send_is_retried_with_backoff(self, mock_send):
+        email = OutboxEmail.objects.enqueue(make_message())
+
+        assert send_pending() == (0, 1)
+
+        email.refresh_from_db()
+        assert email.status == OutboxEmail.PENDING
+        assert email.attempts == 1
+        assert email.last_error == 'down'
+        assert email.next_attempt > timezone.now()
+
+    @patch('django.core.mail.backends.locmem.EmailBackend.open',
+           side_effect=IOError('unreachable'))
+    def test_whole_batch_is_retried_when_provider_is_unreachable(
+            self, mock_open):
+        for _ in range(2):
+            OutboxEmail.objects.enqueue(make_message())
+
+        assert send_pending() == (0, 2)
+
+        assert len(mail.outbox) == 0
+        for email in OutboxEmail.objects.all():
+            assert email.status == OutboxEmail.PENDING
+            assert email.attempts == 1
+            assert email.last_error == 'unreachable'
+
+    @patch.object(settings, 'AUTH_EMAIL_OUTBOX_MAX_ATTEMPTS', 1)
+    @patch('django.core.mail.EmailMessage.send', side_effect=IOError('down'))
+    def test_gives_up_after_max_attempts(self, mock_send):
+        email = OutboxEmail.objects.enqueue(make_message())
+
+        send_pending()
+
+        email.refresh_from_db()
+        assert email.status == OutboxEmail.FAILED
+
+    def test_command_sends_everything_due_once(self):
+        for _ in range(3):
+            OutboxEmail.objects.enqueue(make_message())
+
+        call_command('kagiso_send_emails', once=True, batch_size=2)
+
+        assert len(mail.outbox) == 3
+
+    @patch('time.sleep', side_effect=KeyboardInterrupt)
+    @patch('django.core.mail.backends.locmem.EmailBackend.open',
+           side_effect=IOError('unreachable'))
+    def test_command_sleeps_when_nothing_could_be_sent(
+            self, mock_open, mock_sleep):
+        OutboxEmail.objects.enqueue(make_message())
+
+        with self.assertRaises(KeyboardInterrupt):
+            call_command('kagiso_send_emails', stdout=io.StringIO())
+
+        mock_sleep.assert_called_once_with(5)
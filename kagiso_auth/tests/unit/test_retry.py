@@ -0,0 +1,183 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+import pytest
+import requests
+import responses
+
+from ... import metrics, settings
+from ...auth_api_client import AuthApiClient
+from ...exceptions import AuthAPINetworkError
+from ...metrics import PrometheusSink
+from ...retry import RetryPolicy
+
+
+def stub_response(status_code, body=b'{}'):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body
+    return response
+
+
+@patch.object(RetryPolicy, 'RETRIES', 2)
+@patch('kagiso_auth.retry.time.sleep')
+class RetryPolicyTest(TestCase):
+
+    def test_retries_get_and_delete(self, mock_sleep):
+        assert RetryPolicy('GET').retryable
+        assert RetryPolicy('DELETE').retryable
+
+    def test_retries_post_and_put_only_with_idempotency_key(self, mock_sleep):
+        assert not RetryPolicy('POST').retryable
+        assert not RetryPolicy('PUT').retryable
+        assert RetryPolicy('POST', 'key').retryable
+        assert RetryPolicy('PUT', 'key').retryable
+
+    def test_no_retries_by_default(self, mock_sleep):
+        with patch.object(RetryPolicy, 'RETRIES', 0):
+            policy = RetryPolicy('GET')
+
+        assert not policy.backoff()
+
+    def test_backoff_is_jittered_and_capped(self, mock_sleep):
+        with patch.object(RetryPolicy, 'BACKOFF', 1), \
+                patch.object(RetryPolicy, 'MAX_BACKOFF', 1.5), \
+                patch('kagiso_auth.retry.random.uniform') as mock_uniform:
+            mock_uniform.side_effect = lambda low, high: high
+            policy = RetryPolicy('GET')
+            policy.backoff()
+            policy.backoff()
+
+        caps = [call[0][1] for call in mock_uniform.call_args_list]
+        assert caps == [1, 1.5]
+        assert mock_sleep.call_count == 2
+
+    def test_gives_up_after_retries(self, mock_sleep):
+        sink = PrometheusSink()
+        policy = RetryPolicy('GET')
+
+        with patch.object(metrics, 'SINK', sink):
+            assert policy.backoff()
+            assert policy.backoff()
+            assert not policy.backoff()
+
+        rendered = sink.render()
+        assert 'auth_api_retries_total{method="GET"} 2' in rendered
+        assert 'auth_api_retries_exhausted_total{method="GET"} 1' in rendered
+
+    def test_gives_up_rather_than_overrun_deadline(self, mock_sleep):
+        with patch.object(RetryPolicy, 'DEADLINE', 0):
+            policy = RetryPolicy('GET')
+
+        assert not policy.backoff()
+        assert not mock_sleep.called
+
+    def test_timeout_fits_within_deadline(self, mock_sleep):
+        with patch.object(RetryPolicy, 'DEADLINE', 2):
+            policy = RetryPolicy('GET')
+
+        assert policy.timeout(6) <= 2
+
+
+@patch.object(RetryPolicy, 'RETRIES', 2)
+@patch('kagiso_auth.retry.time.sleep')
+class AuthApiClientRetryTest(TestCase):
+
+    @patch('kagiso_auth.transport.requests.Session.request', autospec=True)
+    def test_get_is_retried_after_connection_error(
+            self, mock_request, mock_sleep):
+        mock_request.side_effect = [
+            requests.exceptions.ConnectionError,
+            stub_response(200, b'{"id": 1}'),
+        ]
+
+        status, data = AuthApiClient.call('users/test@email.com')
+
+        assert status == 200
+        assert data == {'id': 1}
+        assert mock_request.call_count == 2
+
+    @patch('kagiso_auth.transport.requests.Session.request', autospec=True)
+    def test_get_is_retried_after_unavailable(self, mock_request, mock_sleep):
+        mock_request.side_effect = [stub_response(503), stub_response(200)]
+
+        status, _ = AuthApiClient.call('users/test@email.com')
+
+        assert status == 200
+
+    @patch('kagiso_auth.transport.requests.Session.request', autospec=True)
+    def test_retried_call_is_logged_once(self, mock_request, mock_sleep):
+        mock_request.side_effect = [
+            requests.exceptions.Timeout,
+            stub_response(503),
+            stub_response(200),
+        ]
+
+        with self.assertLogs('django', 'DEBUG') as logs:
+            AuthApiClient.call('users/test@email.com')
+
+        assert len(logs.records) == 1
+        assert logs.records[0].auth_api_call['status'] == 200
+        assert logs.records[0].auth_api_call['attempts'] == 3
+
+    @patch('kagiso_auth.transport.requests.Session.request', autospec=True)
+    def test_failed_call_is_logged_with_last_error(
+            self, mock_request, mock_sleep):
+        mock_request.side_effect = requests.exceptions.ConnectionError
+
+        with self.assertLogs('django', 'DEBUG') as logs:
+            with pytest.raises(AuthAPINetworkError):
+                AuthApiClient.call('users/test@email.com')
+
+        assert len(logs.records) == 1
+        assert logs.records[0].auth_api_call['status'] == 'network_error'
+        assert logs.records[0].auth_api_call['attempts'] == 3
+
+    @patch('kagiso_auth.transport.requests.Session.request', autospec=True)
+    def test_last_error_is_raised_when_retries_run_out(
+            self, mock_request, mock_sleep):
+        mock_request.side_effect = requests.exceptions.ConnectionError
+
+        with pytest.raises(AuthAPINetworkError):
+            AuthApiClient.call('users/test@email.com')
+
+        assert mock_request.call_count == 3
+
+    @patch('kagiso_auth.transport.requests.Session.request', autospec=True)
+    def test_post_without_idempotency_key_is_not_retried(
+            self, mock_request, mock_sleep):
+        mock_request.side_effect = requests.exceptions.ConnectionError
+
+        with pytest.raises(AuthAPINetworkError):
+            AuthApiClient.call('sessions', 'POST', {})
+
+        assert mock_request.call_count == 1
+
+    @responses.activate
+    def test_post_with_idempotency_key_is_retried_with_same_key(
+            self, mock_sleep):
+        url = '{0}/sessions/.json'.format(AuthApiClient.BASE_URL)
+        statuses = iter([502, 200])
+        responses.add_callback(
+            responses.POST,
+            url,
+            callback=lambda request: (next(statuses), {}, '{}'),
+        )
+
+        status, _ = AuthApiClient.call(
+            'sessions', 'POST', {}, idempotency_key='abc')
+
+        assert status == 200
+        keys = [call.request.headers['Idempotency-Key']
+                for call in responses.calls]
+        assert keys == ['abc', 'abc']
+
+    @responses.activate
+    def test_idempotency_keys_can_be_generated(self, mock_sleep):
+        url = '{0}/sessions/.json'.format(AuthApiClient.BASE_URL)
+        responses.add(responses.POST, url, status=200, json={})
+
+        with patch.object(settings, 'AUTH_API_IDEMPOTENCY_KEYS', True):
+            AuthApiClient.call('sessions', 'POST', {})
+
+        assert responses.calls[0].request.headers['Idempotency-Key']
@@ -0,0 +1,144 @@
+import threading
+import time
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+import pytest
+
+from ...auth_api_client import AuthApiClient
+from ...cache import hash_key_part, make_key
+from ...single_flight import SingleFlight
+
+
+def call_concurrently(single_flight, number_of_callers, result):
+    """Have callers pile up behind one slow call, returning their results."""
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def func():
+        calls.append(1)
+        release.wait(5)
+        return result
+
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(single_flight.do('key', func)))
+        for _ in range(number_of_callers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    # Give every caller time to join the leader's call
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    return calls, results
+
+
+class SingleFlightTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_callers_share_one_call(self):
+        single_flight = SingleFlight()
+
+        calls, results = call_concurrently(single_flight, 10, (200, {'id': 1}))
+
+        assert len(calls) == 1
+        assert results == [(200, {'id': 1})] * 10
+        assert single_flight._calls == {}
+
+    def test_followers_get_their_own_copy(self):
+        single_flight = SingleFlight()
+
+        _, results = call_concurrently(single_flight, 2, (200, {'id': 1}))
+
+        assert results[0] == results[1]
+        assert results[0][1] is not results[1][1]
+
+    def test_leader_gets_its_own_copy_too(self):
+        single_flight = SingleFlight()
+        data = {'id': 1}
+
+        _, results = call_concurrently(single_flight, 3, (200, data))
+
+        assert results == [(200, {'id': 1})] * 3
+        assert all(result[1] is not data for result in results)
+
+    def test_lone_caller_gets_result_without_a_copy(self):
+        result = (200, {'id': 1})
+
+        assert SingleFlight().do('key', lambda: result) is result
+
+    def test_errors_are_raised_and_not_remembered(self):
+        single_flight = SingleFlight()
+
+        def fail():
+            raise ValueError
+
+        with pytest.raises(ValueError):
+            single_flight.do('key', fail)
+
+        assert single_flight.do('key', lambda: 'ok') == 'ok'
+
+    @patch.object(SingleFlight, 'LOCK_TIMEOUT', 5)
+    def test_waits_for_result_from_another_process(self):
+        single_flight = SingleFlight()
+        lock_key = make_key('single_flight', hash_key_part('key'), 'lock')
+        result_key = make_key('single_flight', hash_key_part('key'), 'result')
+        cache.set(lock_key, True)
+        cache.set(result_key, (200, {'id': 1}))
+
+        result = single_flight.do('key', lambda: pytest.fail('Called'))
+
+        assert result == (200, {'id': 1})
+
+    @patch.object(SingleFlight, 'LOCK_TIMEOUT', 5)
+    def test_calls_itself_if_other_process_gives_up(self):
+        single_flight = SingleFlight()
+        lock_key = make_key('single_flight', hash_key_part('key'), 'lock')
+        cache.set(lock_key, True)
+
+        with patch('kagiso_auth.single_flight.time.sleep') as mock_sleep:
+            mock_sleep.side_effect = lambda _: cache.delete(lock_key)
+            result = single_flight.do('key', lambda: 'ok')
+
+        assert result == 'ok'
+
+    @patch.object(SingleFlight, 'LOCK_TIMEOUT', 5)
+    def test_leader_publishes_result_and_releases_lock(self):
+        single_flight = SingleFlight()
+        lock_key = make_key('single_flight', hash_key_part('key'), 'lock')
+        result_key = make_key('single_flight', hash_key_part('key'), 'result')
+
+        single_flight.do('key', lambda: 'ok')
+
+        assert cache.get(lock_key) is None
+        assert cache.get(result_key) == 'ok'
+
+
+class AuthApiClientSingleFlightTest(TestCase):
+
+    @patch.object(AuthApiClient, '_send', return_value=(200, {}))
+    @patch.object(AuthApiClient, 'SINGLE_FLIGHT')
+    def test_only_gets_are_coalesced(self, mock_single_flight, mock_send):
+        AuthApiClient.call('users/test@email.com', 'GET')
+        AuthApiClient.call('users', 'POST', {'email': 'test@email.com'})
+
+        assert mock_single_flight.do.call_count == 1
+        key = mock_single_flight.do.call_args[0][0]
+        assert 'users/test@email.com' in key
+
+    @patch.object(AuthApiClient, '_send', return_value=(200, {}))
+    @patch.object(AuthApiClient, 'SINGLE_FLIGHT')
+    def test_can_be_disabled(self, mock_single_flight, mock_send):
+        with patch.object(AuthApiClient, 'SINGLE_FLIGHT_ENABLED', False):
+            AuthApiClient.call('users/test@email.com', 'GET')
+
+        assert not mock_single_flight.do.called
+        assert mock_send.called
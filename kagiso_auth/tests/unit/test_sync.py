@@ -0,0 +1,391 @@
+import io
+import json
+import os
+import tempfile
+
+from dateutil import parser
+from django.core.management import call_command
+from django.test import TestCase
+from model_mommy import mommy
+import responses
+
+from . import mocks
+from ... import sync
+from ...models import KagisoUser, SyncState
+
+
+class SyncTest(TestCase):
+
+    def test_read_json_lines_skips_blank_lines(self):
+        lines = ['{"id": 1}\n', '\n', '{"id": 2}\n']
+
+        assert list(sync.read_json_lines(lines)) == [{'id': 1}, {'id': 2}]
+
+    def test_batched(self):
+        batches = list(sync.batched(range(5), 2))
+
+        assert batches == [[0, 1], [2, 3], [4]]
+
+    @responses.activate
+    def test_iter_auth_api_users_follows_pages(self):
+        mocks.get_users(1, 2, [{'id': 1}, {'id': 2}], has_next=True)
+        mocks.get_users(2, 2, [{'id': 3}])
+
+        records = list(sync.iter_auth_api_users(page_size=2))
+
+        assert [record['id'] for record in records] == [1, 2, 3]
+        assert len(responses.calls) == 2
+
+    @responses.activate
+    def test_iter_auth_api_users_resumes_mid_page(self):
+        mocks.get_users(2, 2, [{'id': 3}, {'id': 4}])
+
+        records = list(sync.iter_auth_api_users(page_size=2, start=3))
+
+        assert [record['id'] for record in records] == [4]
+
+    def test_sync_users_creates_new_users(self):
+        records = [
+            mocks.user_data(1, 'one@email.com', profile={'region': 'GAUTENG'}),
+            mocks.user_data(2, 'two@email.com'),
+        ]
+
+        synced, skipped = sync.sync_users(records, batch_size=1)
+
+        assert (synced, skipped) == (2, [])
+        user = KagisoUser.objects.get(id=1)
+        assert user.email == 'one@email.com'
+        assert user.profile == {'region': 'GAUTENG'}
+        assert not user.has_usable_password()
+
+    @responses.activate
+    def test_sync_users_updates_existing_users_without_auth_api_calls(self):
+        mocks.post_users(1, 'one@email.com')
+        mommy.make(KagisoUser, id=None, is_active=False)
+        responses.reset()
+
+        sync.sync_users(
+            [mocks.user_data(1, 'new@email.com', first_name='Fred')])
+
+        assert len(responses.calls) == 0
+        user = KagisoUser.objects.get(id=1)
+        assert user.email == 'new@email.com'
+        assert user.first_name == 'Fred'
+        # Local only columns are left alone
+        assert not user.is_active
+
+    def test_sync_users_reports_progress(self):
+        records = [mocks.user_data(i, '{0}@email.com'.format(i))
+                   for i in range(1, 6)]
+        progress = []
+
+        sync.sync_users(records, batch_size=2, on_batch=progress.append)
+
+        assert progress == [2, 4, 5]
+
+    def test_upsert_users_keeps_latest_duplicate_in_batch(self):
+        users = list(sync.build_users([
+            mocks.user_data(1, 'old@email.com',
+                            modified='2016-01-02T00:00:00.000000Z'),
+            mocks.user_data(1, 'new@email.com',
+                            modified='2016-01-03T00:00:00.000000Z'),
+            mocks.user_data(1, 'older@email.com',
+                            modified='2016-01-01T00:00:00.000000Z'),
+        ]))
+
+        skipped = sync.upsert_users(users)
+
+        assert skipped == []
+        assert list(KagisoUser.objects.values_list('email', flat=True)) == \
+            ['new@email.com']
+
+    def test_upsert_users_skips_email_taken_by_another_user(self):
+        sync.sync_users([mocks.user_data(1, 'one@email.com')])
+        users = list(sync.build_users([
+            mocks.user_data(2, 'one@email.com'),
+            mocks.user_data(3, 'three@email.com'),
+        ]))
+
+        with self.assertLogs('django', 'WARNING'):
+            skipped = sync.upsert_users(users)
+
+        assert [user.id for user in skipped] == [2]
+        assert sorted(KagisoUser.objects.values_list('id', flat=True)) == \
+            [1, 3]
+
+    def test_upsert_users_skips_email_duplicated_in_batch(self):
+        users = list(sync.build_users([
+            mocks.user_data(1, 'same@email.com',
+                            modified='2016-01-01T00:00:00.000000Z'),
+            mocks.user_data(2, 'same@email.com',
+                            modified='2016-01-02T00:00:00.000000Z'),
+        ]))
+
+        with self.assertLogs('django', 'WARNING'):
+            skipped = sync.upsert_users(users)
+
+        assert [user.id for user in skipped] == [1]
+        assert list(KagisoUser.objects.values_list('id', flat=True)) == [2]
+
+    def test_sync_users_leaves_skipped_users_out_of_the_count(self):
+        sync.sync_users([mocks.user_data(1, 'one@email.com')])
+
+        with self.assertLogs('django', 'WARNING'):
+            synced, skipped = sync.sync_users([
+                mocks.user_data(2, 'one@email.com'),
+                mocks.user_data(3, 'three@email.com'),
+            ])
+
+        assert synced == 1
+        assert [user.id for user in skipped] == [2]
+
+    def test_command_reports_skipped_users(self):
+        sync.sync_users([mocks.user_data(1, 'one@email.com')])
+        records = [
+            mocks.user_data(2, 'one@email.com'),
+            mocks.user_data(3, 'three@email.com'),
+        ]
+        stdout = io.StringIO()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'users.jsonl')
+            with open(path, 'w') as f:
+                f.write('\n'.join(json.dumps(record) for record in records))
+
+            with self.assertLogs('django', 'WARNING'):
+                call_command('kagiso_sync_users', file=path, stdout=stdout)
+
+        output = stdout.getvalue()
+        assert 'Done, synced 1 users' in output
+        assert 'Skipped 1 users whose email is taken by another local ' \
+            'user: one@email.com' in output
+
+    def test_command_syncs_from_file_and_resumes_from_checkpoint(self):
+        records = [mocks.user_data(i, '{0}@email.com'.format(i))
+                   for i in range(1, 4)]
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'users.jsonl')
+            checkpoint = os.path.join(directory, 'checkpoint.json')
+            with open(path, 'w') as f:
+                f.write('\n'.join(json.dumps(record) for record in records))
+            with open(checkpoint, 'w') as f:
+                json.dump({'synced': 1}, f)
+
+            call_command(
+                'kagiso_sync_users',
+                file=path,
+                checkpoint=checkpoint,
+                stdout=io.StringIO()
+            )
+
+            assert not os.path.exists(checkpoint)
+
+        assert sorted(KagisoUser.objects.values_list('id', flat=True)) == \
+            [2, 3]
+
+
+class SyncModifiedUsersTest(TestCase):
+
+    @responses.activate
+    def test_first_run_syncs_everything_and_stores_high_water_mark(self):
+        mocks.get_users(1, 500, [
+            mocks.user_data(1, 'one@email.com',
+                            modified='2016-01-01T00:00:00.000000Z'),
+            mocks.user_data(2, 'two@email.com',
+                            modified='2016-01-02T00:00:00.000000Z'),
+        ], ordering='modified,id')
+
+        synced, skipped = sync.sync_modified_users()
+
+        assert synced == 2
+        state = SyncState.objects.get(name='users')
+        assert state.high_water_mark.isoformat() == \
+            '2016-01-02T00:00:00+00:00'
+        assert state.high_water_id == 2
+
+    @responses.activate
+    def test_next_run_only_asks_for_newer_users(self):
+        SyncState.objects.create(
+            name='users',
+            high_water_mark=parser.parse('2016-01-02T00:00:00Z'),
+            high_water_id=2
+        )
+        mocks.get_users(
+            1,
+            500,
+            [mocks.user_data(3, 'three@email.com',
+                             modified='2016-01-03T00:00:00.000000Z')],
+            ordering='modified,id',
+            modified_since='2016-01-02T00:00:00+00:00'
+        )
+
+        synced, skipped = sync.sync_modified_users()
+
+        assert synced == 1
+        assert KagisoUser.objects.get(id=3).email == 'three@email.com'
+        state = SyncState.objects.get(name='users')
+        assert state.high_water_mark.isoformat() == \
+            '2016-01-03T00:00:00+00:00'
+
+    @responses.activate
+    def test_ties_on_modified_are_broken_by_id(self):
+        SyncState.objects.create(
+            name='users',
+            high_water_mark=parser.parse('2016-01-02T00:00:00Z'),
+            high_water_id=5
+        )
+        mocks.get_users(
+            1,
+            500,
+            [
+                mocks.user_data(4, 'four@email.com',
+                                modified='2016-01-02T00:00:00.000000Z'),
+                mocks.user_data(5, 'five@email.com',
+                                modified='2016-01-02T00:00:00.000000Z'),
+                mocks.user_data(7, 'seven@email.com',
+                                modified='2016-01-02T00:00:00.000000Z'),
+            ],
+            ordering='modified,id',
+            modified_since='2016-01-02T00:00:00+00:00'
+        )
+
+        synced, skipped = sync.sync_modified_users()
+
+        assert synced == 1
+        assert list(KagisoUser.objects.values_list('id', flat=True)) == [7]
+        state = SyncState.objects.get(name='users')
+        assert state.high_water_id == 7
+
+    @responses.activate
+    def test_user_modified_mid_run_is_not_skipped(self):
+        one = mocks.user_data(1, 'one@email.com',
+                              modified='2016-01-01T00:00:00.000000Z')
+        two = mocks.user_data(2, 'two@email.com',
+                              modified='2016-01-02T00:00:00.000000Z')
+        three = mocks.user_data(3, 'three@email.com',
+                                modified='2016-01-03T00:00:00.000000Z')
+        # User one is modified after the first page is fetched, which moves
+        # it behind user three
+        one_again = mocks.user_data(1, 'one@new.com',
+                                    modified='2016-01-04T00:00:00.000000Z')
+        mocks.get_users(1, 2, [one, two], has_next=True,
+                        ordering='modified,id')
+        mocks.get_users(1, 2, [two, three], has_next=True,
+                        ordering='modified,id',
+                        modified_since='2016-01-02T00:00:00+00:00')
+        mocks.get_users(1, 2, [three, one_again],
+                        ordering='modified,id',
+                        modified_since='2016-01-03T00:00:00+00:00')
+
+        synced, skipped = sync.sync_modified_users(page_size=2)
+
+        assert synced == 4
+        assert KagisoUser.objects.get(id=1).email == 'one@new.com'
+        assert KagisoUser.objects.filter(id=3).exists()
+        state = SyncState.objects.get(name='users')
+        assert state.high_water_mark.isoformat() == \
+            '2016-01-04T00:00:00+00:00'
+        assert state.high_water_id == 1
+
+    @responses.activate
+    def test_page_of_ties_already_seen_moves_to_next_page(self):
+        SyncState.objects.create(
+            name='users',
+            high_water_mark=parser.parse('2016-01-02T00:00:00Z'),
+            high_water_id=2
+        )
+        mocks.get_users(
+            1,
+            2,
+            [
+                mocks.user_data(1, 'one@email.com',
+                                modified='2016-01-02T00:00:00.000000Z'),
+                mocks.user_data(2, 'two@email.com',
+                                modified='2016-01-02T00:00:00.000000Z'),
+            ],
+            has_next=True,
+            ordering='modified,id',
+            modified_since='2016-01-02T00:00:00+00:00'
+        )
+        mocks.get_users(
+            2,
+            2,
+            [mocks.user_data(3, 'three@email.com',
+                             modified='2016-01-02T00:00:00.000000Z')],
+            ordering='modified,id',
+            modified_since='2016-01-02T00:00:00+00:00'
+        )
+
+        synced, skipped = sync.sync_modified_users(page_size=2)
+
+        assert synced == 1
+        assert SyncState.objects.get(name='users').high_water_id == 3
+
+    @responses.activate
+    def test_skipped_users_are_synced_once_their_email_is_free(self):
+        sync.sync_users([mocks.user_data(9, 'taken@email.com')])
+        one = mocks.user_data(1, 'one@email.com',
+                              modified='2016-01-01T00:00:00.000000Z')
+        two = mocks.user_data(2, 'taken@email.com',
+                              modified='2016-01-02T00:00:00.000000Z')
+        three = mocks.user_data(3, 'three@email.com',
+                                modified='2016-01-03T00:00:00.000000Z')
+        mocks.get_users(1, 500, [one, two, three], ordering='modified,id')
+
+        with self.assertLogs('django', 'WARNING'):
+            synced, skipped = sync.sync_modified_users()
+
+        assert synced == 2
+        assert [user.id for user in skipped] == [2]
+        # The mark stops before user two, so the next run asks for it again
+        state = SyncState.objects.get(name='users')
+        assert state.high_water_mark.isoformat() == \
+            '2016-01-01T00:00:00+00:00'
+        assert state.high_water_id == 1
+
+        # User nine's email changes, which frees it up for user two
+        sync.sync_users([mocks.user_data(9, 'nine@email.com')])
+        responses.reset()
+        mocks.get_users(1, 500, [two, three], ordering='modified,id',
+                        modified_since='2016-01-01T00:00:00+00:00')
+
+        synced, skipped = sync.sync_modified_users()
+
+        assert (synced, skipped) == (2, [])
+        assert KagisoUser.objects.get(id=2).email == 'taken@email.com'
+        state = SyncState.objects.get(name='users')
+        assert state.high_water_id == 3
+
+    @responses.activate
+    def test_high_water_mark_never_moves_backwards(self):
+        SyncState.objects.create(
+            name='users',
+            high_water_mark=parser.parse('2016-01-05T00:00:00Z')
+        )
+        mocks.get_users(
+            1,
+            500,
+            [mocks.user_data(3, 'three@email.com',
+                             modified='2016-01-03T00:00:00.000000Z')],
+            ordering='modified,id',
+            modified_since='2016-01-05T00:00:00+00:00'
+        )
+
+        sync.sync_modified_users()
+
+        state = SyncState.objects.get(name='users')
+        assert state.high_water_mark.isoformat() == \
+            '2016-01-05T00:00:00+00:00'
+
+    @responses.activate
+    def test_command_incremental(self):
+        mocks.get_users(1, 500, [], ordering='modified,id')
+
+        call_command(
+            'kagiso_sync_users',
+            incremental=True,
+            stdout=io.StringIO()
+        )
+
+        assert SyncState.objects.filter(name='users').exists()
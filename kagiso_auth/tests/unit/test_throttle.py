@@ -0,0 +1,110 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+from freezegun import freeze_time
+import responses
+
+from . import mocks
+from ... import http, metrics
+from ...backends import KagisoBackend
+from ...metrics import PrometheusSink
+from ...throttle import SignInThrottle
+
+
+@patch.object(SignInThrottle, 'ENABLED', True)
+@patch.object(SignInThrottle, 'EMAIL_LIMIT', 2)
+@patch.object(SignInThrottle, 'IP_LIMIT', 3)
+@patch.object(SignInThrottle, 'PERIOD', 60)
+@patch.object(SignInThrottle, 'NEGATIVE_TTL', 30)
+class SignInThrottleTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_known_failure_is_blocked(self):
+        SignInThrottle.record_failure('test@email.com', 'wrong')
+
+        assert SignInThrottle.blocked_reason(
+            'TEST@email.com', 'wrong') == 'known_failure'
+        assert SignInThrottle.blocked_reason('test@email.com', 'right') is None
+
+    def test_passwords_are_not_stored(self):
+        SignInThrottle.record_failure('test@email.com', 'hunter2')
+
+        for key in cache._cache:
+            assert 'hunter2' not in key
+
+    def test_email_limit(self):
+        SignInThrottle.record_failure('test@email.com', 'one')
+        SignInThrottle.record_failure('test@email.com', 'two')
+
+        assert SignInThrottle.blocked_reason(
+            'test@email.com', 'three') == 'email'
+
+    def test_ip_limit(self):
+        for i in range(3):
+            SignInThrottle.record_failure(
+                '{0}@email.com'.format(i), 'wrong', '10.0.0.1')
+
+        assert SignInThrottle.blocked_reason(
+            'new@email.com', 'wrong', '10.0.0.1') == 'ip'
+        assert SignInThrottle.blocked_reason(
+            'new@email.com', 'wrong', '10.0.0.2') is None
+
+    def test_failures_drain_over_time(self):
+        with freeze_time('2016-01-01 00:00:00'):
+            SignInThrottle.record_failure('test@email.com', 'one')
+            SignInThrottle.record_failure('test@email.com', 'two')
+
+        with freeze_time('2016-01-01 00:01:30'):
+            # Half of the previous window still counts
+            assert SignInThrottle.blocked_reason(
+                'test@email.com', 'three') is None
+
+    def test_success_resets_email_count(self):
+        SignInThrottle.record_failure('test@email.com', 'one')
+        SignInThrottle.record_failure('test@email.com', 'two')
+
+        SignInThrottle.record_success('test@email.com')
+
+        assert SignInThrottle.blocked_reason(
+            'test@email.com', 'three') is None
+
+    def test_disabled_never_blocks(self):
+        SignInThrottle.record_failure('test@email.com', 'wrong')
+
+        with patch.object(SignInThrottle, 'ENABLED', False):
+            assert SignInThrottle.blocked_reason(
+                'test@email.com', 'wrong') is None
+
+    @responses.activate
+    def test_authenticate_skips_auth_api_for_repeat_failures(self):
+        mocks.post_sessions(http.HTTP_404_NOT_FOUND)
+        request = RequestFactory().post('/sign_in/', REMOTE_ADDR='10.0.0.1')
+        backend = KagisoBackend()
+        sink = PrometheusSink()
+
+        with patch.object(metrics, 'SINK', sink):
+            for _ in range(3):
+                user = backend.authenticate(
+                    email='test@email.com',
+                    password='wrong',
+                    request=request
+                )
+                assert user is None
+
+        assert len(responses.calls) == 1
+        assert (
+            'auth_sign_in_short_circuited_total{reason="known_failure"} 2'
+        ) in sink.render()
+
+    @responses.activate
+    def test_social_sign_ins_are_not_throttled(self):
+        mocks.post_sessions(http.HTTP_404_NOT_FOUND)
+        backend = KagisoBackend()
+
+        backend.authenticate(email='test@email.com', strategy='facebook')
+        backend.authenticate(email='test@email.com', strategy='facebook')
+
+        assert len(responses.calls) == 2
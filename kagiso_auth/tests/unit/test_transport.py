@@ -0,0 +1,69 @@
+from http.client import HTTPMessage
+from unittest.mock import patch
+
+import requests
+from requests.cookies import MockRequest, MockResponse
+import responses
+
+from ...transport import SessionTransport
+
+
+class TestSessionTransport:
+
+    def test_session_is_reused_between_calls(self):
+        transport = SessionTransport()
+
+        assert transport.session is transport.session
+
+    def test_session_is_recreated_after_fork(self):
+        transport = SessionTransport()
+        parent_session = transport.session
+
+        with patch('kagiso_auth.transport.os.getpid', return_value=-1):
+            child_session = transport.session
+
+        assert child_session is not parent_session
+
+    def test_close_discards_session(self):
+        transport = SessionTransport()
+        session = transport.session
+
+        transport.close()
+
+        assert transport.session is not session
+
+    def test_pool_settings_are_applied_to_adapter(self):
+        transport = SessionTransport(pool_connections=3, pool_maxsize=7)
+
+        adapter = transport.session.get_adapter('https://auth.kagiso.io')
+
+        assert adapter._pool_connections == 3
+        assert adapter._pool_maxsize == 7
+
+    def test_keep_alive_disabled_sends_connection_close(self):
+        transport = SessionTransport(keep_alive=False)
+
+        assert transport.session.headers['Connection'] == 'close'
+
+    @responses.activate
+    def test_request_goes_through_session(self):
+        url = 'https://auth.kagiso.io/api/v1/users/.json'
+        responses.add(responses.GET, url, body='{}', status=200)
+        transport = SessionTransport()
+
+        response = transport.request('GET', url, timeout=1)
+
+        assert response.status_code == 200
+        assert len(responses.calls) == 1
+
+    def test_cookies_are_not_kept_between_calls(self):
+        transport = SessionTransport()
+        request = requests.Request(
+            'GET', 'https://auth.kagiso.io/api/v1/users/.json').prepare()
+        headers = HTTPMessage()
+        headers['Set-Cookie'] = 'session=user-one; Path=/'
+
+        transport.session.cookies.extract_cookies(
+            MockResponse(headers), MockRequest(request))
+
+        assert len(transport.session.cookies) == 0
@@ -0,0 +1,39 @@
+from dateutil import parser
+from django.test import TestCase
+
+from ...utils import parse_datetime
+
+
+class ParseDatetimeTest(TestCase):
+
+    def test_matches_dateutil_for_auth_api_timestamps(self):
+        values = [
+            '2015-04-21T08:18:30.368602Z',
+            '2015-04-21T08:18:30.3Z',
+            '2015-04-21T08:18:30Z',
+            '2016-02-29T23:59:59.999999Z',
+        ]
+
+        for value in values:
+            parsed = parse_datetime(value)
+            expected = parser.parse(value)
+            assert parsed == expected
+            assert parsed.tzinfo == expected.tzinfo
+            assert parsed.utcoffset() == expected.utcoffset()
+
+    def test_other_formats_fall_back_to_dateutil(self):
+        values = [
+            '2015-04-21T10:18:30.368602+02:00',
+            '2015-04-21 08:18:30',
+            '2015-04-21',
+        ]
+
+        for value in values:
+            parsed = parse_datetime(value)
+            expected = parser.parse(value)
+            assert parsed == expected
+            assert parsed.tzinfo == expected.tzinfo
+
+    def test_invalid_dates_still_raise(self):
+        with self.assertRaises(ValueError):
+            parse_datetime('2015-02-30T08:18:30Z')
@@ -1,6 +1,7 @@
 from datetime import date
-from unittest.mock import MagicMock, patch
+from unittest.mock import ANY, MagicMock, patch
 
+from django.conf import settings
 from django.core import mail
 from django.db.utils import IntegrityError
 from django.test import RequestFactory, TestCase
@@ -257,6 +258,38 @@ class SignInTest(TestCase):
         assert mock_login.called
         assert mock_user.is_authenticated
 
+    @patch('kagiso_auth.views.login', autospec=True)
+    @patch('kagiso_auth.views.authenticate', autospec=True)
+    def test_sign_in_records_app_name_with_session(self, mock_authenticate, mock_login):  # noqa
+        mock_user = MagicMock()
+        mock_user.last_sign_in_via = settings.APP_NAME
+        data = {'email': 'test@email.com', 'password': 'secret'}
+        mock_authenticate.return_value = mock_user
+
+        self.client.post('/sign_in/', data, follow=True)
+
+        mock_authenticate.assert_called_with(
+            email=data['email'],
+            password=data['password'],
+            app_name=settings.APP_NAME,
+            request=ANY,
+        )
+        assert not mock_user.save.called
+        assert mock_login.called
+
+    @patch('kagiso_auth.views.login', autospec=True)
+    @patch('kagiso_auth.views.authenticate', autospec=True)
+    def test_sign_in_updates_app_name_if_session_ignored_it(self, mock_authenticate, mock_login):  # noqa
+        mock_user = MagicMock()
+        mock_user.last_sign_in_via = 'Another App'
+        data = {'email': 'test@email.com', 'password': 'secret'}
+        mock_authenticate.return_value = mock_user
+
+        self.client.post('/sign_in/', data, follow=True)
+
+        assert mock_user.last_sign_in_via == settings.APP_NAME
+        assert mock_user.save.called
+
     @patch('kagiso_auth.views.login', autospec=True)
     @patch('kagiso_auth.views.authenticate', autospec=True)
     def test_redirects_to_next_url(self, mock_authenticate, mock_login):
@@ -0,0 +1,259 @@
+import json
+import time
+from unittest.mock import patch
+
+from dateutil import parser
+from django.core.cache import cache
+from django.test import TestCase
+from model_mommy import mommy
+import responses
+
+from . import mocks
+from ... import settings, webhooks
+from ...backends import KagisoBackend
+from ...cache import AuthenticatedUserCache, UserLookupCache
+from ...models import KagisoUser
+
+
+SECRET = 'webhook-secret'
+
+
+@patch.object(settings, 'AUTH_API_WEBHOOK_SECRET', SECRET)
+class WebhookTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def _make_user(self, id, email):
+        mocks.post_users(id, email)
+        user = mommy.make(KagisoUser, id=None, email=email)
+        responses.reset()
+        return user
+
+    def _post(self, events, signature=None, timestamp=None):
+        body = json.dumps({'events': events}).encode('utf-8')
+        return self._post_body(body, signature, timestamp)
+
+    def _post_body(self, body, signature=None, timestamp=None):
+        if timestamp is None:
+            timestamp = int(time.time())
+        if signature is None:
+            signature = webhooks.sign(body, SECRET, timestamp)
+
+        return self.client.post(
+            '/auth_api_webhook/',
+            body,
+            content_type='application/json',
+            HTTP_X_AUTH_API_SIGNATURE=signature,
+            HTTP_X_AUTH_API_TIMESTAMP=str(timestamp)
+        )
+
+    def test_verify_signature(self):
+        body = b'{"events": []}'
+        now = str(int(time.time()))
+
+        assert webhooks.verify_signature(
+            body, webhooks.sign(body, SECRET, now), now)
+        assert not webhooks.verify_signature(
+            body, webhooks.sign(body, 'x', now), now)
+        assert not webhooks.verify_signature(body, None, now)
+        assert not webhooks.verify_signature(
+            body, webhooks.sign(body, SECRET, now), None)
+
+    def test_verify_signature_covers_timestamp(self):
+        body = b'{"events": []}'
+        now = int(time.time())
+
+        assert not webhooks.verify_signature(
+            body, webhooks.sign(body, SECRET, now), str(now - 1))
+
+    def test_verify_signature_rejects_old_timestamps(self):
+        body = b'{"events": []}'
+        old = int(time.time()) - settings.AUTH_API_WEBHOOK_TOLERANCE - 10
+
+        assert not webhooks.verify_signature(
+            body, webhooks.sign(body, SECRET, old), str(old))
+        assert not webhooks.verify_signature(
+            body, webhooks.sign(body, SECRET, 'soon'), 'soon')
+
+    def test_verify_signature_without_secret_rejects_everything(self):
+        body = b'{"events": []}'
+        now = str(int(time.time()))
+
+        with patch.object(settings, 'AUTH_API_WEBHOOK_SECRET', None):
+            assert not webhooks.verify_signature(
+                body, webhooks.sign(body, SECRET, now), now)
+
+    def test_replayed_delivery_is_forbidden(self):
+        old = int(time.time()) - settings.AUTH_API_WEBHOOK_TOLERANCE - 10
+
+        response = self._post([], timestamp=old)
+
+        assert response.status_code == 403
+
+    def test_bad_signature_is_forbidden(self):
+        response = self._post([], signature='sha256=nope')
+
+        assert response.status_code == 403
+
+    def test_only_post_is_allowed(self):
+        response = self.client.get('/auth_api_webhook/')
+
+        assert response.status_code == 405
+
+    def test_invalid_body_is_bad_request(self):
+        response = self._post_body(b'not json')
+
+        assert response.status_code == 400
+
+    @responses.activate
+    def test_malformed_event_is_bad_request_and_applies_nothing(self):
+        user = self._make_user(1, 'test@email.com')
+        data = mocks.user_data(2, 'two@email.com')
+        del data['modified']
+
+        response = self._post([
+            {'type': 'user.deleted', 'data': {'id': 1}},
+            {'type': 'user.changed', 'data': data},
+        ])
+
+        assert response.status_code == 400
+        assert KagisoUser.objects.filter(id=user.id).exists()
+        assert not KagisoUser.objects.filter(id=2).exists()
+
+    def test_event_without_id_is_bad_request(self):
+        response = self._post([{'type': 'session.revoked', 'data': {}}])
+
+        assert response.status_code == 400
+
+    @responses.activate
+    def test_out_of_order_change_is_skipped(self):
+        self._make_user(1, 'test@email.com')
+        KagisoUser.objects.filter(id=1).update(
+            email='newer@email.com',
+            modified=parser.parse('2016-01-02T00:00:00Z')
+        )
+
+        response = self._post([
+            {'type': 'user.changed',
+             'data': mocks.user_data(1, 'older@email.com',
+                                     modified='2016-01-01T00:00:00Z')},
+        ])
+
+        assert response.json() == {'applied': 0}
+        assert KagisoUser.objects.get(id=1).email == 'newer@email.com'
+
+    def test_older_change_in_same_batch_does_not_win(self):
+        response = self._post([
+            {'type': 'user.changed',
+             'data': mocks.user_data(1, 'newer@email.com',
+                                     modified='2016-01-02T00:00:00Z')},
+            {'type': 'user.changed',
+             'data': mocks.user_data(1, 'older@email.com',
+                                     modified='2016-01-01T00:00:00Z')},
+        ])
+
+        assert response.json() == {'applied': 1}
+        assert KagisoUser.objects.get(id=1).email == 'newer@email.com'
+
+    @responses.activate
+    def test_user_changed_upserts_without_auth_api_calls(self):
+        self._make_user(1, 'old@email.com')
+        events = [
+            {'type': 'user.changed',
+             'data': mocks.user_data(1, 'stale@email.com')},
+            {'type': 'user.changed',
+             'data': mocks.user_data(1, 'new@email.com', first_name='Fred')},
+            {'type': 'user.changed', 'data': mocks.user_data(2, 'a@b.com')},
+        ]
+
+        response = self._post(events)
+
+        assert response.status_code == 200
+        assert response.json() == {'applied': 3}
+        assert len(responses.calls) == 0
+        user = KagisoUser.objects.get(id=1)
+        assert user.email == 'new@email.com'
+        assert user.first_name == 'Fred'
+        assert KagisoUser.objects.filter(id=2, email='a@b.com').exists()
+
+    @responses.activate
+    def test_change_skipped_for_email_conflict_is_redelivered(self):
+        self._make_user(1, 'taken@email.com')
+        events = [
+            {'type': 'user.changed',
+             'data': mocks.user_data(2, 'taken@email.com')},
+            {'type': 'user.changed', 'data': mocks.user_data(3, 'a@b.com')},
+        ]
+
+        with self.assertLogs('django', 'WARNING'):
+            response = self._post(events)
+
+        assert response.status_code == 409
+        assert response.json() == {'applied': 1, 'skipped': [2]}
+        assert not KagisoUser.objects.filter(id=2).exists()
+        assert KagisoUser.objects.filter(id=3).exists()
+
+        # Once the email is free, the redelivered batch applies in full
+        KagisoUser.objects.filter(id=1).update(email='one@email.com')
+        response = self._post(events)
+
+        assert response.status_code == 200
+        assert response.json() == {'applied': 2}
+        assert KagisoUser.objects.get(id=2).email == 'taken@email.com'
+
+    @responses.activate
+    def test_user_deleted_deletes_without_auth_api_calls(self):
+        self._make_user(1, 'test@email.com')
+
+        response = self._post([
+            {'type': 'user.deleted',
+             'data': {'id': 1, 'email': 'test@email.com'}},
+        ])
+
+        assert response.status_code == 200
+        assert len(responses.calls) == 0
+        assert not KagisoUser.objects.filter(id=1).exists()
+
+    @responses.activate
+    def test_session_revoked_ends_sessions(self):
+        user = self._make_user(1, 'test@email.com')
+        hash_before = user.get_session_auth_hash()
+
+        self._post([{'type': 'session.revoked', 'data': {'id': 1}}])
+
+        user = KagisoUser.objects.get(id=1)
+        assert user.get_session_auth_hash() != hash_before
+        assert not user.has_usable_password()
+
+    def test_unknown_events_are_ignored(self):
+        response = self._post([{'type': 'user.teleported', 'data': {}}])
+
+        assert response.json() == {'applied': 0}
+
+    @responses.activate
+    @patch.object(UserLookupCache, 'TTL', 60)
+    def test_events_invalidate_cached_lookups(self):
+        self._make_user(1, 'old@email.com')
+        UserLookupCache.set('old@email.com', 200, {'id': 1})
+
+        self._post([
+            {'type': 'user.changed',
+             'data': mocks.user_data(1, 'new@email.com')},
+        ])
+
+        fetch = lambda: (404, {})  # noqa: E731
+        status, _ = UserLookupCache.get('old@email.com', fetch)
+        assert status == 404
+
+    @responses.activate
+    @patch.object(AuthenticatedUserCache, 'TTL', 60)
+    def test_session_revoked_drops_cached_authenticated_user(self):
+        user = self._make_user(1, 'test@email.com')
+        hash_before = user.get_session_auth_hash()
+        KagisoBackend().get_user(user.id)
+
+        self._post([{'type': 'session.revoked', 'data': {'id': 1}}])
+
+        user = KagisoBackend().get_user(user.id)
+        assert user.get_session_auth_hash() != hash_before
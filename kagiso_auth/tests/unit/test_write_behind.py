@@ -0,0 +1,247 @@
+from datetime import timedelta
+import json
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+import responses
+
+from . import mocks
+from ... import http, settings
+from ...auth_api_client import AuthApiClient
+from ...models import KagisoUser, OutboxUserUpdate, syncing_from_auth_api
+from ...write_behind import flush_pending
+
+
+def get_user_modified_later(id, email, **kwargs):
+    # An Auth API copy edited after anything queued in these tests
+    url = 'https://auth.kagiso.io/api/v1/users/{email}/.json'.format(
+        email=email)
+    data = mocks.user_data(
+        id, email, modified='2099-01-01T00:00:00Z', **kwargs)
+    responses.add(responses.GET, url, body=json.dumps(data))
+    return url, data
+
+
+@patch.object(settings, 'AUTH_API_WRITE_BEHIND', True)
+class WriteBehindTest(TestCase):
+
+    def setUp(self):
+        data = mocks.user_data(
+            1, 'test@email.com', first_name='Fred', profile={'region': 'WC'})
+        with syncing_from_auth_api():
+            self.user = KagisoUser.sync_user_data_locally(data)
+
+    @responses.activate
+    def test_profile_changes_are_queued_not_sent(self):
+        self.user.profile = {'region': 'GP'}
+        self.user.save()
+
+        assert len(responses.calls) == 0
+        assert KagisoUser.objects.get(id=1).profile == {'region': 'GP'}
+        update = OutboxUserUpdate.objects.get()
+        assert update.changes == {'profile': {'region': 'GP'}}
+        assert update.original == {'profile': {'region': 'WC'}}
+
+    @responses.activate
+    def test_queued_changes_are_merged_per_user(self):
+        self.user.profile = {'region': 'GP'}
+        self.user.save()
+        self.user.profile = {'region': 'KZN'}
+        self.user.first_name = 'Bob'
+        self.user.save()
+
+        update = OutboxUserUpdate.objects.get()
+        assert update.changes == {
+            'profile': {'region': 'KZN'},
+            'first_name': 'Bob',
+        }
+        assert update.original == {
+            'profile': {'region': 'WC'},
+            'first_name': 'Fred',
+        }
+
+    @responses.activate
+    def test_other_changes_are_sent_with_queued_changes(self):
+        self.user.profile = {'region': 'GP'}
+        self.user.save()
+        mocks.put_users(1, 'new@email.com', profile={'region': 'GP'})
+
+        self.user.email = 'new@email.com'
+        self.user.save()
+
+        payload = json.loads(responses.calls[0].request.body)
+        assert payload == {
+            'email': 'new@email.com',
+            'profile': {'region': 'GP'},
+        }
+        assert not OutboxUserUpdate.objects.exists()
+
+    @responses.activate
+    def test_disabled_sends_immediately(self):
+        mocks.put_users(1, 'test@email.com', profile={'region': 'GP'})
+
+        with patch.object(settings, 'AUTH_API_WRITE_BEHIND', False):
+            self.user.profile = {'region': 'GP'}
+            self.user.save()
+
+        assert len(responses.calls) == 1
+        assert not OutboxUserUpdate.objects.exists()
+
+    @responses.activate
+    def test_syncing_keeps_queued_changes(self):
+        self.user.profile = {'region': 'GP'}
+        self.user.save()
+
+        user = KagisoUser.sync_user_data_locally(
+            mocks.user_data(1, 'test@email.com', profile={'region': 'WC'}))
+
+        assert user.profile == {'region': 'GP'}
+
+    @responses.activate
+    def test_flush_sends_one_put_per_user(self):
+        self.user.profile = {'region': 'GP'}
+        self.user.save()
+        self.user.first_name = 'Bob'
+        self.user.save()
+        mocks.get_user_by_email(1, 'test@email.com')
+        mocks.put_users(
+            1, 'test@email.com', first_name='Bob', profile={'region': 'GP'})
+
+        sent, conflicts, failed = flush_pending()
+
+        assert (sent, conflicts, failed) == (1, 0, 0)
+        put = responses.calls[1].request
+        assert put.method == 'PUT'
+        assert json.loads(put.body) == {
+            'first_name': 'Bob',
+            'profile': {'region': 'GP'},
+        }
+        assert not OutboxUserUpdate.objects.exists()
+
+    @responses.activate
+    def test_flush_keeps_newer_auth_api_edits(self):
+        self.user.profile = {'region': 'GP'}
+        self.user.first_name = 'Bob'
+        self.user.save()
+        # Profile was edited on the Auth API after our change, first_name
+        # was not
+        get_user_modified_later(
+            1, 'test@email.com', first_name='Fred', profile={'region': 'EC'})
+        mocks.put_users(
+            1, 'test@email.com', first_name='Bob', profile={'region': 'EC'})
+
+        sent, conflicts, failed = flush_pending()
+
+        assert (sent, conflicts, failed) == (1, 1, 0)
+        assert json.loads(responses.calls[1].request.body) == {
+            'first_name': 'Bob',
+        }
+        user = KagisoUser.objects.get(id=1)
+        assert user.profile == {'region': 'EC'}
+        assert user.first_name == 'Bob'
+
+    @responses.activate
+    def test_flush_retries_failures(self):
+        self.user.profile = {'region': 'GP'}
+        self.user.save()
+        mocks.get_user_by_email(1, 'test@email.com')
+        mocks.put_users(
+            1, 'test@email.com', status=http.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        sent, conflicts, failed = flush_pending()
+
+        assert (sent, conflicts, failed) == (0, 0, 1)
+        update = OutboxUserUpdate.objects.get()
+        assert update.attempts == 1
+        assert update.status == OutboxUserUpdate.PENDING
+        assert update.next_attempt > update.changed_at
+
+    @responses.activate
+    def test_flush_drops_updates_for_users_gone_from_auth_api(self):
+        self.user.profile = {'region': 'GP'}
+        self.user.save()
+        mocks.get_user_by_email(
+            1, 'test@email.com', status=http.HTTP_404_NOT_FOUND)
+        mocks.put_users(1, 'test@email.com', status=http.HTTP_404_NOT_FOUND)
+
+        flush_pending()
+
+        assert not OutboxUserUpdate.objects.exists()
+
+    @responses.activate
+    def test_flush_fails_only_updates_with_malformed_responses(self):
+        data = mocks.user_data(2, 'other@email.com')
+        with syncing_from_auth_api():
+            other = KagisoUser.sync_user_data_locally(data)
+        self.user.profile = {'region': 'GP'}
+        self.user.save()
+        other.profile = {'region': 'GP'}
+        other.save()
+        mocks.get_user_by_email(1, 'test@email.com')
+        mocks.put_users(1, 'test@email.com', profile={'region': 'GP'})
+        responses.add(
+            responses.GET,
+            'https://auth.kagiso.io/api/v1/users/other@email.com/.json',
+            body=json.dumps({'id': 2}),
+        )
+
+        sent, conflicts, failed = flush_pending()
+
+        assert (sent, conflicts, failed) == (1, 0, 1)
+        update = OutboxUserUpdate.objects.get()
+        assert update.user_id == 2
+        assert update.attempts == 1
+        assert 'modified' in update.last_error
+
+    @responses.activate
+    def test_flush_keeps_changes_queued_while_sending(self):
+        self.user.profile = {'region': 'GP'}
+        self.user.save()
+        mocks.get_user_by_email(1, 'test@email.com')
+        mocks.put_users(1, 'test@email.com', profile={'region': 'GP'})
+        call = AuthApiClient.call
+
+        def call_and_edit(endpoint, method='GET', *args, **kwargs):
+            if method == 'PUT':
+                user = KagisoUser.objects.get(id=1)
+                user.profile = {'region': 'EC'}
+                user.save()
+            return call(endpoint, method, *args, **kwargs)
+
+        with patch.object(AuthApiClient, 'call', side_effect=call_and_edit):
+            sent, conflicts, failed = flush_pending()
+
+        assert (sent, conflicts, failed) == (1, 0, 0)
+        update = OutboxUserUpdate.objects.get()
+        assert update.changes == {'profile': {'region': 'EC'}}
+        assert update.next_attempt <= timezone.now()
+        assert KagisoUser.objects.get(id=1).profile == {'region': 'EC'}
+
+    def test_leased_updates_are_not_due_until_the_lease_runs_out(self):
+        self.user.profile = {'region': 'GP'}
+        self.user.save()
+
+        leased = OutboxUserUpdate.objects.lease(10, 60)
+
+        assert [update.user_id for update in leased] == [1]
+        assert OutboxUserUpdate.objects.lease(10, 60) == []
+        update = OutboxUserUpdate.objects.get()
+        assert update.next_attempt > timezone.now()
+
+        with patch.object(
+                timezone, 'now',
+                return_value=update.next_attempt + timedelta(seconds=1)):
+            assert OutboxUserUpdate.objects.lease(10, 60) == [update]
+
+    @responses.activate
+    def test_command_flushes_once(self):
+        self.user.profile = {'region': 'GP'}
+        self.user.save()
+        mocks.get_user_by_email(1, 'test@email.com')
+        mocks.put_users(1, 'test@email.com', profile={'region': 'GP'})
+
+        call_command('kagiso_flush_user_updates', once=True)
+
+        assert not OutboxUserUpdate.objects.exists()
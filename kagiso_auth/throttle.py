@@ -0,0 +1,120 @@
+import hashlib
+import hmac
+import logging
+import time
+
+from django.conf import settings as django_settings
+
+from . import metrics, settings
+from .cache import get_cache, hash_key_part, incr_or_set, make_key
+
+
+logger = logging.getLogger('django')
+
+
+class SignInThrottle:
+    """Stops repeated failed sign ins before they reach the Auth API.
+
+    Failed sign ins are counted per email and per client IP. Once either
+    count reaches its limit within PERIOD seconds, further password sign
+    ins for it fail locally until the count drains. Counts use a sliding
+    window made of two fixed windows, so they only ever need the cache's
+    atomic add and incr, and they drain steadily like a token bucket
+    rather than all at once.
+
+    Wrong email and password pairs are also remembered for NEGATIVE_TTL
+    seconds, keyed by an HMAC so passwords never reach the cache, and
+    fail locally when tried again.
+    """
+
+    ENABLED = settings.AUTH_SIGN_IN_THROTTLE_ENABLED
+    EMAIL_LIMIT = settings.AUTH_SIGN_IN_THROTTLE_EMAIL_LIMIT
+    IP_LIMIT = settings.AUTH_SIGN_IN_THROTTLE_IP_LIMIT
+    PERIOD = settings.AUTH_SIGN_IN_THROTTLE_PERIOD
+    NEGATIVE_TTL = settings.AUTH_SIGN_IN_NEGATIVE_TTL
+
+    @classmethod
+    def blocked_reason(cls, email, password, ip=None):
+        """Return why this sign in should fail locally, or None."""
+        if not cls.ENABLED:
+            return None
+
+        known_failure = cls.NEGATIVE_TTL and get_cache().get(
+            cls._failure_key(email, password))
+
+        if known_failure:
+            reason = 'known_failure'
+        elif cls._count('email', email) >= cls.EMAIL_LIMIT:
+            reason = 'email'
+        elif ip and cls._count('ip', ip) >= cls.IP_LIMIT:
+            reason = 'ip'
+        else:
+            return None
+
+        metrics.SINK.increment(
+            'auth_sign_in_short_circuited_total', {'reason': reason})
+        logger.info('Throttled sign in, reason={0}'.format(reason))
+        return reason
+
+    @classmethod
+    def record_failure(cls, email, password, ip=None):
+        if not cls.ENABLED:
+            return
+
+        cls._hit('email', email)
+        if ip:
+            cls._hit('ip', ip)
+
+        if cls.NEGATIVE_TTL:
+            get_cache().set(
+                cls._failure_key(email, password), True, cls.NEGATIVE_TTL)
+
+    @classmethod
+    def record_success(cls, email):
+        if not cls.ENABLED:
+            return
+
+        # The user got their password right, let them retry freely
+        window = cls._window()
+        get_cache().delete_many([
+            cls._key('email', email, window),
+            cls._key('email', email, window - 1),
+        ])
+
+    @classmethod
+    def _count(cls, kind, value):
+        now = time.time()
+        window = cls._window(now)
+        current_key = cls._key(kind, value, window)
+        previous_key = cls._key(kind, value, window - 1)
+        counts = get_cache().get_many([current_key, previous_key])
+
+        # The share of the previous window still inside the sliding window
+        overlap = 1 - (now % cls.PERIOD) / cls.PERIOD
+        return (
+            counts.get(current_key, 0) + counts.get(previous_key, 0) * overlap
+        )
+
+    @classmethod
+    def _hit(cls, kind, value):
+        key = cls._key(kind, value, cls._window())
+        # Kept for two periods, while it is the current or previous window
+        incr_or_set(key, cls.PERIOD * 2)
+
+    @classmethod
+    def _window(cls, now=None):
+        return int((now or time.time()) // cls.PERIOD)
+
+    @staticmethod
+    def _key(kind, value, window):
+        return make_key(
+            'sign_in_throttle', kind, hash_key_part(value.lower()), window)
+
+    @staticmethod
+    def _failure_key(email, password):
+        digest = hmac.new(
+            django_settings.SECRET_KEY.encode('utf-8'),
+            '{0}\n{1}'.format(email.lower(), password).encode('utf-8'),
+            hashlib.sha256
+        ).hexdigest()
+        return make_key('sign_in_failure', digest)
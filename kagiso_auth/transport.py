@@ -0,0 +1,96 @@
+from http.cookiejar import DefaultCookiePolicy
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import settings
+
+
+class RejectAllCookies(DefaultCookiePolicy):
+    """Never store or send cookies.
+
+    The session is shared by every user's calls, so a cookie set on one
+    of them (e.g. by a load balancer) must not be sent with the rest.
+    """
+
+    def set_ok(self, cookie, request):
+        return False
+
+    def return_ok(self, cookie, request):
+        return False
+
+
+class SessionTransport:
+    """Sends Auth API requests over a pooled, keep-alive requests.Session.
+
+    A single session is shared by all threads in a process. Its connection
+    pool is thread-safe, so threaded WSGI workers reuse open sockets instead
+    of doing a TCP+TLS handshake per call. The session is rebuilt the first
+    time it is used after a fork, so children never share sockets with
+    their parent.
+    """
+
+    def __init__(
+            self,
+            pool_connections=None,
+            pool_maxsize=None,
+            pool_block=None,
+            keep_alive=None):
+        # Number of per-host pools to keep around
+        self.pool_connections = (
+            pool_connections or settings.AUTH_API_POOL_CONNECTIONS)
+        # Maximum number of open connections to a single host
+        self.pool_maxsize = pool_maxsize or settings.AUTH_API_POOL_MAXSIZE
+        self.pool_block = (
+            settings.AUTH_API_POOL_BLOCK if pool_block is None else pool_block)
+        self.keep_alive = (
+            settings.AUTH_API_KEEP_ALIVE if keep_alive is None else keep_alive)
+
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = os.getpid()
+
+    @property
+    def session(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            # We have been forked: the inherited lock may be held by a
+            # thread that no longer exists and the sockets belong to
+            # our parent, so start from scratch.
+            self._lock = threading.Lock()
+            self._session = None
+            self._pid = pid
+
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._create_session()
+
+        return self._session
+
+    def request(self, method, url, **kwargs):
+        return self.session.request(method, url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def _create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block,
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.cookies.set_policy(RejectAllCookies())
+
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+
+        return session
@@ -18,6 +18,11 @@ urlpatterns = [
         views.resend_confirmation,
         name='resend_confirmation'
     ),
+    url(
+        r'^auth_api_webhook/',
+        views.auth_api_webhook,
+        name='auth_api_webhook'
+    ),
 ]
 
 if getattr(settings, 'UNIT_TEST_SETTINGS', False):
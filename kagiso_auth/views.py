@@ -1,3 +1,5 @@
+import json
+
 from authomatic import Authomatic
 from authomatic.adapters import DjangoAdapter
 from django.conf import settings
@@ -6,16 +8,25 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.core.mail import EmailMessage
 from django.db.utils import IntegrityError
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    HttpResponseRedirect,
+    JsonResponse,
+)
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from django.views.decorators.cache import never_cache
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
-from . import forms
+from . import forms, metrics, webhooks
 from .exceptions import EmailNotConfirmedError
 from .models import KagisoUser
+from .outbox import send_email
 from .utils import get_setting
 
 
@@ -84,7 +95,7 @@ def _send_confirmation_email(user, request):
         'first_name': user.first_name,
         'next': request.GET.get('next', '/')
     }
-    msg.send()
+    send_email(msg)
 
 
 @never_cache
@@ -119,18 +130,21 @@ def sign_in(request):
             email = form.cleaned_data['email']
             password = form.cleaned_data['password']
             remember_me = form.cleaned_data['remember_me']
+            app_name = get_setting(settings.APP_NAME, request)
             try:
                 user = authenticate(
                     email=email,
                     password=password,
+                    app_name=app_name,
+                    request=request,
                 )
 
                 if user:
-                    user.last_sign_in_via = get_setting(
-                        settings.APP_NAME,
-                        request
-                    )
-                    user.save()
+                    # The sessions call records last_sign_in_via, only
+                    # Auth APIs that ignore it need a separate update
+                    if user.last_sign_in_via != app_name:
+                        user.last_sign_in_via = app_name
+                        user.save()
                     login(request, user)
 
                     if not remember_me:
@@ -311,7 +325,7 @@ def forgot_password(request):
                     'token': user.generate_reset_password_token(),
                     'user_id': user.id
                 }
-                msg.send()
+                send_email(msg)
 
                 messages.success(request, reset_message)
                 return HttpResponseRedirect(reverse('forgot_password'))
@@ -383,3 +397,44 @@ def resend_confirmation(request):
     messages.success(request, confirm_message)
 
     return HttpResponseRedirect(reverse('sign_in'))
+
+
+@csrf_exempt
+@require_POST
+def auth_api_webhook(request):
+    signature = request.META.get('HTTP_X_AUTH_API_SIGNATURE')
+    timestamp = request.META.get('HTTP_X_AUTH_API_TIMESTAMP')
+    if not webhooks.verify_signature(request.body, signature, timestamp):
+        return HttpResponseForbidden()
+
+    # A 400 tells the Auth API not to retry a delivery that can never
+    # succeed
+    try:
+        events = json.loads(request.body.decode('utf-8'))['events']
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest()
+
+    try:
+        applied, skipped = webhooks.apply_events(events)
+    except webhooks.InvalidEvent:
+        return HttpResponseBadRequest()
+
+    if skipped:
+        # The rest of the batch is applied, and applying it again is
+        # harmless, so a 409 asks the Auth API to redeliver it until the
+        # skipped users' email conflicts are resolved
+        return JsonResponse(
+            {'applied': applied, 'skipped': skipped}, status=409)
+
+    return JsonResponse({'applied': applied})
+
+
+@never_cache
+def auth_api_metrics(request):
+    if not isinstance(metrics.SINK, metrics.PrometheusSink):
+        raise Http404
+
+    return HttpResponse(
+        metrics.SINK.render(),
+        content_type=metrics.PROMETHEUS_CONTENT_TYPE
+    )
@@ -0,0 +1,180 @@
+"""Applies change events pushed to us by the Auth API.
+
+The Auth API POSTs a JSON body like:
+
+    {"events": [
+        {"type": "user.changed", "data": {...user as returned by the API...}},
+        {"type": "user.deleted", "data": {"id": 1, "email": "a@b.com"}},
+        {"type": "session.revoked", "data": {"id": 1}}
+    ]}
+
+and signs `<timestamp>.<raw body>` with HMAC-SHA256, where timestamp is the
+Unix time it was sent at. The timestamp goes in the X-Auth-Api-Timestamp
+header and the hex digest in X-Auth-Api-Signature as `sha256=<digest>`.
+Requests more than AUTH_API_WEBHOOK_TOLERANCE seconds old are rejected, so
+a captured delivery can't be replayed later.
+"""
+import hashlib
+import hmac
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from . import settings
+from .cache import AuthenticatedUserCache, UserLookupCache
+from .models import KagisoUser, syncing_from_auth_api
+from .sync import build_users, upsert_users
+from .utils import parse_datetime
+
+
+USER_CHANGED = 'user.changed'
+USER_DELETED = 'user.deleted'
+SESSION_REVOKED = 'session.revoked'
+
+
+class InvalidEvent(ValueError):
+    pass
+
+
+def sign(body, secret, timestamp):
+    message = '{0}.'.format(timestamp).encode('utf-8') + body
+    digest = hmac.new(secret.encode('utf-8'), message, hashlib.sha256)
+    return 'sha256={0}'.format(digest.hexdigest())
+
+
+def verify_signature(body, signature, timestamp):
+    secret = settings.AUTH_API_WEBHOOK_SECRET
+    if not secret or not signature or not timestamp:
+        return False
+
+    try:
+        age = abs(time.time() - int(timestamp))
+    except ValueError:
+        return False
+
+    if age > settings.AUTH_API_WEBHOOK_TOLERANCE:
+        return False
+
+    return hmac.compare_digest(sign(body, secret, timestamp), signature)
+
+
+def validate_events(events):
+    """Raise InvalidEvent unless every event we know of can be applied."""
+    if not isinstance(events, list):
+        raise InvalidEvent('events must be a list')
+
+    for event in events:
+        if not isinstance(event, dict):
+            raise InvalidEvent('Each event must be an object')
+
+        event_type = event.get('type')
+        if event_type not in (USER_CHANGED, USER_DELETED, SESSION_REVOKED):
+            continue
+
+        data = event.get('data')
+        if not isinstance(data, dict) or not isinstance(data.get('id'), int):
+            raise InvalidEvent('{0} needs an integer data.id'.format(
+                event_type))
+
+        if event_type == USER_CHANGED:
+            if not isinstance(data.get('email'), str):
+                raise InvalidEvent('user.changed needs data.email')
+
+            for field in ('created', 'modified'):
+                try:
+                    parse_datetime(data[field])
+                except (KeyError, TypeError, ValueError, OverflowError):
+                    raise InvalidEvent(
+                        'user.changed needs a timestamp in data.{0}'.format(
+                            field))
+
+
+def apply_events(events):
+    """Apply a batch of events in one transaction.
+
+    Returns an (applied, skipped) tuple. applied counts the events applied.
+    skipped lists the ids of changed users that upsert_users left out
+    because their email belongs to another local user.
+
+    Raises InvalidEvent, without applying anything, if any event is
+    malformed. Changes older than the user's local `modified` are dropped,
+    so events delivered out of order never overwrite newer data.
+    """
+    validate_events(events)
+
+    changed = {}
+    deleted_ids = set()
+    revoked_ids = set()
+    applied = 0
+    skipped = []
+
+    for event in events:
+        event_type = event.get('type')
+        data = event.get('data')
+
+        if event_type == USER_CHANGED:
+            # Only the latest change per user matters
+            previous = changed.get(data['id'])
+            if previous and _modified(previous) > _modified(data):
+                continue
+            changed[data['id']] = data
+            deleted_ids.discard(data['id'])
+        elif event_type == USER_DELETED:
+            deleted_ids.add(data['id'])
+            changed.pop(data['id'], None)
+        elif event_type == SESSION_REVOKED:
+            revoked_ids.add(data['id'])
+        else:
+            # Ignore event types newer than this client
+            continue
+
+        applied += 1
+
+    with transaction.atomic():
+        # Locked, so a concurrent delivery can't apply an older change
+        # after we have checked against it
+        local_modified = dict(
+            KagisoUser.objects.select_for_update().filter(
+                id__in=changed
+            ).values_list('id', 'modified')
+        )
+        for id, modified in local_modified.items():
+            if modified > _modified(changed[id]):
+                del changed[id]
+                applied -= 1
+
+        # Emails as we knew them, so stale cache entries can be dropped
+        emails = list(
+            KagisoUser.objects.filter(
+                id__in=set(changed) | deleted_ids | revoked_ids
+            ).values_list('email', flat=True)
+        )
+
+        if changed:
+            skipped = [
+                user.id
+                for user in upsert_users(list(build_users(changed.values())))
+            ]
+            applied -= len(skipped)
+
+        if deleted_ids:
+            with syncing_from_auth_api():
+                KagisoUser.objects.filter(id__in=deleted_ids).delete()
+
+        if revoked_ids:
+            # Sessions carry a hash of the password column, so replacing the
+            # (unusable) password ends every session the user has open
+            KagisoUser.objects.filter(id__in=revoked_ids).update(
+                password=make_password(None)
+            )
+
+    UserLookupCache.invalidate(*emails)
+    # Revoked sessions must not be revived by a cached password hash
+    AuthenticatedUserCache.invalidate(*revoked_ids)
+
+    return applied, skipped
+
+
+def _modified(data):
+    return parse_datetime(data['modified'])
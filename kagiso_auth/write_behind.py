@@ -0,0 +1,113 @@
+"""Flushes queued KagisoUser changes to the Auth API.
+
+With AUTH_API_WRITE_BEHIND on, saves that only change
+AUTH_API_WRITE_BEHIND_FIELDS commit locally and queue an OutboxUserUpdate
+instead of PUTting to the Auth API while the user waits. Changes to the
+same user are merged into one row, so each flush sends a single PUT per
+user with the latest value of every changed field.
+
+If the user was modified on the Auth API after the queued change was
+made, fields changed on both sides keep the Auth API's value and only
+the rest are sent.
+"""
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import http, settings
+from .auth_api_client import AuthApiClient
+from .exceptions import AuthAPIError, AuthAPIUnexpectedStatusCode
+from .models import KagisoUser, OutboxUserUpdate
+from .utils import parse_datetime
+
+
+logger = logging.getLogger('django')
+
+
+def flush_pending(batch_size=100):
+    """Send one batch of due user updates.
+
+    Returns a (sent, conflicts, failed) tuple, where conflicts counts
+    updates that lost at least one field to a newer Auth API edit. Failed
+    updates are retried with exponential backoff until
+    AUTH_API_WRITE_BEHIND_MAX_ATTEMPTS is reached.
+
+    The batch is leased and committed before any Auth API call, so no
+    transaction or row lock is held while waiting on the network.
+    """
+    sent = conflicts = failed = 0
+
+    updates = OutboxUserUpdate.objects.lease(
+        batch_size, settings.AUTH_API_WRITE_BEHIND_LEASE)
+    users = KagisoUser.objects.in_bulk(
+        [update.user_id for update in updates])
+
+    for update in updates:
+        user = users.get(update.user_id)
+        if user is None:
+            # Deleted since, which deleted its update too
+            continue
+
+        try:
+            conflicted = _flush(update, user)
+        except (AuthAPIError, KeyError, TypeError, ValueError) as e:
+            # Including malformed Auth API responses, which only fail
+            # this update rather than the batch
+            update.schedule_retry(e)
+            failed += 1
+        else:
+            sent += 1
+            conflicts += conflicted
+
+    return sent, conflicts, failed
+
+
+def _flush(update, user):
+    changes = update.changes
+    conflicted = False
+
+    status, data = AuthApiClient.call(
+        'users/{email}'.format(email=user.email), 'GET')
+    if status == http.HTTP_200_OK:
+        if parse_datetime(data['modified']) > update.changed_at:
+            # Only send fields the Auth API hasn't changed since we queued
+            changes = {
+                field: value for field, value in changes.items()
+                if data.get(field) == update.original.get(field)
+            }
+            conflicted = changes != update.changes
+    elif status != http.HTTP_404_NOT_FOUND:
+        raise AuthAPIUnexpectedStatusCode(status, data)
+
+    if changes:
+        status, data = AuthApiClient.call(
+            'users/{id}'.format(id=user.id), 'PUT', changes)
+
+        if status == http.HTTP_404_NOT_FOUND:
+            logger.warning(
+                'Dropping update for user {0}, not on the Auth API'.format(
+                    user.id)
+            )
+            _finish(update)
+            return conflicted
+
+        if status != http.HTTP_200_OK:
+            raise AuthAPIUnexpectedStatusCode(status, data)
+
+    with transaction.atomic():
+        # Finish first, or syncing would merge the sent changes back in.
+        # A malformed response rolls back just this update.
+        _finish(update)
+        KagisoUser.sync_user_data_locally(data)
+    return conflicted
+
+
+def _finish(update):
+    # The user may have queued more changes while we were sending. They
+    # are kept, and made due straight away instead of when the lease ends.
+    sent = OutboxUserUpdate.objects.filter(
+        id=update.id, changed_at=update.changed_at)
+    if not sent.delete()[0]:
+        OutboxUserUpdate.objects.filter(id=update.id).update(
+            next_attempt=timezone.now())